@@ -1,7 +1,7 @@
 """This contains customizations for the models in the Django admin panel."""
 
 from django.contrib import admin
-from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, ActivityType, ProjectType, Client, History
+from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, ActivityType, ProjectType, Client, History, DNSRecord, DNSRecordChange, InfrastructureLink, RegistrarSync, Notification, SweepCheckpoint, APIToken
 
 
 # Define the admin classes and register models
@@ -9,6 +9,7 @@ from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, Acti
 class DomainAdmin(admin.ModelAdmin):
     list_display = ('domain_status', 'name', 'whois_status', 'health_status', 'health_dns', 'note')
     list_filter = ('domain_status',)
+    list_select_related = ('domain_status', 'whois_status', 'health_status')
     fieldsets = (
         (None, {
             'fields': ('name', 'domain_status', 'creation', 'expiration')
@@ -61,3 +62,63 @@ class ClientAdmin(admin.ModelAdmin):
 @admin.register(History)
 class HistoryAdmin(admin.ModelAdmin):
     list_display = ('client', 'domain', 'activity_type', 'end_date', 'operator')
+    list_select_related = ('client', 'domain__health_status', 'activity_type', 'operator')
+
+    def get_queryset(self, request):
+        # The change page's title shows all of these, so load them with the project
+        return super(HistoryAdmin, self).get_queryset(request).select_related(
+            'client', 'domain__health_status', 'project_type', 'activity_type', 'operator')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Each domain option shows the domain's health status, so load them together
+        if db_field.name == 'domain':
+            kwargs['queryset'] = Domain.objects.select_related('health_status')
+        return super(HistoryAdmin, self).formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(DNSRecord)
+class DNSRecordAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'record_type', 'value', 'ttl', 'observed_at')
+    list_filter = ('record_type',)
+    search_fields = ('value', 'domain__name')
+    list_select_related = ('domain',)
+
+
+@admin.register(DNSRecordChange)
+class DNSRecordChangeAdmin(admin.ModelAdmin):
+    list_display = ('changed_at', 'domain', 'action', 'record_type', 'value')
+    list_filter = ('action', 'record_type')
+    search_fields = ('value', 'domain__name')
+    list_select_related = ('domain',)
+
+
+@admin.register(InfrastructureLink)
+class InfrastructureLinkAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'value', 'domain', 'source', 'first_seen', 'last_resolved')
+    list_filter = ('kind', 'source')
+    search_fields = ('value', 'domain__name')
+    list_select_related = ('domain',)
+
+
+@admin.register(RegistrarSync)
+class RegistrarSyncAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'account', 'domain_count', 'cursor', 'last_started', 'last_completed')
+    readonly_fields = ('page_digests',)
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('channel', 'status', 'message', 'attempts', 'next_attempt', 'created_at', 'sent_at')
+    list_filter = ('status', 'channel')
+    search_fields = ('message',)
+
+
+@admin.register(SweepCheckpoint)
+class SweepCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('sweep', 'last_id', 'processed', 'started_at', 'updated_at')
+
+
+@admin.register(APIToken)
+class APITokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'created_at', 'last_used')
+    readonly_fields = ('key', 'last_used')
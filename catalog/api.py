@@ -0,0 +1,343 @@
+"""This contains the JSON API for the domain catalog and project history, for scripts that would
+otherwise scrape the HTML lists. Clients authenticate with an APIToken, select fields, filter, and
+page with the same cursors as the list views. List responses carry only an ETag, while a single
+domain also carries a Last-Modified header, so a client polling for changes gets a 304 Not Modified
+without the catalog being serialized when nothing has changed. The only write is checking out domains.
+"""
+
+import json
+import hashlib
+import datetime
+from functools import wraps
+
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_safe, require_POST
+
+from catalog.forms import BulkCheckoutForm
+from catalog.models import Domain, History, APIToken
+from modules.checkout import checkout_domains, find_available_domains, CheckoutError
+from modules.pagination import KeysetPaginator
+from modules.search import search_domains
+
+
+# Largest page a client can ask for with `limit`
+MAX_LIMIT = 100
+# Default page size
+DEFAULT_LIMIT = 25
+# How often a token's `last_used` is written, so every request does not cost a write
+LAST_USED_INTERVAL = datetime.timedelta(minutes=5)
+
+# Fields a client can select for each model and the attribute path each one is read from
+DOMAIN_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'registrar': 'registrar',
+    'creation': 'creation',
+    'expiration': 'expiration',
+    'domain_status': 'domain_status.domain_status',
+    'health_status': 'health_status.health_status',
+    'whois_status': 'whois_status.whois_status',
+    'health_dns': 'health_dns',
+    'burned_explanation': 'burned_explanation',
+    'all_cat': 'all_cat',
+    'talos_cat': 'talos_cat',
+    'opendns_cat': 'opendns_cat',
+    'bluecoat_cat': 'bluecoat_cat',
+    'ibm_xforce_cat': 'ibm_xforce_cat',
+    'trendmicro_cat': 'trendmicro_cat',
+    'fortiguard_cat': 'fortiguard_cat',
+    'websense_cat': 'websense_cat',
+    'mx_toolbox_status': 'mx_toolbox_status',
+    'note': 'note',
+    'last_used_by': 'last_used_by.username',
+    'updated_at': 'updated_at',
+}
+HISTORY_FIELDS = {
+    'id': 'id',
+    'domain_id': 'domain_id',
+    'domain': 'domain.name',
+    'client': 'client.name',
+    'project_type': 'project_type.project_type',
+    'activity_type': 'activity_type.activity',
+    'operator': 'operator.username',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'note': 'note',
+    'slack_channel': 'slack_channel',
+    'updated_at': 'updated_at',
+}
+
+
+class BadRequest(Exception):
+    """Raised for a request with an unknown field or an invalid parameter."""
+    pass
+
+
+def error_response(message, status):
+    """Return a JSON error."""
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_token_required(view):
+    """Decorator for API views that accepts an `Authorization: Token <key>` (or `Bearer <key>`)
+    header, or the session of a user logged in to Shepherd.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(header) == 2 and header[0].lower() in ('token', 'bearer'):
+            try:
+                token = APIToken.objects.select_related('user').get(key=header[1])
+            except APIToken.DoesNotExist:
+                token = None
+            if not token or not token.user.is_active:
+                response = error_response('Invalid token', 401)
+                response['WWW-Authenticate'] = 'Token'
+                return response
+            now = timezone.now()
+            if not token.last_used or now - token.last_used > LAST_USED_INTERVAL:
+                APIToken.objects.filter(pk=token.pk).update(last_used=now)
+            request.user = token.user
+            request.api_token = token
+        elif not request.user.is_authenticated:
+            response = error_response('Authentication required', 401)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as error:
+            return error_response(str(error), 400)
+    return wrapper
+
+
+def split_values(request, name):
+    """Return the comma-separated values of a query parameter as a list."""
+    return [value.strip() for value in request.GET.get(name, '').split(',') if value.strip()]
+
+
+def any_of(lookup, values):
+    """Return a filter matching any of the values, ignoring case."""
+    value_filter = Q()
+    for value in values:
+        value_filter |= Q(**{'{}__iexact'.format(lookup): value})
+    return value_filter
+
+
+def selected_fields(request, available):
+    """Return the fields selected with the `fields` parameter, or every field."""
+    fields = split_values(request, 'fields') or list(available)
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise BadRequest('Unknown fields: {}; choose from: {}'.format(', '.join(unknown), ', '.join(available)))
+    return fields
+
+
+def optimize(queryset, fields, available, keys=()):
+    """Load only the columns and related rows the selected fields need.
+
+    Parameters:
+    queryset        The queryset to optimize
+    fields          The selected fields
+    available       The field to attribute path map for the model
+    keys            Extra fields to load, e.g. the ones the pages are ordered by
+    """
+    columns = set(keys)
+    related = set()
+    for field in fields:
+        path = available[field].split('.')
+        if len(path) > 1:
+            related.add(path[0])
+        columns.add('__'.join(path))
+    return queryset.select_related(*related).only(*columns)
+
+
+def serialize(obj, fields, available):
+    """Return a dictionary of the selected fields of an object."""
+    data = {}
+    for field in fields:
+        value = obj
+        for attribute in available[field].split('.'):
+            value = getattr(value, attribute) if value is not None else None
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+
+def filter_domains(request):
+    """Return the Domain queryset for the filters in the request: `status`, `health`, and `whois`
+    (comma-separated names), `category` (a category word), and `search` (the search box syntax).
+    """
+    queryset = Domain.objects.all()
+    for parameter, lookup in (('status', 'domain_status__domain_status'), ('health', 'health_status__health_status'),
+                              ('whois', 'whois_status__whois_status')):
+        values = split_values(request, parameter)
+        if values:
+            queryset = queryset.filter(any_of(lookup, values))
+    if request.GET.get('category'):
+        queryset = search_domains(queryset, 'cat:"{}"'.format(request.GET['category'].replace('"', '')))
+    if request.GET.get('search'):
+        queryset = search_domains(queryset, request.GET['search'])
+    return queryset
+
+
+def filter_history(request):
+    """Return the History queryset for the filters in the request: `domain`, `client`, and `operator`
+    (comma-separated names) and `active` (only projects that have not ended).
+    """
+    queryset = History.objects.all()
+    for parameter, lookup in (('domain', 'domain__name'), ('client', 'client__name'), ('operator', 'operator__username')):
+        values = split_values(request, parameter)
+        if values:
+            queryset = queryset.filter(any_of(lookup, values))
+    if request.GET.get('active', '').lower() in ('1', 'true', 'yes'):
+        queryset = queryset.filter(end_date__gte=datetime.date.today())
+    return queryset
+
+
+def list_state(request, queryset):
+    """Return the time of the latest change and the number of objects in a filtered list, counted
+    once per request. Together they identify the list's current version; the count catches deletions.
+    """
+    if not hasattr(request, 'api_state'):
+        request.api_state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return request.api_state
+
+
+def list_etag(request, queryset):
+    """Return the ETag of a page of a list: the list's version plus the query that selects the page."""
+    state = list_state(request, queryset)
+    return hashlib.sha1('{}|{}|{}|{}'.format(queryset.model._meta.label, state['last_modified'], state['count'],
+                                             request.GET.urlencode()).encode('utf-8')).hexdigest()
+
+
+def list_response(request, queryset, available, keys):
+    """Return a page of a list as JSON.
+
+    Parameters:
+    request         The request, with optional `fields`, `limit`, `after`, and `before` parameters
+    queryset        The filtered queryset
+    available       The field to attribute path map for the model
+    keys            Field lookups the pages are ordered by
+    """
+    fields = selected_fields(request, available)
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest('The limit must be a number')
+    state = list_state(request, queryset)
+    paginator = KeysetPaginator(optimize(queryset, fields, available, keys), keys, limit,
+                                count=lambda: state['count'])
+    try:
+        page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except ValueError:
+        raise BadRequest('Invalid page cursor')
+    links = {}
+    for name, cursor in (('next', page.next_cursor), ('previous', page.previous_cursor)):
+        if cursor:
+            query = request.GET.copy()
+            query.pop('after', None)
+            query.pop('before', None)
+            query['after' if name == 'next' else 'before'] = cursor
+            links[name] = request.build_absolute_uri('{}?{}'.format(request.path, query.urlencode()))
+        else:
+            links[name] = None
+    return JsonResponse({
+        'count': page.count,
+        'next': links['next'],
+        'previous': links['previous'],
+        'results': [serialize(obj, fields, available) for obj in page],
+    })
+
+
+def domain_list_etag(request):
+    return list_etag(request, filter_domains(request))
+
+
+def history_list_etag(request):
+    return list_etag(request, filter_history(request))
+
+
+def domain_modified(request, pk):
+    return Domain.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+def domain_etag(request, pk):
+    last_modified = domain_modified(request, pk)
+    if last_modified is None:
+        return None
+    return hashlib.sha1('{}|{}|{}'.format(pk, last_modified, request.GET.urlencode()).encode('utf-8')).hexdigest()
+
+
+@require_safe
+@api_token_required
+# No Last-Modified for lists: the latest change among the listed rows misses a row that left the
+# filter, while the ETag also carries the count
+@condition(etag_func=domain_list_etag)
+def domain_list(request):
+    """API view listing the domains, ordered by name."""
+    return list_response(request, filter_domains(request), DOMAIN_FIELDS, ('name',))
+
+
+@require_safe
+@api_token_required
+@condition(etag_func=domain_etag, last_modified_func=domain_modified)
+def domain_detail(request, pk):
+    """API view returning one domain."""
+    fields = selected_fields(request, DOMAIN_FIELDS)
+    domain = optimize(Domain.objects.filter(pk=pk), fields, DOMAIN_FIELDS).first()
+    if not domain:
+        return error_response('Domain not found', 404)
+    return JsonResponse(serialize(domain, fields, DOMAIN_FIELDS))
+
+
+@require_safe
+@api_token_required
+@condition(etag_func=history_list_etag)
+def history_list(request):
+    """API view listing the project history, ordered by end date."""
+    return list_response(request, filter_history(request), HISTORY_FIELDS, ('end_date',))
+
+
+@csrf_exempt
+@require_POST
+@api_token_required
+def checkout(request):
+    """API view checking out domains for a project, either the domains named in `domains` or
+    `count` available domains matching `category`, `min_age`, and `health`. The project details
+    are the fields of the checkout form (client, project_type, activity, end_date, and optionally
+    start_date, note, and slack_channel). Either every domain is checked out or none are.
+    """
+    # A browser session would need CSRF protection, so writes take a token
+    if not getattr(request, 'api_token', None):
+        return error_response('Checking out domains requires an API token', 403)
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        raise BadRequest('The request body must be a JSON object')
+    if not isinstance(data, dict):
+        raise BadRequest('The request body must be a JSON object')
+    names = data.get('domains') or []
+    if not isinstance(names, list):
+        raise BadRequest('domains must be a list of domain names')
+    data.setdefault('start_date', datetime.date.today().isoformat())
+    if names:
+        data['count'] = len(names)
+    form = BulkCheckoutForm(data)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid checkout', 'fields': {
+            field: [str(message) for message in errors] for field, errors in form.errors.items()}}, status=400)
+    if names:
+        candidates = Domain.objects.filter(name__in=names)
+    else:
+        health = form.cleaned_data['health']
+        candidates = find_available_domains(category=form.cleaned_data['category'], min_age=form.cleaned_data['min_age'],
+                                            health=health.health_status if health else None)
+    try:
+        domains = checkout_domains(request.user, candidates, form.cleaned_data['count'], **form.project_details())
+    except CheckoutError as error:
+        return error_response(str(error), 409)
+    return JsonResponse({'domains': [serialize(domain, ('id', 'name'), DOMAIN_FIELDS) for domain in domains]}, status=201)
@@ -1,7 +1,13 @@
 """This defines the available applications."""
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        # Connect the signal receivers that keep the dashboard counts, search index, and group checks fresh
+        import catalog.signals
+        post_migrate.connect(catalog.signals.restore_search_index, sender=self)
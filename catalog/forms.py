@@ -39,6 +39,20 @@ class CheckoutForm(forms.Form):
         # Return the cleaned data.
         return data
 
+    def project_details(self):
+        """Return the project details from the valid form as keyword arguments for
+        checkout_domains() in modules/checkout.py.
+        """
+        return {
+                'client_name': self.cleaned_data['client'],
+                'project_type': self.cleaned_data['project_type'],
+                'activity_type': self.cleaned_data['activity'],
+                'start_date': self.cleaned_data['start_date'],
+                'end_date': self.cleaned_data['end_date'],
+                'note': self.cleaned_data['note'],
+                'slack_channel': self.cleaned_data['slack_channel'],
+               }
+
 
 class DomainCreateForm(forms.ModelForm):
     """Form used with the DomainCreate CreateView in models.py to allow excluding fields."""
@@ -50,3 +64,12 @@ class DomainCreateForm(forms.ModelForm):
                     'creation': DateInput(),
                     'expiration': DateInput()
                   }
+
+
+class BulkCheckoutForm(CheckoutForm):
+    """Form used for checking out several available domains matching some criteria at once."""
+    count = forms.IntegerField(min_value=1, max_value=50, initial=10, help_text='Enter how many domains to check out.')
+    category = forms.CharField(required=False, help_text='Only check out domains with this category (e.g. technology).')
+    min_age = forms.IntegerField(min_value=0, required=False, help_text='Only check out domains at least this many days old.')
+    health = forms.ModelChoiceField(queryset=HealthStatus.objects.all(), to_field_name='health_status', required=False,
+                                    help_text='Only check out domains with this health status.')
@@ -0,0 +1,68 @@
+"""This contains the `benchmark_dns` management command for measuring DNS update throughput and
+failover against stand-in DNS servers, without touching the network or the database.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.dns import DNSCollector
+from modules.dns_standin import SyntheticZones, StandInDNSServer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark DNSCollector against local stand-in DNS servers serving synthetic zones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', type=int, default=2000, help='Number of synthetic domains to collect')
+        parser.add_argument('--servers', type=int, default=2, help='Number of stand-in servers in the resolver pool')
+        parser.add_argument('--delay', type=float, default=0, help='Seconds each server waits before answering')
+        parser.add_argument('--flaky-drop-rate', type=float, default=0,
+                            help='Fraction of queries the first server leaves unanswered')
+        parser.add_argument('--flaky-servfail-rate', type=float, default=0,
+                            help='Fraction of queries the first server answers with SERVFAIL')
+        parser.add_argument('--concurrency', type=int, help='Queries in flight (default: DNS_CONFIG)')
+        parser.add_argument('--attempts', type=int, help='Resolvers tried per query (default: DNS_CONFIG)')
+        parser.add_argument('--cache', action='store_true', help='Leave the DNS answer cache enabled')
+
+    def handle(self, *args, **options):
+        zones = SyntheticZones.generate(options['domains'])
+        servers = []
+        for index in range(options['servers']):
+            flaky = index == 0
+            server = StandInDNSServer(('127.0.0.1', 0), zones, delay=options['delay'], seed=index,
+                                      drop_rate=options['flaky_drop_rate'] if flaky else 0,
+                                      servfail_rate=options['flaky_servfail_rate'] if flaky else 0)
+            server.start()
+            servers.append(server)
+        config = dict(getattr(settings, 'DNS_CONFIG', {}))
+        config['resolvers'] = [server.resolver_address for server in servers]
+        config['cache'] = options['cache']
+        if options['concurrency']:
+            config['concurrency'] = options['concurrency']
+        if options['attempts']:
+            config['resolver_attempts'] = options['attempts']
+        collector = DNSCollector(config=config)
+        failures = {}
+        failed_domains = 0
+        start = time.perf_counter()
+        try:
+            for _, _, failed_labels in collector.collect_many(zones.domains):
+                failed_domains += 1 if failed_labels else 0
+                for label in failed_labels:
+                    failures[label] = failures.get(label, 0) + 1
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+        elapsed = time.perf_counter() - start
+        queries = len(zones.domains) * len(collector.record_queries)
+        self.stdout.write('Collected {} domains ({} queries) in {:.2f} seconds: {:.1f} domains/s, {:.1f} queries/s'.format(
+            len(zones.domains), queries, elapsed, len(zones.domains) / elapsed, queries / elapsed))
+        self.stdout.write('Domains with failed lookups: {} ({})'.format(
+            failed_domains, ', '.join('{} {}'.format(label, count) for label, count in sorted(failures.items())) or 'none'))
+        self.stdout.write('Resolver pool:')
+        for resolver in collector.resolver_pool.status():
+            self.stdout.write('  {resolver:<22} queries {queries:>7}  failures {failures:>6}  '
+                              'failure rate {failure_rate:>5}  latency {latency_ms} ms  benched {benched}'.format(**resolver))
@@ -0,0 +1,72 @@
+"""This contains the `benchmark_startup` management command for timing the import path a Django Q
+worker takes before it can run any of the tasks in tasks.py.
+"""
+
+import os
+import sys
+import statistics
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Code run in a fresh interpreter for each sample so nothing is already cached in `sys.modules`
+WORKER_IMPORT_SCRIPT = '''
+import os, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shepherd.settings')
+import django
+django.setup()
+setup_done = time.perf_counter()
+import {module}
+print(setup_done - start, time.perf_counter() - setup_done)
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure how long a fresh qcluster worker takes to set up Django and import the task module.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Number of fresh interpreters to time')
+        parser.add_argument('--module', default='tasks', help='Module the worker imports (default: tasks)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Show the slowest imports reported by `python -X importtime`')
+
+    def run_sample(self, module, importtime=False):
+        """Run one fresh interpreter and return its stdout and stderr."""
+        command = [sys.executable]
+        if importtime:
+            command += ['-X', 'importtime']
+        command += ['-c', WORKER_IMPORT_SCRIPT.format(module=module)]
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        return result.stdout, result.stderr
+
+    def handle(self, *args, **options):
+        setup_times = []
+        import_times = []
+        for _ in range(options['runs']):
+            stdout, _ = self.run_sample(options['module'])
+            setup_time, import_time = (float(value) for value in stdout.split())
+            setup_times.append(setup_time * 1000)
+            import_times.append(import_time * 1000)
+        self.stdout.write('Worker startup over {} runs (milliseconds):'.format(options['runs']))
+        for label, samples in (('django.setup()', setup_times), ('import ' + options['module'], import_times)):
+            self.stdout.write('  {:<20} min {:>8.1f}  median {:>8.1f}  max {:>8.1f}'.format(
+                label, min(samples), statistics.median(samples), max(samples)))
+        # Break the import down by module so regressions can be traced to a specific library
+        if options['top']:
+            _, stderr = self.run_sample(options['module'], importtime=True)
+            cumulative = []
+            for line in stderr.splitlines():
+                # Lines look like: `import time:       self [us] |  cumulative | imported package`
+                parts = line.split('|')
+                if len(parts) == 3 and parts[1].strip().isdigit():
+                    cumulative.append((int(parts[1]), parts[2].strip()))
+            cumulative.sort(reverse=True)
+            self.stdout.write('Slowest imports (cumulative milliseconds):')
+            for microseconds, name in cumulative[:options['top']]:
+                self.stdout.write('  {:>8.1f}  {}'.format(microseconds / 1000, name))
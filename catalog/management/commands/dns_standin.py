@@ -0,0 +1,39 @@
+"""This contains the `dns_standin` management command for running the stand-in authoritative DNS
+server, so DNS updates can be pointed at synthetic zones instead of the internet.
+"""
+
+from django.core.management.base import BaseCommand
+
+from modules.dns_standin import SyntheticZones, StandInDNSServer
+
+
+class Command(BaseCommand):
+    help = 'Serve synthetic DNS zones over UDP for offline DNS update benchmarks and failover tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=5353, help='UDP port to listen on')
+        parser.add_argument('--domains', type=int, default=1000, help='Number of synthetic domains to serve')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic records')
+        parser.add_argument('--zone-file', action='append', default=[],
+                            help='Also serve this zone file (must have an $ORIGIN line); may be repeated')
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before each answer')
+        parser.add_argument('--drop-rate', type=float, default=0, help='Fraction of queries to leave unanswered')
+        parser.add_argument('--servfail-rate', type=float, default=0, help='Fraction of queries to answer with SERVFAIL')
+
+    def handle(self, *args, **options):
+        zones = SyntheticZones.generate(options['domains'], seed=options['seed'])
+        for path in options['zone_file']:
+            zones.load_zone_file(path)
+        server = StandInDNSServer((options['address'], options['port']), zones, delay=options['delay'],
+                                  drop_rate=options['drop_rate'], servfail_rate=options['servfail_rate'])
+        self.stdout.write('Serving {} domains on {} (e.g. {}). Add "{}" to `resolvers` in DNS_CONFIG '
+                          'to use it. Press Ctrl+C to stop.'.format(
+                              len(zones.domains), server.resolver_address, zones.domains[0] if zones.domains else '-',
+                              server.resolver_address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
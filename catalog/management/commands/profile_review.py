@@ -0,0 +1,51 @@
+"""This contains the `profile_review` management command for running a domain health sweep with
+every provider call and database flush timed, and writing a per-provider report.
+
+The sweep is the real `tasks.check_domains`, so unless `--dry-run` is passed the results are saved
+to the catalog (burned domains are flagged as burned) and Slack burn alerts are sent.
+"""
+
+from django.core.management.base import BaseCommand
+
+from catalog.models import Domain
+from modules.profiler import ReviewProfiler
+
+import tasks
+
+
+class Command(BaseCommand):
+    help = ('Run tasks.check_domains with profiling enabled and write a per-provider timing report. '
+            'This saves the health results and sends burn alerts unless --dry-run is passed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('domains', nargs='*', help='Only check these domain names (default: all domains)')
+        parser.add_argument('--limit', type=int, help='Only check the first N domains')
+        parser.add_argument('--output', default='review_profile.txt',
+                            help='Report path; a path ending in .json gets a JSON report')
+        parser.add_argument('--cprofile', action='store_true', help='Capture cProfile output for each provider')
+        parser.add_argument('--tracemalloc', action='store_true', help='Track peak memory for each provider')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Check the domains without saving the results or sending burn alerts '
+                                 '(the report then has no db_flush section)')
+
+    def handle(self, *args, **options):
+        domain_queryset = Domain.objects.all()
+        if options['domains']:
+            domain_queryset = domain_queryset.filter(name__in=options['domains'])
+        if options['limit']:
+            # The sweep orders and filters the queryset, which a sliced queryset does not allow
+            domain_ids = domain_queryset.order_by('pk').values_list('pk', flat=True)[:options['limit']]
+            domain_queryset = Domain.objects.filter(pk__in=list(domain_ids))
+        profiler = ReviewProfiler(use_cprofile=options['cprofile'], use_tracemalloc=options['tracemalloc'])
+        if not options['dry_run']:
+            self.stdout.write(self.style.WARNING('Health results will be saved and burn alerts sent; '
+                                                 'pass --dry-run to leave the catalog untouched'))
+        # Publish progress under its own name so a profiling run does not overwrite a running sweep's
+        tasks.check_domains(domain_queryset=domain_queryset, profiler=profiler, sweep='health_profile',
+                            dry_run=options['dry_run'])
+        profiler.write_report(options['output'])
+        for summary in profiler.report():
+            self.stdout.write('{:<14} {:>5} calls  {:>9.2f}s total  {:>7.2f}s mean  {:>7.2f}s p95'.format(
+                summary['section'], summary['calls'], summary['total_seconds'],
+                summary['mean_seconds'], summary['p95_seconds']))
+        self.stdout.write(self.style.SUCCESS('Profile report written to {}'.format(options['output'])))
@@ -0,0 +1,35 @@
+"""This contains the `qcluster_lane` management command for running a Django Q cluster that serves
+one of the task lanes in `TASK_QUEUES` (e.g. the dns or bulk lane) with the lane's own workers.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django_q.conf import Conf
+from django_q.cluster import Cluster
+
+from modules.task_queues import get_queues, get_lane_broker, list_key
+
+
+class Command(BaseCommand):
+    help = 'Start a Django Q cluster for one task lane from TASK_QUEUES.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('lane', help='Name of the lane to serve (e.g. dns or bulk)')
+        parser.add_argument('--run-once', action='store_true', default=False,
+                            help='Run once and then stop.')
+
+    def handle(self, *args, **options):
+        queues = get_queues()
+        lane = options['lane']
+        if lane not in queues:
+            raise CommandError('Unknown lane "{}", choose from: {}'.format(lane, ', '.join(sorted(queues))))
+        # The settings are read by the cluster's processes after they fork from this one
+        Conf.WORKERS = queues[lane].get('workers', 1)
+        # Keep the backlog in the broker, where enqueue_task() can see it, instead of in memory
+        Conf.QUEUE_LIMIT = Conf.WORKERS
+        # Only the regular qcluster runs schedules, so each schedule is queued once
+        Conf.SCHEDULER = False
+        self.stdout.write('Serving the {} lane ({}) with {} workers.'.format(lane, list_key(lane), Conf.WORKERS))
+        cluster = Cluster(get_lane_broker(lane))
+        cluster.start()
+        if options['run_once']:
+            cluster.stop()
@@ -0,0 +1,30 @@
+"""This contains the `rdap_standin` management command for running the stand-in RDAP server, so the
+registration refresh can be tested without querying the real registries.
+"""
+
+from django.core.management.base import BaseCommand
+
+from modules.rdap_standin import StandInRDAPServer
+
+
+class Command(BaseCommand):
+    help = 'Serve synthetic RDAP domain data over HTTP for testing tasks.update_registrations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8053, help='TCP port to listen on')
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help='Requests allowed per second before answering 429 (default: no limit)')
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before each answer')
+
+    def handle(self, *args, **options):
+        server = StandInRDAPServer((options['address'], options['port']),
+                                   rate_limit=options['rate_limit'], delay=options['delay'])
+        self.stdout.write("Serving RDAP on {0}. Set 'servers': {{'*': '{0}'}} in RDAP_CONFIG to use it. "
+                          "Press Ctrl+C to stop.".format(server.base_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
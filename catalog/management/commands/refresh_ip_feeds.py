@@ -0,0 +1,38 @@
+"""This contains the `refresh_ip_feeds` management command for downloading the IP reputation feeds
+ahead of a health sweep and checking addresses against them.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from modules.ip_reputation import IPReputation
+
+
+class Command(BaseCommand):
+    help = 'Refresh the IP reputation feeds in IP_REPUTATION_CONFIG and optionally look up addresses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('addresses', nargs='*', help='IP addresses to look up after the refresh')
+
+    def handle(self, *args, **options):
+        reputation = IPReputation.from_settings(getattr(settings, 'IP_REPUTATION_CONFIG', {}), settings.BASE_DIR)
+        if not reputation.enabled:
+            self.stdout.write('No feeds are configured in IP_REPUTATION_CONFIG, so Cymon will be used.')
+            return
+        reputation.refresh(force=True)
+        if not reputation.ready:
+            self.stderr.write(self.style.ERROR('None of the feeds could be loaded, so health sweeps will '
+                                               'report passive DNS addresses as unchecked.'))
+            return
+        stats = reputation.stats()
+        for name, count in sorted(stats['feeds'].items()):
+            self.stdout.write('  {:<24} {:>8} entries'.format(name, count))
+        self.stdout.write('Index: {} IPv4 and {} IPv6 intervals'.format(stats['ipv4_intervals'], stats['ipv6_intervals']))
+        for address in options['addresses']:
+            start = time.perf_counter()
+            feeds = reputation.lookup(address)
+            elapsed = (time.perf_counter() - start) * 1000000
+            self.stdout.write('{:<40} {} ({:.1f} microseconds)'.format(
+                address, ', '.join(feeds) if feeds else 'not listed', elapsed))
@@ -0,0 +1,33 @@
+"""This contains the `registrar_standin` management command for running the stand-in Namecheap API, so
+the registrar inventory sync can be tested without a registrar account.
+"""
+
+from django.core.management.base import BaseCommand
+
+from modules.registrar_standin import SyntheticAccount, StandInRegistrarServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a synthetic Namecheap account over HTTP for testing tasks.sync_registrars.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8054, help='TCP port to listen on')
+        parser.add_argument('--domains', type=int, default=1000, help='Number of domains in the account')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic registration data')
+        parser.add_argument('--api-key', default='', help='API key requests must present (default: any)')
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help='API calls allowed per minute, like Namecheap\'s 20 (default: no limit)')
+
+    def handle(self, *args, **options):
+        account = SyntheticAccount(options['domains'], seed=options['seed'])
+        server = StandInRegistrarServer((options['address'], options['port']), account,
+                                        api_key=options['api_key'], rate_limit=options['rate_limit'])
+        self.stdout.write("Serving {} domains on {}. Set 'api_url' for namecheap in REGISTRAR_CONFIG to "
+                          "use it. Press Ctrl+C to stop.".format(options['domains'], server.api_url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
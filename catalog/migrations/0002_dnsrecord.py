@@ -0,0 +1,87 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+import hashlib
+import re
+
+
+def split_record_values(record_type, values):
+    """Split the comma-joined values stored for one record type. TXT and DMARC values are quoted
+    strings that may contain commas themselves, so those are split on the quotes instead.
+    """
+    if record_type in ('TXT', 'DMARC'):
+        return re.findall(r'"(?:[^"\\]|\\.)*"(?: "(?:[^"\\]|\\.)*")*', values) or [values]
+    return [value.strip() for value in values.split(', ') if value.strip()]
+
+
+def convert_dns_record_strings(apps, schema_editor):
+    """Convert each domain's ` ::: ` separated `dns_record` string into DNSRecord rows."""
+    Domain = apps.get_model('catalog', 'Domain')
+    DNSRecord = apps.get_model('catalog', 'DNSRecord')
+    new_records = []
+    for domain in Domain.objects.exclude(dns_record__isnull=True).exclude(dns_record='').only('id', 'dns_record').iterator():
+        seen = set()
+        for entry in domain.dns_record.split(' ::: '):
+            record_type, _, values = entry.partition(': ')
+            record_type = record_type.strip().upper()
+            # Skip the missing-DMARC warning and failed lookups, which were stored as text
+            if record_type not in ('NS', 'A', 'MX', 'DMARC', 'TXT', 'SOA') or values in ('', 'None'):
+                continue
+            if values.startswith('MX configured without a DMARC record'):
+                continue
+            for value in split_record_values(record_type, values):
+                if (record_type, value) not in seen:
+                    seen.add((record_type, value))
+                    new_records.append(DNSRecord(domain_id=domain.id, record_type=record_type, value=value,
+                                                 value_hash=hashlib.sha256(value.encode('utf-8')).hexdigest()))
+        if len(new_records) >= 1000:
+            DNSRecord.objects.bulk_create(new_records)
+            new_records = []
+    DNSRecord.objects.bulk_create(new_records)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DNSRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_type', models.CharField(help_text='DNS record type (e.g. A, MX, DMARC)', max_length=10, verbose_name='Record Type')),
+                ('value', models.TextField(help_text='Record value as returned by DNS', verbose_name='Value')),
+                ('value_hash', models.CharField(editable=False, help_text='SHA-256 hash of the value', max_length=64, verbose_name='Value Hash')),
+                ('ttl', models.IntegerField(blank=True, help_text='Time to live, in seconds, when the record was observed', null=True, verbose_name='TTL')),
+                ('observed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the record was last collected', verbose_name='Observed')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.domain')),
+            ],
+            options={
+                'verbose_name': 'DNS record',
+                'verbose_name_plural': 'DNS records',
+                'ordering': ['domain', 'record_type', 'value'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dnsrecord',
+            index=models.Index(fields=['record_type', 'value_hash'], name='catalog_dns_type_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dnsrecord',
+            index=models.Index(fields=['value_hash'], name='catalog_dns_hash_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dnsrecord',
+            unique_together={('domain', 'record_type', 'value_hash')},
+        ),
+        migrations.RunPython(convert_dns_record_strings, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='domain',
+            name='dns_record',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_dnsrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dnsrecord',
+            name='observed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the record was first collected', verbose_name='Observed'),
+        ),
+        migrations.CreateModel(
+            name='DNSRecordChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('added', 'Added'), ('removed', 'Removed')], help_text='Whether the record was added or removed', max_length=7, verbose_name='Action')),
+                ('record_type', models.CharField(help_text='DNS record type (e.g. A, MX, DMARC)', max_length=10, verbose_name='Record Type')),
+                ('value', models.TextField(help_text='Record value as returned by DNS', verbose_name='Value')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the DNS update found the change', verbose_name='Changed')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.domain')),
+            ],
+            options={
+                'verbose_name': 'DNS record change',
+                'verbose_name_plural': 'DNS record changes',
+                'ordering': ['-changed_at', 'record_type', 'value'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dnsrecordchange',
+            index=models.Index(fields=['domain', '-changed_at'], name='catalog_dns_change_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def index_stored_dns_records(apps, schema_editor):
+    """Build the infrastructure links for the A, NS, and MX records already stored."""
+    DNSRecord = apps.get_model('catalog', 'DNSRecord')
+    InfrastructureLink = apps.get_model('catalog', 'InfrastructureLink')
+    kinds = {'A': 'ip', 'NS': 'ns', 'MX': 'mx'}
+    links = set()
+    for domain_id, record_type, value in DNSRecord.objects.filter(
+            record_type__in=kinds).values_list('domain_id', 'record_type', 'value').iterator():
+        kind = kinds[record_type]
+        value = value.strip()
+        if kind == 'mx' and ' ' in value:
+            value = value.split()[-1]
+        value = value.rstrip('.').lower()
+        if value:
+            links.add((domain_id, kind, value))
+    InfrastructureLink.objects.bulk_create(
+        [InfrastructureLink(domain_id=domain_id, kind=kind, value=value, source='dns')
+         for domain_id, kind, value in links], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_dnsrecordchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InfrastructureLink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ip', 'IP Address'), ('ns', 'Name Server'), ('mx', 'Mail Host')], help_text='Type of infrastructure', max_length=2, verbose_name='Kind')),
+                ('value', models.CharField(help_text='IP address or lowercase host name', max_length=255, verbose_name='Value')),
+                ('source', models.CharField(choices=[('dns', 'DNS'), ('passive_dns', 'Passive DNS')], help_text='Where the link was found', max_length=11, verbose_name='Source')),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now, help_text='When Shepherd first found the link', verbose_name='First Seen')),
+                ('last_resolved', models.DateField(blank=True, help_text='Last resolution date reported by passive DNS', null=True, verbose_name='Last Resolved')),
+                ('domain', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.domain')),
+            ],
+            options={
+                'verbose_name': 'Infrastructure link',
+                'verbose_name_plural': 'Infrastructure links',
+                'ordering': ['kind', 'value', 'domain'],
+                'unique_together': {('kind', 'value', 'domain', 'source')},
+            },
+        ),
+        migrations.RunPython(index_stored_dns_records, migrations.RunPython.noop),
+    ]
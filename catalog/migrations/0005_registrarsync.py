@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_infrastructurelink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrarSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(help_text='Registrar provider name (e.g. namecheap)', max_length=50, verbose_name='Provider')),
+                ('account', models.CharField(help_text='Registrar account user name', max_length=100, verbose_name='Account')),
+                ('cursor', models.CharField(blank=True, help_text='Page where an interrupted sync resumes', max_length=100, null=True, verbose_name='Cursor')),
+                ('page_digests', models.TextField(default='{}', help_text='JSON object of page to a digest of its domains', verbose_name='Page Digests')),
+                ('last_started', models.DateTimeField(blank=True, help_text='When the last sync started', null=True, verbose_name='Last Started')),
+                ('last_completed', models.DateTimeField(blank=True, help_text='When the last sync finished every page', null=True, verbose_name='Last Completed')),
+                ('domain_count', models.IntegerField(default=0, help_text='Domains in the account at the last completed sync', verbose_name='Domains')),
+            ],
+            options={
+                'verbose_name': 'Registrar sync',
+                'verbose_name_plural': 'Registrar syncs',
+                'ordering': ['provider', 'account'],
+                'unique_together': {('provider', 'account')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_registrarsync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(help_text='Slack channel the message is posted to', max_length=100, verbose_name='Channel')),
+                ('message', models.TextField(help_text='Text of the message', verbose_name='Message')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', help_text='Delivery status', max_length=7, verbose_name='Status')),
+                ('attempts', models.IntegerField(default=0, help_text='Failed attempts to post the message', verbose_name='Attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the message is posted', verbose_name='Next Attempt')),
+                ('claim', models.CharField(blank=True, help_text='Delivery run currently posting the message', max_length=32, null=True, verbose_name='Claim')),
+                ('last_error', models.TextField(blank=True, help_text='Error from the last failed attempt', null=True, verbose_name='Last Error')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the message was queued', verbose_name='Created')),
+                ('sent_at', models.DateTimeField(blank=True, help_text='When the message was posted', null=True, verbose_name='Sent')),
+            ],
+            options={
+                'verbose_name': 'Notification',
+                'verbose_name_plural': 'Notifications',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['status', 'next_attempt'], name='catalog_notification_due_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sweep', models.CharField(help_text='Name of the sweep (e.g. health or dns)', max_length=50, unique=True, verbose_name='Sweep')),
+                ('last_id', models.IntegerField(default=0, help_text='ID of the last domain the sweep finished', verbose_name='Last Domain ID')),
+                ('processed', models.IntegerField(default=0, help_text='Domains finished so far', verbose_name='Processed')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the sweep started', verbose_name='Started')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the last chunk was committed', verbose_name='Updated')),
+            ],
+            options={
+                'verbose_name': 'Sweep checkpoint',
+                'verbose_name_plural': 'Sweep checkpoints',
+                'ordering': ['sweep'],
+            },
+        ),
+    ]
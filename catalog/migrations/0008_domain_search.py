@@ -0,0 +1,24 @@
+# Full-text search index for the domains, see modules/search.py
+
+from django.db import migrations
+
+from modules.search import install_index, drop_index
+
+
+def create_search_index(apps, schema_editor):
+    install_index(schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_sweepcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
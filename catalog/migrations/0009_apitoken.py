@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 22:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0008_domain_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domain',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='When the domain was last changed', verbose_name='Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='When the project was last changed', verbose_name='Last Updated'),
+        ),
+        migrations.CreateModel(
+            name='APIToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, help_text='The secret sent by the client', max_length=40, unique=True, verbose_name='Key')),
+                ('name', models.CharField(help_text='What uses this token (e.g. the purchasing script)', max_length=100, verbose_name='Name')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the token was created', verbose_name='Created')),
+                ('last_used', models.DateTimeField(blank=True, help_text='When the token was last used, to within a few minutes', null=True, verbose_name='Last Used')),
+                ('user', models.ForeignKey(help_text='User the client acts as', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'API token',
+                'verbose_name_plural': 'API tokens',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -2,8 +2,11 @@
 
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+import hashlib
+import secrets
 import datetime
 from datetime import date
 
@@ -110,7 +113,6 @@ class Domain(models.Model):
     """
     name = models.CharField('Name', max_length=100, unique=True, help_text='Enter a domain name')
     registrar = models.CharField('Registrar', max_length=100, unique=False, help_text='Enter the name of the registrar where this domain is registered', null=True)
-    dns_record = models.CharField('DNS Record', max_length=500, help_text='Enter domain DNS records', null=True)
     health_dns = models.CharField('DNS Health', max_length=100, help_text='Domain health status based on passive DNS (e.g. Healthy, Burned)', null=True)
     creation = models.DateField('Purchase Date', help_text='Domain purchase date')
     expiration = models.DateField('Expiration Date', help_text='Domain expiration date')
@@ -125,6 +127,8 @@ class Domain(models.Model):
     mx_toolbox_status =  models.CharField('MX Toolbox Status', max_length=100, help_text='Domain spam status as determined by MX Toolbox', null=True)
     note = models.TextField('Notes', help_text='Domain-related notes, such as thoughts behind its purchase or how/why it was burned or retired', null=True)
     burned_explanation = models.TextField('Health Explanation', help_text='Reasons why the domain\'s health status is not "Healthy"', null=True)
+    # Bulk writes in tasks.py do not fill this in automatically, so they set it themselves
+    updated_at = models.DateTimeField('Last Updated', auto_now=True, db_index=True, help_text='When the domain was last changed')
     # Foreign Keys
     whois_status = models.ForeignKey('WhoisStatus', on_delete=models.PROTECT, null=True)
     health_status = models.ForeignKey('HealthStatus', on_delete=models.PROTECT, null=True)
@@ -150,17 +154,246 @@ class Domain(models.Model):
 
     @property
     def get_list(self):
-        """Property to enable fetching the list from the dns_record entry."""
-        if self.dns_record:
-            return self.dns_record.split(' ::: ')
-        else:
-            None
+        """Property to build the list of DNS records shown on the detail page, one entry per
+        record type (e.g. `A: 1.2.3.4, 5.6.7.8`).
+        """
+        records = {}
+        for record in self.dnsrecord_set.all():
+            records.setdefault(record.record_type, []).append(record.value)
+        if not records:
+            return None
+        dns_list = []
+        for record_type in DNSRecord.RECORD_TYPES:
+            if record_type in records:
+                dns_list.append('{}: {}'.format(record_type, ', '.join(records[record_type])))
+            elif record_type == 'DMARC' and 'MX' in records:
+                dns_list.append('DMARC: MX configured without a DMARC record!')
+        return dns_list
+
+    @property
+    def get_dns_timeline(self):
+        """Property to return the most recent DNS record changes for the detail page, newest
+        first.
+        """
+        return self.dnsrecordchange_set.all()[:100]
+
+    @property
+    def get_shared_infrastructure(self):
+        """Property to return the links of other domains that share an IP address, name server,
+        or mail host with this domain, ordered by infrastructure for the detail page.
+        """
+        # Look up this domain's few links by domain first, then match them on the (kind, value)
+        # index; a correlated subquery would scan every link
+        own_values = {}
+        for kind, value in self.infrastructurelink_set.order_by().values_list('kind', 'value'):
+            own_values.setdefault(kind, set()).add(value)
+        if not own_values:
+            return InfrastructureLink.objects.none()
+        shared = models.Q()
+        for kind, values in own_values.items():
+            shared |= models.Q(kind=kind, value__in=sorted(values))
+        return InfrastructureLink.objects.filter(shared).exclude(domain=self).select_related(
+            'domain').order_by('kind', 'value', 'domain__name', 'source')[:200]
     
     def __str__(self):
         """String for representing the model object (in Admin site etc.)."""
         return f'{self.name} ({self.health_status})'
 
 
+class DNSRecord(models.Model):
+    """Model representing a single DNS record collected for a domain. Each record value is its own
+    row, indexed by type and value, so questions like "which domains have MX but no DMARC" or
+    "which domains point at 1.2.3.4" are indexed lookups.
+
+    DMARC records are the TXT records found on the domain's `_dmarc` subdomain. TXT and SPF values
+    can be many kilobytes long, so the value is unbounded text and uniqueness and lookups use a
+    SHA-256 hash of it instead.
+    """
+    # Record types collected for each domain, in display order
+    RECORD_TYPES = ('NS', 'A', 'MX', 'DMARC', 'TXT', 'SOA')
+
+    record_type = models.CharField('Record Type', max_length=10, help_text='DNS record type (e.g. A, MX, DMARC)')
+    value = models.TextField('Value', help_text='Record value as returned by DNS')
+    value_hash = models.CharField('Value Hash', max_length=64, editable=False, help_text='SHA-256 hash of the value')
+    ttl = models.IntegerField('TTL', null=True, blank=True, help_text='Time to live, in seconds, when the record was observed')
+    observed_at = models.DateTimeField('Observed', default=timezone.now, help_text='When the record was first collected')
+    # Foreign Keys
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, null=False)
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['domain', 'record_type', 'value']
+        unique_together = (('domain', 'record_type', 'value_hash'),)
+        indexes = [
+            models.Index(fields=['record_type', 'value_hash'], name='catalog_dns_type_hash_idx'),
+            models.Index(fields=['value_hash'], name='catalog_dns_hash_idx'),
+        ]
+        verbose_name = 'DNS record'
+        verbose_name_plural = 'DNS records'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.domain.name} {self.record_type} {self.value}'
+
+    @staticmethod
+    def hash_value(value):
+        """Return the hash stored in `value_hash` for a record value. Filter on this to find the
+        domains with a given value (e.g. `value_hash=DNSRecord.hash_value('1.2.3.4')`).
+        """
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        """Keep the value's hash current. bulk_create() skips this, so set `value_hash` there."""
+        self.value_hash = self.hash_value(self.value)
+        super(DNSRecord, self).save(*args, **kwargs)
+
+
+class DNSRecordChange(models.Model):
+    """Model representing a DNS record that appeared on or disappeared from a domain between two
+    DNS updates. Together these rows make up the domain's DNS timeline.
+    """
+    ACTIONS = (
+        ('added', 'Added'),
+        ('removed', 'Removed'),
+    )
+
+    action = models.CharField('Action', max_length=7, choices=ACTIONS, help_text='Whether the record was added or removed')
+    record_type = models.CharField('Record Type', max_length=10, help_text='DNS record type (e.g. A, MX, DMARC)')
+    value = models.TextField('Value', help_text='Record value as returned by DNS')
+    changed_at = models.DateTimeField('Changed', default=timezone.now, help_text='When the DNS update found the change')
+    # Foreign Keys
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, null=False)
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['-changed_at', 'record_type', 'value']
+        indexes = [
+            models.Index(fields=['domain', '-changed_at'], name='catalog_dns_change_idx'),
+        ]
+        verbose_name = 'DNS record change'
+        verbose_name_plural = 'DNS record changes'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.domain.name} {self.action} {self.record_type} {self.value}'
+
+
+class InfrastructureLink(models.Model):
+    """Model representing one piece of infrastructure (an IP address, name server, or mail host)
+    used by a domain. The rows form an inverted index from each piece of infrastructure to the
+    domains that use it, built from the domain's DNS records and VirusTotal's passive DNS.
+    """
+    KINDS = (
+        ('ip', 'IP Address'),
+        ('ns', 'Name Server'),
+        ('mx', 'Mail Host'),
+    )
+    SOURCES = (
+        ('dns', 'DNS'),
+        ('passive_dns', 'Passive DNS'),
+    )
+
+    kind = models.CharField('Kind', max_length=2, choices=KINDS, help_text='Type of infrastructure')
+    value = models.CharField('Value', max_length=255, help_text='IP address or lowercase host name')
+    source = models.CharField('Source', max_length=11, choices=SOURCES, help_text='Where the link was found')
+    first_seen = models.DateTimeField('First Seen', default=timezone.now, help_text='When Shepherd first found the link')
+    last_resolved = models.DateField('Last Resolved', null=True, blank=True, help_text='Last resolution date reported by passive DNS')
+    # Foreign Keys
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, null=False)
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['kind', 'value', 'domain']
+        # The unique index starts with (kind, value), so it also serves infrastructure lookups
+        unique_together = (('kind', 'value', 'domain', 'source'),)
+        verbose_name = 'Infrastructure link'
+        verbose_name_plural = 'Infrastructure links'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.get_kind_display()} {self.value} ({self.domain.name})'
+
+
+class RegistrarSync(models.Model):
+    """Model representing the checkpoint of the inventory sync with one registrar account. The
+    cursor marks where an interrupted sync resumes and the page digests let the next sync skip the
+    pages of the account's domain list that have not changed.
+    """
+    provider = models.CharField('Provider', max_length=50, help_text='Registrar provider name (e.g. namecheap)')
+    account = models.CharField('Account', max_length=100, help_text='Registrar account user name')
+    cursor = models.CharField('Cursor', max_length=100, null=True, blank=True, help_text='Page where an interrupted sync resumes')
+    page_digests = models.TextField('Page Digests', default='{}', help_text='JSON object of page to a digest of its domains')
+    last_started = models.DateTimeField('Last Started', null=True, blank=True, help_text='When the last sync started')
+    last_completed = models.DateTimeField('Last Completed', null=True, blank=True, help_text='When the last sync finished every page')
+    domain_count = models.IntegerField('Domains', default=0, help_text='Domains in the account at the last completed sync')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['provider', 'account']
+        unique_together = (('provider', 'account'),)
+        verbose_name = 'Registrar sync'
+        verbose_name_plural = 'Registrar syncs'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.provider} ({self.account})'
+
+
+class SweepCheckpoint(models.Model):
+    """Model representing the checkpoint of a running sweep over the domain catalog. It is updated
+    after every chunk of domains, so a sweep interrupted by a crash or worker recycle resumes after
+    the last domain it finished, and it is deleted when the sweep completes.
+    """
+    sweep = models.CharField('Sweep', max_length=50, unique=True, help_text='Name of the sweep (e.g. health or dns)')
+    last_id = models.IntegerField('Last Domain ID', default=0, help_text='ID of the last domain the sweep finished')
+    processed = models.IntegerField('Processed', default=0, help_text='Domains finished so far')
+    started_at = models.DateTimeField('Started', default=timezone.now, help_text='When the sweep started')
+    updated_at = models.DateTimeField('Updated', default=timezone.now, help_text='When the last chunk was committed')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['sweep']
+        verbose_name = 'Sweep checkpoint'
+        verbose_name_plural = 'Sweep checkpoints'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.sweep} after domain {self.last_id} ({self.processed} done)'
+
+
+class Notification(models.Model):
+    """Model representing a message waiting in the outbound notification queue. Each row is one
+    message for one Slack channel; pending messages for a channel are posted together as a digest
+    by the notification task and retried with backoff if Slack cannot be reached.
+    """
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    channel = models.CharField('Channel', max_length=100, help_text='Slack channel the message is posted to')
+    message = models.TextField('Message', help_text='Text of the message')
+    status = models.CharField('Status', max_length=7, choices=STATUSES, default='pending', help_text='Delivery status')
+    attempts = models.IntegerField('Attempts', default=0, help_text='Failed attempts to post the message')
+    next_attempt = models.DateTimeField('Next Attempt', default=timezone.now, help_text='Earliest time the message is posted')
+    claim = models.CharField('Claim', max_length=32, null=True, blank=True, help_text='Delivery run currently posting the message')
+    last_error = models.TextField('Last Error', null=True, blank=True, help_text='Error from the last failed attempt')
+    created_at = models.DateTimeField('Created', default=timezone.now, help_text='When the message was queued')
+    sent_at = models.DateTimeField('Sent', null=True, blank=True, help_text='When the message was posted')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt'], name='catalog_notification_due_idx')]
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notifications'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.channel} ({self.status}): {self.message[:50]}'
+
+
 class History(models.Model):
     """Model representing the project history. This model records start and end dates for a project
     and then uses Foreign Keys for linking the dates to a client, project type, activity type, and
@@ -171,6 +404,7 @@ class History(models.Model):
     end_date = models.DateField('End Date', max_length=100, help_text='Enter the end date of the project')
     note = models.TextField('Notes', help_text='Project-related notes, such as how the domain will be used/how it worked out', null=True)
     slack_channel =  models.CharField('Project Slack Channel', max_length=100, help_text='Name of the Slack channel to be used for updates for this domain during the project\'s duration', null=True)
+    updated_at = models.DateTimeField('Last Updated', auto_now=True, db_index=True, help_text='When the project was last changed')
     # Foreign Keys
     client = models.ForeignKey('Client', on_delete=models.CASCADE, null=False)
     domain = models.ForeignKey('Domain', on_delete=models.CASCADE, null=False)
@@ -191,7 +425,7 @@ class History(models.Model):
 
     def __str__(self):
         """String for representing the model object (in Admin site etc.)."""
-        return f'{self.client} {self.project.project_type} - {self.domain.name} ({self.activitytype.activity}) {self.start_date} to {self.end_date} - {self.operator}'
+        return f'{self.client} {self.project_type} - {self.domain.name} ({self.activity_type.activity}) {self.start_date} to {self.end_date} - {self.operator}'
 
     @property
     def is_overdue(self):
@@ -199,3 +433,31 @@ class History(models.Model):
         if self.start_date and date.today() > self.end_date:
             return True
         return False
+
+
+class APIToken(models.Model):
+    """Model representing a token that lets a script or other client use the JSON API as one of
+    the users. Clients send it in an `Authorization: Token <key>` header.
+    """
+    key = models.CharField('Key', max_length=40, unique=True, editable=False, help_text='The secret sent by the client')
+    name = models.CharField('Name', max_length=100, help_text='What uses this token (e.g. the purchasing script)')
+    created_at = models.DateTimeField('Created', default=timezone.now, help_text='When the token was created')
+    last_used = models.DateTimeField('Last Used', null=True, blank=True, help_text='When the token was last used, to within a few minutes')
+    # Foreign Keys
+    user = models.ForeignKey(User, on_delete=models.CASCADE, help_text='User the client acts as')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['name']
+        verbose_name = 'API token'
+        verbose_name_plural = 'API tokens'
+
+    def save(self, *args, **kwargs):
+        """Generate the key when the token is first saved."""
+        if not self.key:
+            self.key = secrets.token_hex(20)
+        super(APIToken, self).save(*args, **kwargs)
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.name} ({self.user})'
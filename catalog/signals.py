@@ -0,0 +1,52 @@
+"""This contains the signal receivers for the catalog application's models."""
+
+from django.db import connections
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from django_q.models import Schedule
+
+from catalog.models import Domain, History, InfrastructureLink
+from modules.dashboard import invalidate_counts
+from modules.infrastructure import invalidate_overlap
+from modules.search import install_index
+from modules.task_queues import route_schedule
+from catalog.templatetags.check_group import forget_group_names
+
+
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=History)
+@receiver(post_delete, sender=History)
+def refresh_dashboard_counts(sender, **kwargs):
+    """Drop the cached dashboard counts when a domain or project is saved or deleted."""
+    invalidate_counts()
+
+
+@receiver(post_delete, sender=Domain)
+@receiver(post_save, sender=InfrastructureLink)
+def refresh_infrastructure_overlap(sender, **kwargs):
+    """Drop the cached overlap report when a domain is deleted (taking its links with it) or a
+    link is saved outside update_links(), e.g. in the admin panel.
+    """
+    invalidate_overlap()
+
+
+def restore_search_index(sender, using, **kwargs):
+    """Put back the domain search index after a migration that rebuilt the Domain table. This is
+    connected to post_migrate in CatalogConfig.ready().
+    """
+    install_index(connections[using])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def refresh_group_names(sender, instance, action, **kwargs):
+    """Drop the group names memoized on a user whose groups were just changed."""
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, User):
+        forget_group_names(instance)
+
+
+@receiver(pre_save, sender=Schedule)
+def route_scheduled_task(sender, instance, **kwargs):
+    """Send a scheduled task to the lane it is routed to instead of the interactive lane."""
+    route_schedule(instance)
@@ -1,12 +1,26 @@
 from django import template
-from django.contrib.auth.models import Group
 
 register = template.Library()
 
+
+def get_group_names(user):
+    """Return the set of names of the user's groups. The names are loaded once and kept on the
+    user object, which lives for one request, so repeated checks in a template are set lookups.
+    """
+    try:
+        return user._group_names
+    except AttributeError:
+        user._group_names = set(user.groups.values_list('name', flat=True))
+        return user._group_names
+
+
+def forget_group_names(user):
+    """Drop the group names kept on a user object after its memberships change."""
+    user.__dict__.pop('_group_names', None)
+
+
 @register.filter(name='has_group')
 def has_group(user, group_name):
     """Custom template tag to check the current user's group membership."""
-    # Get the group from the Group auth model
-    group = Group.objects.get(name=group_name)
-    # Check if the logged-in user a member of the returned group object
-    return True if group in user.groups.all() else False
+    # A group that does not exist has no members
+    return group_name in get_group_names(user)
@@ -4,6 +4,7 @@ routes URLs to views. For more information please see:
     https://docs.djangoproject.com/en/2.1/topics/http/urls/
 """
 
+from . import api
 from . import views
 from django.conf.urls import include
 from django.urls import path, re_path
@@ -19,6 +20,8 @@ urlpatterns = [
     path('graveyard/', views.GraveyardListView.as_view(), name='graveyard'),
     path('domain/<int:pk>', views.DomainDetailView.as_view(), name='domain-detail'),
     path('mydomains/', views.ActiveDomainsByUserListView.as_view(), name='my-domains'),
+    path('overlap/', views.InfrastructureOverlapView.as_view(), name='infrastructure-overlap'),
+    path('overlap/<str:kind>/', views.InfrastructureOverlapView.as_view(), name='infrastructure-overlap-kind'),
     path('error/', views.error, name='error'),
     path('profile/', views.profile, name='profile'),
 ]
@@ -40,7 +43,9 @@ urlpatterns += [
 # URLs for domain status change functions
 urlpatterns += [
     path('checkout/<int:pk>', views.checkout, name='checkout'),
+    path('checkout/bulk/', views.bulk_checkout, name='bulk_checkout'),
     path('release/<int:pk>', views.release, name='release'),
+    path('check/<int:pk>', views.check_domain, name='check_domain'),
 ]
 
 # URLs for management functions
@@ -48,5 +53,14 @@ urlpatterns += [
     path('management/', views.management, name='management'),
     path('update/', views.update, name='update'),
     path('update_dns/', views.update_dns, name='update_dns'),
+    path('progress/<str:sweep>/', views.sweep_progress, name='sweep_progress'),
     path('upload/csv/', views.upload_csv, name='upload_csv'),
-]
\ No newline at end of file
+]
+
+# URLs for the read-only JSON API
+urlpatterns += [
+    path('api/domains/', api.domain_list, name='api_domains'),
+    path('api/domains/<int:pk>/', api.domain_detail, name='api_domain'),
+    path('api/history/', api.history_list, name='api_history'),
+    path('api/checkout/', api.checkout, name='api_checkout'),
+]
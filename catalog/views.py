@@ -12,6 +12,7 @@ from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
 # Django imports for verifying a user is logged-in to access a view
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 # Django imports for verifying a user's permissions before accessing a function
@@ -19,26 +20,37 @@ from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
 
 # Django imports for forms
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, Http404
 from django.shortcuts import get_object_or_404
 
 # Django Q imports for task management
-from django_q.tasks import async_task, result
+from django_q.tasks import result
+from modules.task_queues import enqueue_task, QueueFull
 
 # Import for references to Django's settings.py
 from django.conf import settings
 
 # Import the catalog application's models
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.urls import reverse
-from catalog.forms import CheckoutForm, DomainCreateForm
-from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, Client, History, User
+from catalog.forms import CheckoutForm, BulkCheckoutForm, DomainCreateForm
+from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, Client, History, User, InfrastructureLink
 
 # Import the Django-Q models
 from django_q.models import Success, Task
 
+# Import the sweep progress and metrics published by the tasks
+from modules.progress import get_progress
+from modules.metrics import render_metrics
+from modules.dashboard import get_status_counts, get_checked_out_count
+from modules.infrastructure import get_overlap
+from modules.search import search_domains
+from modules.pagination import KeysetPaginator
+from modules.checkout import checkout_domains, find_available_domains, CheckoutError
+
 # Import Python libraries for various things
 import csv
+import hmac
 import codecs
 import datetime
 from io import StringIO
@@ -49,34 +61,32 @@ from io import TextIOWrapper
 logger = logging.getLogger(__name__)
 
 
+# Related objects shown for every domain and project in the lists, loaded with the rows
+DOMAIN_STATUSES = ('domain_status', 'health_status', 'whois_status')
+HISTORY_RELATED = ('client', 'activity_type', 'project_type', 'operator')
+
+
 ##################
 # View Functions #
 ##################
 
 def index(request):
     """View function for the home page, index.html."""
-    # Generate counts of some of the main objects
-    num_domains = Domain.objects.all().count()
-    # Get counts of domains for each status
-    num_domains_burned = Domain.objects.filter(domain_status__domain_status='Burned').count()
-    num_domains_reserved = Domain.objects.filter(domain_status__domain_status='Reserved').count()
-    num_domains_available = Domain.objects.filter(domain_status__domain_status='Available').count()
-    num_domains_unavailable = Domain.objects.filter(domain_status__domain_status='Unavailable').count()
+    # Get the counts of domains for each status with one cached query
+    counts = get_status_counts()
     # If the user is authenticated, get the number of checked-out domains
     if request.user.is_authenticated:
-        num_domains_out = History.objects.filter(operator=request.user,
-                                                 domain__domain_status__domain_status='Unavailable',
-                                                 end_date__gte=datetime.datetime.now()).count()
+        num_domains_out = get_checked_out_count(request.user)
     else:
         num_domains_out = None
     # Prepare the context for index.html
     context = {
-                'num_domains': num_domains,
+                'num_domains': counts['total'],
                 'num_domains_out': num_domains_out,
-                'num_domains_burned': num_domains_burned,
-                'num_domains_reserved': num_domains_reserved,
-                'num_domains_available': num_domains_available,
-                'num_domains_unavailable': num_domains_unavailable,
+                'num_domains_burned': counts['Burned'],
+                'num_domains_reserved': counts['Reserved'],
+                'num_domains_available': counts['Available'],
+                'num_domains_unavailable': counts['Unavailable'],
                }
     # Render the HTML template index.html with the data in the context variable
     return render(request, 'index.html', context=context)
@@ -115,36 +125,17 @@ def checkout(request, pk):
         form = CheckoutForm(request.POST)
         # Check if the form is valid
         if form.is_valid():
-            # Check if client exists and create it if not
-            # TODO:
-            # Change this to tie into a client manager
-            # In the future this will be a dropdown or typeahead field
-            client_name = form.cleaned_data['client']
-            client = Client.objects.get(name__iexact=client_name)
-            if not client:
-                client_instance = Client(name=client_name)
-                client_instance.save()
-                client = Client.objects.get(name__iexact=client_name)
-            # Process the data in form.cleaned_data as required
-            history_instance = History(start_date=form.cleaned_data['start_date'],
-                                       end_date=form.cleaned_data['end_date'],
-                                       activity_type=form.cleaned_data['activity'],
-                                       project_type=form.cleaned_data['project_type'],
-                                       note=form.cleaned_data['note'],
-                                       client=client,
-                                       operator=request.user,
-                                       domain=Domain.objects.get(pk=pk))
-            # Commit the new project history
-            history_instance.save()
-            # Update the domain status and commit it
-            domain_instance.domain_status = DomainStatus.objects.get(domain_status='Unavailable')
-            domain_instance.last_used_by = request.user
-            domain_instance.save()
-            # Redirect to the user's checked-out domains
-            return HttpResponseRedirect(reverse('my-domains'))
+            # Claim the domain and record the project in one transaction (see modules/checkout.py)
+            try:
+                checkout_domains(request.user, Domain.objects.filter(pk=pk), 1, **form.project_details())
+            except CheckoutError:
+                form.add_error(None, '{} is no longer available.'.format(domain_instance.name))
+            else:
+                # Redirect to the user's checked-out domains
+                return HttpResponseRedirect(reverse('my-domains'))
     # If this is a GET (or any other method) create the default form
     else:
-        form = CheckoutForm(request.POST)
+        form = CheckoutForm()
     # Prepare the context for the checkout form
     context = {
                 'form': form,
@@ -154,6 +145,30 @@ def checkout(request, pk):
     # Render the checkout form page
     return render(request, 'catalog/checkout.html', context)
 
+@login_required
+def bulk_checkout(request):
+    """View function for checking out several available domains matching some criteria in one
+    go, e.g. for an engagement kick-off. Either every requested domain is checked out or none are.
+    """
+    if request.method == 'POST':
+        form = BulkCheckoutForm(request.POST)
+        if form.is_valid():
+            health = form.cleaned_data['health']
+            candidates = find_available_domains(category=form.cleaned_data['category'],
+                                                min_age=form.cleaned_data['min_age'],
+                                                health=health.health_status if health else None)
+            try:
+                domains = checkout_domains(request.user, candidates, form.cleaned_data['count'], **form.project_details())
+            except CheckoutError as error:
+                form.add_error(None, '{}, so nothing was checked out. Try fewer domains or looser criteria.'.format(error))
+            else:
+                messages.success(request, 'Checked out {} domains: {}'.format(
+                    len(domains), ', '.join(domain.name for domain in domains)))
+                return HttpResponseRedirect(reverse('my-domains'))
+    else:
+        form = BulkCheckoutForm(initial={'health': 'Healthy'})
+    return render(request, 'catalog/bulk_checkout.html', {'form': form})
+
 @login_required
 def release(request, pk):
     """View function for releasing a domain back to the pool. The Primary Key passed to this view is used to look-up
@@ -180,6 +195,20 @@ def release(request, pk):
     else:
         return HttpResponseRedirect(reverse('my-domains'))
 
+@login_required
+def check_domain(request, pk):
+    """View function to queue an urgent health check of one domain. The check runs on the
+    interactive lane, ahead of any bulk sweep.
+    """
+    domain_instance = get_object_or_404(Domain, pk=pk)
+    if request.method == 'POST':
+        try:
+            task_id = enqueue_task('tasks.check_domain', domain_instance.id, group='Domain Checks')
+            messages.success(request, 'Task ID {} has been queued to check {}.'.format(task_id, domain_instance.name))
+        except QueueFull as error:
+            messages.error(request, str(error))
+    return HttpResponseRedirect(reverse('domain-detail', args=[str(domain_instance.id)]))
+
 @login_required
 def upload_csv(request):
     """View function for uploading and processing csv files and importing domain names."""
@@ -250,6 +279,9 @@ def upload_csv(request):
             else:
                 domain_status = DomainStatus.objects.get(domain_status='Available')
                 entry['domain_status'] = domain_status
+            # DNS records are stored in their own table and refreshed by the DNS update task, so
+            # drop the column older DomainCheck exports include
+            entry.pop('dns_record', None)
             # The last_used_by field will only be set by Shepherd at domain check-out
             if 'last_used_by' in entry:
                 entry['last_used_by'] = None
@@ -275,18 +307,27 @@ def update(request):
     # Check if the request is a POST and proceed with the task
     if request.method == 'POST':
         # Add an async task grouped as `Domain Updates`
-        task_id = async_task('tasks.check_domains', group='Domain Updates', hook='tasks.send_slack_complete_msg')
-        # Return to the update.html page with the confirmation message
-        messages.success(request, 'Task ID {} has been successfully queued!'.format(task_id))
+        try:
+            task_id = enqueue_task('tasks.check_domains', group='Domain Updates', hook='tasks.send_slack_complete_msg')
+            # Return to the update.html page with the confirmation message
+            messages.success(request, 'Task ID {} has been successfully queued!'.format(task_id))
+        except QueueFull as error:
+            messages.error(request, str(error))
         return HttpResponseRedirect(reverse('update'))
     else:
         # Collect data for rendering the page
         total_domains = Domain.objects.all().count()
         try:
             sleep_time = settings.DOMAINCHECK_CONFIG['sleep_time']
-            update_time = round(total_domains * sleep_time / 60, 2)
         except:
             sleep_time = 20
+        # Estimate the duration from the throughput measured during the last sweep, if there was one
+        progress = get_progress('health')
+        if progress and progress['throughput']:
+            measured_throughput = progress['throughput']
+            update_time = round(total_domains / measured_throughput, 2)
+        else:
+            measured_throughput = None
             update_time = round(total_domains * sleep_time / 60, 2)
         try:
             # Get the latest completed task from `Domain Updates`
@@ -314,7 +355,9 @@ def update(request):
                     'last_update_completed': last_update_completed,
                     'last_update_time': last_update_time,
                     'last_result': last_result,
-                    'sleep_time': sleep_time
+                    'sleep_time': sleep_time,
+                    'measured_throughput': measured_throughput,
+                    'sweep': 'health',
                 }
         return render(request, 'catalog/update.html', context=context)
 
@@ -324,9 +367,12 @@ def update_dns(request):
     # Check if the request is a POST and proceed with the task
     if request.method == 'POST':
         # Add an async task grouped as `DNS Updates`
-        task_id = async_task('tasks.update_dns', group='DNS Updates', hook='tasks.send_slack_complete_msg')
-        # Return to the update.html page with the success message
-        messages.success(request, 'Task ID {} has been successfully queued!'.format(task_id))
+        try:
+            task_id = enqueue_task('tasks.update_dns', group='DNS Updates', hook='tasks.send_slack_complete_msg')
+            # Return to the update.html page with the success message
+            messages.success(request, 'Task ID {} has been successfully queued!'.format(task_id))
+        except QueueFull as error:
+            messages.error(request, str(error))
         return HttpResponseRedirect(reverse('update_dns'))
     else:
         # Collect data for rendering the page
@@ -349,10 +395,39 @@ def update_dns(request):
                     'last_update_requested': last_update_requested,
                     'last_update_completed': last_update_completed,
                     'last_update_time': last_update_time,
-                    'last_result': last_result
+                    'last_result': last_result,
+                    'sweep': 'dns',
                 }
         return render(request, 'catalog/update_dns.html', context=context)
 
+@login_required
+def sweep_progress(request, sweep):
+    """View function returning the live progress of a health or DNS sweep as JSON. This is
+    polled by update.html and update_dns.html to draw the progress bar and ETA.
+    """
+    if sweep not in ('health', 'dns'):
+        raise Http404('Unknown sweep')
+    progress = get_progress(sweep)
+    if not progress:
+        return JsonResponse({'sweep': sweep, 'state': 'idle'})
+    return JsonResponse(progress)
+
+def metrics(request):
+    """View function exposing provider, DNS, and sweep metrics in the Prometheus text exposition
+    format. If a bearer token is set in `METRICS_CONFIG` the scraper must send it; without a token
+    only logged in users can see the metrics.
+    """
+    try:
+        token = settings.METRICS_CONFIG['bearer_token']
+    except (AttributeError, KeyError):
+        token = None
+    if token:
+        if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token)):
+            return HttpResponse('Unauthorized', status=401)
+    elif not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def management(request):
     """View function to display the current settings configured for Shepherd."""
@@ -370,9 +445,44 @@ def management(request):
 # View Classes #
 ################
 
-class DomainListView(LoginRequiredMixin, generic.ListView):
+class KeysetPaginationMixin(object):
+    """Mixin for list views that pages with keyset pagination (see modules/pagination.py) instead of
+    Django's OFFSET pagination. Views set `keyset` to the fields that order the list and can return
+    a cheap approximate count from get_approximate_count().
+    """
+    keyset = ('name',)
+
+    def get_keyset(self):
+        """Return the fields that order the list."""
+        return self.keyset
+
+    def get_approximate_count(self):
+        """Return the approximate number of objects in the list, or None if it is not known."""
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page of the queryset after or before the cursor in the request."""
+        paginator = KeysetPaginator(queryset, self.get_keyset(), page_size, count=self.get_approximate_count)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except ValueError:
+            raise Http404('Invalid page cursor')
+        # Build the links to the next and previous pages, keeping the rest of the query (e.g. a search)
+        for name, cursor in (('next', page.next_cursor), ('previous', page.previous_cursor)):
+            query = self.request.GET.copy()
+            query.pop('after', None)
+            query.pop('before', None)
+            query.pop('page', None)
+            if cursor:
+                query['after' if name == 'next' else 'before'] = cursor
+            setattr(page, '{}_query'.format(name), query.urlencode())
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class DomainListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing all registered domains. This view defaults to the domain_list.html template."""
     model = Domain
+    queryset = Domain.objects.select_related(*DOMAIN_STATUSES)
     paginate_by = 25
 
     def get_queryset(self):
@@ -382,68 +492,142 @@ class DomainListView(LoginRequiredMixin, generic.ListView):
             search_term = order_by = self.request.GET.get('domain_search')
         except:
             search_term = ''
-        # If there is a search term, filter the query by domain name or category
-        # TODO: We might consider using keywords like `category:technology` to search different fields
+        # If there is a search term, filter the query with the search index (see modules/search.py)
         if search_term:
             queryset = super(DomainListView, self).get_queryset()
-            return queryset.filter(Q(name__icontains=search_term) | Q(all_cat__icontains=search_term)).order_by('name')
+            return search_domains(queryset, search_term)
         else:
-            return Domain.objects.all().order_by('domain_status')
+            return Domain.objects.select_related(*DOMAIN_STATUSES)
+
+    def get_keyset(self):
+        """Order searches by name and the full list by status and then name."""
+        if self.request.GET.get('domain_search'):
+            return ('name',)
+        return ('domain_status__domain_status', 'name')
+
+    def get_approximate_count(self):
+        """Return the cached total for the full list; searches are not counted."""
+        if self.request.GET.get('domain_search'):
+            return None
+        return get_status_counts()['total']
 
 
-class AvailDomainListView(LoginRequiredMixin, generic.ListView):
+class AvailDomainListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing only available domains. This view calls the available_domains.html template."""
     model = Domain
-    queryset = Domain.objects.filter(domain_status__domain_status='Available').order_by('name')
+    queryset = Domain.objects.filter(domain_status__domain_status='Available').select_related(*DOMAIN_STATUSES)
     template_name = 'catalog/available_domains.html'
     paginate_by = 25
 
+    def get_approximate_count(self):
+        return get_status_counts()['Available']
 
-class ActiveDomainListView(LoginRequiredMixin, generic.ListView):
+
+class ActiveDomainListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing only available domains. This view calls the active_domains.html template."""
     model = Domain
-    queryset = Domain.objects.filter(domain_status__domain_status='Unavailable').order_by('name')
+    queryset = Domain.objects.filter(domain_status__domain_status='Unavailable').select_related(*DOMAIN_STATUSES, 'last_used_by')
     template_name = 'catalog/active_domains.html'
     paginate_by = 25
 
+    def get_approximate_count(self):
+        return get_status_counts()['Unavailable']
+
 
-class ResDomainListView(LoginRequiredMixin, generic.ListView):
+class ResDomainListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing only reserved domains. This view calls the reserved_domains.html template."""
     model = Domain
-    queryset = Domain.objects.filter(domain_status__domain_status='Reserved').order_by('name')
+    queryset = Domain.objects.filter(domain_status__domain_status='Reserved').select_related(*DOMAIN_STATUSES)
     template_name = 'catalog/reserved_domains.html'
     paginate_by = 25
 
+    def get_approximate_count(self):
+        return get_status_counts()['Reserved']
 
-class GraveyardListView(LoginRequiredMixin, generic.ListView):
+
+class GraveyardListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing only burned and retired domains. This view calls the graveyard.html template."""
     model = Domain
-    queryset = Domain.objects.filter(domain_status__domain_status='Burned')
+    queryset = Domain.objects.filter(domain_status__domain_status='Burned').select_related(*DOMAIN_STATUSES)
     template_name = 'catalog/graveyard.html'
     paginate_by = 25
 
+    def get_approximate_count(self):
+        return get_status_counts()['Burned']
+
+
+class InfrastructureOverlapView(LoginRequiredMixin, generic.ListView):
+    """View showing the IP addresses, name servers, and mail hosts shared by two or more domains,
+    with the domains and clients tied to each. This view calls the infrastructure_overlap.html
+    template.
+    """
+    template_name = 'catalog/infrastructure_overlap.html'
+    context_object_name = 'overlap_list'
+    paginate_by = 25
+
+    def get_queryset(self):
+        """Return the cached list of infrastructure used by more than one domain, optionally
+        limited to one kind of infrastructure.
+        """
+        kind = self.kwargs.get('kind')
+        if kind and kind not in dict(InfrastructureLink.KINDS):
+            raise Http404('Unknown infrastructure kind')
+        return get_overlap(kind)
+
+    def get_context_data(self, **kwargs):
+        """Add the domains and clients for the shared infrastructure on this page."""
+        context = super(InfrastructureOverlapView, self).get_context_data(**kwargs)
+        overlap_list = list(context['overlap_list'])
+        keys = {(row['kind'], row['value']) for row in overlap_list}
+        domains = {}
+        links = InfrastructureLink.objects.filter(value__in={value for _, value in keys}).select_related('domain')
+        for link in links.order_by('domain__name'):
+            if (link.kind, link.value) in keys:
+                domains.setdefault((link.kind, link.value), {})[link.domain_id] = link.domain
+        clients = {}
+        domain_ids = {domain_id for linked in domains.values() for domain_id in linked}
+        for domain_id, client_name in History.objects.filter(domain_id__in=domain_ids).values_list('domain_id', 'client__name').distinct():
+            clients.setdefault(domain_id, set()).add(client_name)
+        kind_names = dict(InfrastructureLink.KINDS)
+        for row in overlap_list:
+            linked = domains.get((row['kind'], row['value']), {})
+            row['kind_name'] = kind_names[row['kind']]
+            row['domains'] = list(linked.values())
+            row['clients'] = sorted({client for domain_id in linked for client in clients.get(domain_id, ())})
+        context['overlap_list'] = overlap_list
+        context['kinds'] = InfrastructureLink.KINDS
+        context['kind'] = self.kwargs.get('kind')
+        return context
+
 
 class DomainDetailView(LoginRequiredMixin, generic.DetailView):
     """View showing the details for the specified domain. This view defaults to the domain_detail.html
     template.
     """
     model = Domain
+    queryset = Domain.objects.select_related(*DOMAIN_STATUSES).prefetch_related(
+        Prefetch('history_set', queryset=History.objects.select_related(*HISTORY_RELATED)))
 
 
-class ActiveDomainsByUserListView(LoginRequiredMixin, generic.ListView):
+class ActiveDomainsByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """View showing only the domains checked-out by the current user. This view calls the
     active_domains_user.html template.
     """
     model = History
     template_name = 'catalog/active_domains_user.html'
     paginate_by = 25
+    keyset = ('end_date',)
 
     def get_queryset(self):
         """Modify this built-in function to filter results from the History by the current user."""
         # Only return project entries for the current user where the current domain status is `Unavailable`
         return History.objects.filter(operator=self.request.user,
                                       domain__domain_status__domain_status='Unavailable',
-                                      end_date__gte=datetime.datetime.now()).order_by('end_date')
+                                      end_date__gte=datetime.datetime.now()).select_related(
+                                          'domain__health_status', 'domain__whois_status')
+
+    def get_approximate_count(self):
+        return get_checked_out_count(self.request.user)
 
 
 class HistoryCreate(LoginRequiredMixin, CreateView):
@@ -461,6 +645,12 @@ class HistoryCreate(LoginRequiredMixin, CreateView):
                 'domain': domain,
                }
 
+    def get_form(self, form_class=None):
+        """Load the health status with the domains in the domain menu, which each option shows."""
+        form = super(HistoryCreate, self).get_form(form_class)
+        form.fields['domain'].queryset = Domain.objects.select_related('health_status')
+        return form
+
 
 class HistoryUpdate(LoginRequiredMixin, UpdateView):
     """View for updating existing project history entries. This view defaults to the
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module checks domains out for projects. A checkout claims every requested domain and
+records the projects in one transaction, so two operators can never walk away with the same
+domain and a kick-off that needs twenty domains gets all twenty or none. Domains are claimed with
+a conditional UPDATE that only matches domains that are still available, after locking the rows
+on databases that support SELECT ... FOR UPDATE.
+"""
+
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from catalog.models import Domain, DomainStatus, Client, History
+from modules.dashboard import invalidate_counts
+from modules.search import search_domains
+
+
+class CheckoutError(Exception):
+    """Raised when the requested domains cannot all be checked out."""
+    pass
+
+
+def find_available_domains(category=None, min_age=None, health=None):
+    """Return the available domains matching the criteria, oldest first.
+
+    Parameters:
+    category        Optional category word the domain must have from any vendor
+    min_age         Optional minimum age of the domain in days
+    health          Optional health status name (e.g. Healthy)
+    """
+    queryset = Domain.objects.filter(domain_status__domain_status='Available')
+    if category:
+        queryset = search_domains(queryset, 'cat:"{}"'.format(category.replace('"', '')))
+    if min_age:
+        queryset = queryset.filter(creation__lte=datetime.date.today() - datetime.timedelta(days=min_age))
+    if health:
+        queryset = queryset.filter(health_status__health_status__iexact=health)
+    return queryset.order_by('creation', 'name')
+
+
+def checkout_domains(user, candidates, count, client_name, project_type, activity_type, end_date,
+                     start_date=None, note=None, slack_channel=None):
+    """Check out `count` of the candidate domains for a project in one transaction and return them.
+    Raises CheckoutError, and checks out nothing, if fewer than `count` of them are available.
+
+    Parameters:
+    user            The User checking the domains out
+    candidates      Domain queryset to choose from, in order of preference
+    count           Number of domains to check out
+    client_name     Name of the client, created if it does not exist yet
+    project_type    ProjectType of the project
+    activity_type   ActivityType describing how the domains will be used
+    end_date        Last day of the project
+    start_date      First day of the project; defaults to today
+    note            Optional note for the project records
+    slack_channel   Optional Slack channel for the project's notifications
+    """
+    available = DomainStatus.objects.get(domain_status='Available')
+    unavailable = DomainStatus.objects.get(domain_status='Unavailable')
+    lock_options = {'of': ('self',)} if connection.features.has_select_for_update_of else {}
+    if connection.features.has_select_for_update_skip_locked:
+        # Skip domains another checkout has locked instead of waiting for it
+        lock_options['skip_locked'] = True
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = []
+        tried = set()
+        while len(claimed) < count:
+            batch = list(candidates.filter(domain_status=available).exclude(id__in=tried).select_for_update(
+                **lock_options).values_list('id', flat=True)[:count - len(claimed)])
+            if not batch:
+                break
+            tried.update(batch)
+            for domain_id in batch:
+                # Only claims the domain if no one else got to it first
+                if Domain.objects.filter(id=domain_id, domain_status=available).update(
+                        domain_status=unavailable, last_used_by=user, updated_at=now):
+                    claimed.append(domain_id)
+        if len(claimed) < count:
+            raise CheckoutError('Only {} of the {} requested domains are available'.format(len(claimed), count))
+        client = Client.objects.filter(name__iexact=client_name).first() or Client.objects.create(name=client_name)
+        History.objects.bulk_create([
+            History(domain_id=domain_id, client=client, operator=user, project_type=project_type,
+                    activity_type=activity_type, start_date=start_date or datetime.date.today(),
+                    end_date=end_date, note=note, slack_channel=slack_channel or None)
+            for domain_id in claimed])
+        # The updates and bulk_create() send no signals, so refresh the dashboard counts here
+        transaction.on_commit(invalidate_counts)
+    return list(Domain.objects.filter(id__in=claimed).order_by('name'))
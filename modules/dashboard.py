@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module keeps the home page's domain counts in a cache so the dashboard does not count the
+Domain table on every load. The status counts come from one grouped query and are cached until a
+Domain or History change bumps the cache version (see catalog/signals.py); the tasks that write
+in bulk bump it themselves because bulk writes do not send signals. The cache lives in Redis so
+the web application and the Django Q workers share it, or Django's cache if Redis is not available.
+"""
+
+import datetime
+
+from django.db.models import Count
+
+from catalog.models import Domain, History
+from modules.redis_store import get_json, set_json, incr
+
+
+# Counts are recomputed at least this often, as a safety net for changes made outside Shepherd
+COUNTS_TTL = 300
+VERSION_KEY = 'shepherd:dashboard:version'
+# Statuses shown on the dashboard
+STATUSES = ('Available', 'Unavailable', 'Reserved', 'Burned')
+
+
+def counts_version():
+    """Return the current version of the cached counts."""
+    return get_json(VERSION_KEY) or 0
+
+
+def invalidate_counts():
+    """Bump the version of the cached counts so the next dashboard load recounts."""
+    incr(VERSION_KEY)
+
+
+def get_status_counts():
+    """Return a dictionary with the total number of domains (`total`) and the number of domains
+    with each status, counted with one grouped query and then served from the cache.
+    """
+    key = 'shepherd:dashboard:{}:status'.format(counts_version())
+    counts = get_json(key)
+    if counts is None:
+        counts = dict.fromkeys(STATUSES, 0)
+        counts['total'] = 0
+        for status, count in Domain.objects.order_by().values_list(
+                'domain_status__domain_status').annotate(count=Count('id')):
+            if status:
+                counts[status] = count
+            counts['total'] += count
+        set_json(key, counts, COUNTS_TTL)
+    return counts
+
+
+def get_checked_out_count(user):
+    """Return the number of domains the user has checked out for projects that have not ended,
+    cached the same way as the status counts.
+
+    Parameters:
+    user            The User whose projects are counted
+    """
+    today = datetime.date.today()
+    key = 'shepherd:dashboard:{}:out:{}:{}'.format(counts_version(), user.id, today.isoformat())
+    count = get_json(key)
+    if count is None:
+        count = History.objects.filter(operator=user, domain__domain_status__domain_status='Unavailable',
+                                       end_date__gte=today).count()
+        set_json(key, count, COUNTS_TTL)
+    return count
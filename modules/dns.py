@@ -3,30 +3,92 @@
 
 """This module contains the tools required for collecting and parsing DNS records."""
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import dns.resolver
+import dns.rdatatype
+import dns.exception
+from django.conf import settings
 from catalog.models import Domain
+from modules import metrics
+from modules.dns_cache import DNSAnswerCache, zone_records_cached
+from modules.resolvers import ResolverPool
 
 
 class DNSCollector(object):
     """Class to retrieve DNS records and perform some basic analysis."""
-    # Setup a DNS resolver so a timeout can be set
-    # No timeout means a very, very long wait if a domain has no records
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = 1
-    resolver.lifetime = 1
+    # Queries made for each domain as (label, name prefix, record type), in display order
+    # DMARC is the TXT record on the domain's `_dmarc` subdomain
+    record_queries = [
+        ('NS', '', 'NS'),
+        ('A', '', 'A'),
+        ('MX', '', 'MX'),
+        ('DMARC', '_dmarc.', 'TXT'),
+        ('TXT', '', 'TXT'),
+        ('SOA', '', 'SOA'),
+    ]
+    # Labels of the zone's own records, queried after the domain's other records so they can be
+    # answered from the SOA and NS records those answers carried in their authority section
+    zone_labels = ('NS', 'SOA')
+    # Record types cached from the authority section of any answer
+    zone_record_types = (dns.rdatatype.NS, dns.rdatatype.SOA)
+    # Answer cache and resolver pool shared by every collector in this process, created from
+    # settings on first use so resolver health carries over from one sweep to the next
+    answer_cache = None
+    resolver_pool = None
 
-    def __init__(self):
-        """Everything that should be initiated with a new object goes here."""
-        pass
+    def __init__(self, config=None):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        config          Dictionary used in place of `DNS_CONFIG` (e.g. by benchmark_dns); the
+                        collector then gets its own answer cache and resolver pool
+        """
+        if config is None:
+            try:
+                config = settings.DNS_CONFIG
+            except AttributeError:
+                config = {}
+            if DNSCollector.answer_cache is None:
+                DNSCollector.answer_cache = DNSAnswerCache.from_settings(config)
+            if DNSCollector.resolver_pool is None:
+                DNSCollector.resolver_pool = ResolverPool.from_settings(config)
+        else:
+            self.answer_cache = DNSAnswerCache.from_settings(config)
+            self.resolver_pool = ResolverPool.from_settings(config)
+        # Number of DNS queries allowed in flight at once and domains collected per batch
+        self.concurrency = config.get('concurrency', 50)
+        self.batch_size = config.get('batch_size', 500)
+        self.use_cache = config.get('cache', True)
 
     def get_dns_record(self, domain, record_type):
-        """Collect the specified DNS record type for the target domain.
+        """Collect the specified DNS record type for the target domain. The query goes to the
+        healthiest resolver in the pool and is retried on another if it fails.
 
         Parameters:
         domain          The domain to be used for DNS record collection
         record_type     The DNS record type to collect
         """
-        answer = self.resolver.query(domain, record_type)
+        start = time.perf_counter()
+        result = 'ok'
+        try:
+            answer = self.resolver_pool.query(domain, record_type)
+        except dns.resolver.NXDOMAIN:
+            result = 'nxdomain'
+            raise
+        except dns.resolver.NoAnswer:
+            result = 'noanswer'
+            raise
+        except dns.exception.Timeout:
+            result = 'timeout'
+            raise
+        except Exception:
+            result = 'error'
+            raise
+        finally:
+            metrics.dns_latency.observe(time.perf_counter() - start, record_type=record_type)
+            metrics.dns_queries.inc(record_type=record_type, result=result)
         return answer
 
     def parse_dns_answer(self, dns_record):
@@ -49,5 +111,155 @@ class DNSCollector(object):
         domain          The domain to be used for DNS record collection
         record_type     The DNS record type to collect
         """
-        record = self.get_dns_record(domain, record_type)
-        return self.parse_dns_answer(record)
+        return ', '.join(self.resolve(domain, record_type))
+
+    def resolve(self, domain, record_type):
+        """Return the record values for the domain as a list of text. See resolve_with_ttl().
+
+        Parameters:
+        domain          The domain to be used for DNS record collection
+        record_type     The DNS record type to collect
+        """
+        return self.resolve_with_ttl(domain, record_type)[0]
+
+    def resolve_with_ttl(self, domain, record_type):
+        """Return a tuple of the record values for the domain as a list of text and the answer's
+        TTL, answering from the cache when it holds an unexpired answer (the TTL is then the time
+        the cached answer has left). NXDOMAIN and NoAnswer are raised for cached negative answers
+        just like for fresh ones.
+
+        Parameters:
+        domain          The domain to be used for DNS record collection
+        record_type     The DNS record type to collect
+        """
+        if self.use_cache:
+            entry = self.answer_cache.get(domain, record_type)
+            if entry:
+                if entry['status'] == 'nxdomain':
+                    raise dns.resolver.NXDOMAIN()
+                if entry['status'] == 'noanswer':
+                    raise dns.resolver.NoAnswer()
+                return entry['values'], int(entry['expires'] - time.time())
+        try:
+            answer = self.get_dns_record(domain, record_type)
+        except dns.resolver.NXDOMAIN as error:
+            if self.use_cache:
+                self.cache_zone_records(self.error_responses(error))
+                self.answer_cache.set(domain, record_type, 'nxdomain', [], self.negative_ttl(error))
+            raise
+        except dns.resolver.NoAnswer as error:
+            if self.use_cache:
+                self.cache_zone_records(self.error_responses(error))
+                self.answer_cache.set(domain, record_type, 'noanswer', [], self.negative_ttl(error))
+            raise
+        values = []
+        for rdata in answer.response.answer:
+            for item in rdata.items:
+                values.append(item.to_text())
+        # A CNAME chain is only good for as long as its shortest-lived link
+        ttl = min(rrset.ttl for rrset in answer.response.answer) if answer.response.answer else None
+        if self.use_cache:
+            self.cache_zone_records([answer.response])
+            if ttl:
+                self.answer_cache.set(domain, record_type, 'ok', values, ttl)
+        return values, ttl
+
+    def error_responses(self, error):
+        """Return the responses behind an NXDOMAIN or NoAnswer exception raised by the resolver.
+
+        Parameters:
+        error           The NXDOMAIN or NoAnswer exception
+        """
+        try:
+            # NXDOMAIN keeps every response it received and NoAnswer keeps the one response
+            if hasattr(error, 'responses'):
+                return list(error.responses().values())
+            return [error.kwargs['response']]
+        except Exception:
+            return []
+
+    def cache_zone_records(self, responses):
+        """Cache the SOA and NS record sets found in the authority section of the responses as
+        answers for their zone. Negative answers always carry the zone's SOA record, so a domain
+        whose DMARC or TXT lookup comes back empty has its SOA query answered from the cache.
+
+        Parameters:
+        responses       List of dns.message.Message responses
+        """
+        for response in responses:
+            for rrset in response.authority:
+                if rrset.rdtype in self.zone_record_types and rrset.ttl:
+                    record_type = dns.rdatatype.to_text(rrset.rdtype)
+                    self.answer_cache.set(rrset.name.to_text(), record_type, 'ok',
+                                          [item.to_text() for item in rrset], rrset.ttl)
+                    zone_records_cached.inc(record_type=record_type)
+
+    def negative_ttl(self, error):
+        """Return how long to cache an NXDOMAIN or NoAnswer result: the smaller of the SOA
+        record's TTL and its minimum field from the authority section (RFC 2308), or the cache's
+        default when the response carried no SOA record.
+
+        Parameters:
+        error           The NXDOMAIN or NoAnswer exception raised by the resolver
+        """
+        for response in self.error_responses(error):
+            for rrset in response.authority:
+                if rrset.rdtype == dns.rdatatype.SOA:
+                    return min(rrset.ttl, min(item.minimum for item in rrset))
+        return self.answer_cache.negative_ttl
+
+    def lookup(self, domain, label, prefix, record_type):
+        """Run one of the `record_queries` for the domain and return a tuple of the domain, the
+        record label, the list of record values, the answer's TTL, and True if the query failed
+        outright (timeout or server error) rather than finding no records.
+
+        Parameters:
+        domain          The domain to be used for DNS record collection
+        label           The label the values are stored under (e.g. DMARC)
+        prefix          Prefix added to the domain for the query (e.g. _dmarc.)
+        record_type     The DNS record type to collect
+        """
+        try:
+            values, ttl = self.resolve_with_ttl(prefix + domain, record_type)
+            # Name servers are stored without the trailing dot
+            if label == 'NS':
+                values = [value.rstrip('.') for value in values]
+            return domain, label, values, ttl, False
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return domain, label, [], None, False
+        except Exception:
+            return domain, label, [], None, True
+
+    def collect_many(self, domains):
+        """Collect every record in `record_queries` for many domains at once. Queries for a batch
+        of domains are issued through a thread pool capped at `concurrency` queries in flight, so a
+        domain with missing records no longer holds up the rest of the sweep. Yields a tuple of
+        the domain, a dictionary of record label to a (list of values, TTL) tuple, and the list of
+        labels whose queries failed, for each domain in the order given.
+
+        Parameters:
+        domains         An iterable of domain names
+        """
+        domains = iter(domains)
+        # The zone's SOA and NS are queried last, once the other answers have filled the cache
+        waves = ([query for query in self.record_queries if query[0] not in self.zone_labels],
+                 [query for query in self.record_queries if query[0] in self.zone_labels])
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                batch = [domain for _, domain in zip(range(self.batch_size), domains)]
+                if not batch:
+                    break
+                results = {domain: ({}, []) for domain in batch}
+                for queries in waves:
+                    futures = [executor.submit(self.lookup, domain, label, prefix, record_type)
+                               for domain in batch
+                               for label, prefix, record_type in queries]
+                    for future in futures:
+                        domain, label, values, ttl, failed = future.result()
+                        results[domain][0][label] = (values, ttl)
+                        if failed:
+                            results[domain][1].append(label)
+                for domain in batch:
+                    answers, failures = results[domain]
+                    records = {label: answers[label] for label, _, _ in self.record_queries}
+                    yield domain, records, failures
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the DNS answer cache used by DNSCollector. Answers are kept in an
+in-process LRU and, optionally, in Redis so every worker shares them. Each answer is kept for its
+record TTL, and NXDOMAIN/NoAnswer results are cached for the zone's SOA minimum (RFC 2308). The
+zone SOA and NS records carried in the authority section of any answer are cached for the zone too.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from modules import metrics
+from modules.redis_store import get_connection
+
+
+# Cache hits and misses by tier (memory or redis)
+cache_requests = metrics.Counter('shepherd_dns_cache_requests_total',
+                                 'DNS answer cache lookups by tier and result (hit or miss).', ['tier', 'result'])
+zone_records_cached = metrics.Counter('shepherd_dns_cache_zone_records_total',
+                                      'Zone SOA and NS record sets cached from the authority section of other answers.',
+                                      ['record_type'])
+cache_entries = metrics.Gauge('shepherd_dns_cache_entries',
+                              'Answers held in the in-process DNS cache at the end of the most recent DNS update.')
+last_sweep_hit_ratio = metrics.Gauge('shepherd_dns_cache_last_sweep_hit_ratio',
+                                     'Share of DNS lookups answered from the cache during the most recent DNS update.')
+
+
+class DNSAnswerCache(object):
+    """Class to cache DNS answers for their TTL. Entries are dictionaries with a `status` of ok,
+    nxdomain, or noanswer, the answer's `values` as text, and the time the entry `expires`.
+    """
+
+    def __init__(self, max_entries=10000, use_redis=False, min_ttl=0, max_ttl=86400, negative_ttl=300):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        max_entries     Entries kept in the in-process LRU
+        use_redis       Also store answers in Redis so all workers share them
+        min_ttl         Shortest time in seconds an answer is cached
+        max_ttl         Longest time in seconds an answer is cached
+        negative_ttl    Seconds to cache NXDOMAIN/NoAnswer when the SOA minimum is unknown
+        """
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {'memory': 0, 'redis': 0}
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, config):
+        """Build a cache from the `DNS_CONFIG` settings dictionary."""
+        return cls(max_entries=config.get('cache_entries', 10000),
+                   use_redis=config.get('cache_redis', False),
+                   min_ttl=config.get('cache_min_ttl', 0),
+                   max_ttl=config.get('cache_max_ttl', 86400),
+                   negative_ttl=config.get('cache_negative_ttl', 300))
+
+    def key(self, name, record_type):
+        """Return the cache key for a query."""
+        return 'shepherd:dns:{}:{}'.format(name.lower().rstrip('.'), record_type.upper())
+
+    def clamp(self, ttl):
+        """Keep a TTL within the configured bounds."""
+        return max(self.min_ttl, min(self.max_ttl, ttl))
+
+    def get(self, name, record_type):
+        """Return the unexpired entry for the query, or None on a miss."""
+        key = self.key(name, record_type)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry['expires'] > now:
+                self.entries.move_to_end(key)
+                self.hits['memory'] += 1
+                cache_requests.inc(tier='memory', result='hit')
+                return entry
+            if entry:
+                del self.entries[key]
+        cache_requests.inc(tier='memory', result='miss')
+        if self.use_redis:
+            connection = get_connection()
+            if connection:
+                try:
+                    data = connection.get(key)
+                except Exception as error:
+                    print('[!] Could not read the DNS cache from Redis: {}'.format(error))
+                    data = None
+                if data:
+                    entry = json.loads(data)
+                    self._store_local(key, entry)
+                    with self.lock:
+                        self.hits['redis'] += 1
+                    cache_requests.inc(tier='redis', result='hit')
+                    return entry
+                cache_requests.inc(tier='redis', result='miss')
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, name, record_type, status, values, ttl):
+        """Cache the result of a query for its TTL.
+
+        Parameters:
+        name            The queried name
+        record_type     The queried record type
+        status          ok, nxdomain, or noanswer
+        values          List of record values as text (empty for negative answers)
+        ttl             The record TTL, or the SOA minimum for negative answers
+        """
+        ttl = self.clamp(ttl)
+        if ttl <= 0:
+            return
+        key = self.key(name, record_type)
+        entry = {'status': status, 'values': values, 'expires': time.time() + ttl}
+        self._store_local(key, entry)
+        if self.use_redis:
+            connection = get_connection()
+            if connection:
+                try:
+                    connection.set(key, json.dumps(entry), ex=int(ttl))
+                except Exception as error:
+                    print('[!] Could not write the DNS cache to Redis: {}'.format(error))
+
+    def _store_local(self, key, entry):
+        """Add an entry to the in-process LRU, evicting the least recently used entries."""
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry from the in-process LRU."""
+        with self.lock:
+            self.entries.clear()
+
+    def publish(self, before=None):
+        """Publish the cache size and the hit ratio since an earlier stats() snapshot as metrics.
+
+        Parameters:
+        before          Optional result of stats() taken when the sweep started
+        """
+        stats = self.stats()
+        hits = stats['memory_hits'] + stats['redis_hits']
+        misses = stats['misses']
+        if before:
+            hits -= before['memory_hits'] + before['redis_hits']
+            misses -= before['misses']
+        cache_entries.set(stats['entries'])
+        if hits + misses:
+            last_sweep_hit_ratio.set(round(hits / (hits + misses), 3))
+        return stats
+
+    def stats(self):
+        """Return the hit and miss counts for this process."""
+        with self.lock:
+            lookups = self.hits['memory'] + self.hits['redis'] + self.misses
+            return {
+                    'entries': len(self.entries),
+                    'memory_hits': self.hits['memory'],
+                    'redis_hits': self.hits['redis'],
+                    'misses': self.misses,
+                    'hit_rate': round((lookups - self.misses) / lookups, 3) if lookups else None,
+                   }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains a small authoritative DNS server that stands in for the real internet when
+benchmarking DNS updates. It serves synthetic zones (or zone files) over UDP and can be told to
+answer slowly, drop queries, or answer with SERVFAIL so failover can be tested offline.
+"""
+
+import time
+import random
+import threading
+import ipaddress
+import socketserver
+
+import dns.flags
+import dns.zone
+import dns.rcode
+import dns.rrset
+import dns.message
+import dns.rdatatype
+import dns.exception
+
+
+class SyntheticZones(object):
+    """Class holding the records served by the stand-in server."""
+
+    def __init__(self):
+        """Everything that should be initiated with a new object goes here."""
+        # Record sets keyed by (lowercase absolute name, record type)
+        self.records = {}
+        # Every name that exists, so NXDOMAIN and NoAnswer can be told apart
+        self.names = set()
+        # SOA record sets keyed by zone apex, used in the authority section of negative answers
+        self.soas = {}
+        self.domains = []
+
+    def add(self, name, record_type, ttl, *values):
+        """Add a record set for the name.
+
+        Parameters:
+        name            Absolute name as text (e.g. example.test.)
+        record_type     The record type as text (e.g. A)
+        ttl             The record TTL in seconds
+        values          The record values as zone file text
+        """
+        name = name.lower()
+        rrset = dns.rrset.from_text(name, ttl, 'IN', record_type, *values)
+        self.records[(name, rrset.rdtype)] = rrset
+        self.names.add(name)
+        if rrset.rdtype == dns.rdatatype.SOA:
+            self.soas[name] = rrset
+
+    @classmethod
+    def generate(cls, count, seed=0, suffix='bench.test', ttl=300):
+        """Build zones for `count` synthetic domains named like `shepherd-00001.bench.test`. Each
+        gets NS, A, MX, TXT, and SOA records and most also get a `_dmarc` record. Addresses come
+        from the 198.18.0.0/15 benchmarking range.
+
+        Parameters:
+        count           Number of domains to generate
+        seed            Seed for the random record contents
+        suffix          Parent name of the synthetic domains
+        ttl             TTL of every generated record
+        """
+        zones = cls()
+        generator = random.Random(seed)
+        network = ipaddress.ip_network('198.18.0.0/15')
+        for index in range(count):
+            domain = 'shepherd-{:05d}.{}.'.format(index, suffix)
+            addresses = [str(network[generator.randrange(1, network.num_addresses - 1)])
+                         for _ in range(generator.randint(1, 3))]
+            zones.add(domain, 'SOA', ttl, 'ns1.{0} hostmaster.{0} {1} 7200 3600 1209600 300'.format(domain, index + 1))
+            zones.add(domain, 'NS', ttl, 'ns1.' + domain, 'ns2.' + domain)
+            zones.add(domain, 'A', ttl, *addresses)
+            zones.add(domain, 'MX', ttl, '10 mail.' + domain)
+            zones.add(domain, 'TXT', ttl, '"v=spf1 mx -all"')
+            if generator.random() < 0.7:
+                zones.add('_dmarc.' + domain, 'TXT', ttl, '"v=DMARC1; p=none"')
+            zones.domains.append(domain.rstrip('.'))
+        return zones
+
+    def load_zone_file(self, path, origin=None):
+        """Add every record in a zone file.
+
+        Parameters:
+        path            Path to the zone file
+        origin          Zone origin, if the file has no $ORIGIN line
+        """
+        zone = dns.zone.from_file(path, origin, relativize=False)
+        for name, node in zone.nodes.items():
+            for rdataset in node.rdatasets:
+                rrset = dns.rrset.from_rdata_list(name, rdataset.ttl, list(rdataset))
+                key = name.to_text().lower()
+                self.records[(key, rrset.rdtype)] = rrset
+                self.names.add(key)
+                if rrset.rdtype == dns.rdatatype.SOA:
+                    self.soas[key] = rrset
+        self.domains.append(zone.origin.to_text().rstrip('.'))
+
+    def zone_soa(self, name):
+        """Return the SOA record set of the closest zone containing the name, or None."""
+        labels = name.split('.')
+        for index in range(len(labels)):
+            soa = self.soas.get('.'.join(labels[index:]))
+            if soa:
+                return soa
+        return None
+
+    def answer(self, query):
+        """Return the response message for a query message."""
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        question = query.question[0]
+        name = question.name.to_text().lower()
+        rrset = self.records.get((name, question.rdtype))
+        if rrset:
+            response.answer.append(rrset)
+            return response
+        if name not in self.names:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        soa = self.zone_soa(name)
+        if soa:
+            response.authority.append(soa)
+        return response
+
+
+class StandInRequestHandler(socketserver.BaseRequestHandler):
+    """Class to answer one UDP query from the server's zones."""
+
+    def handle(self):
+        """Answer the query, unless the server's failure settings say to drop or fail it."""
+        data, sock = self.request
+        server = self.server
+        try:
+            query = dns.message.from_wire(data)
+        except dns.exception.DNSException:
+            return
+        roll = server.random.random()
+        # Dropped queries are never answered, so the client sees a timeout
+        if roll < server.drop_rate:
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        if roll < server.drop_rate + server.servfail_rate:
+            response = dns.message.make_response(query)
+            response.set_rcode(dns.rcode.SERVFAIL)
+        else:
+            response = server.zones.answer(query)
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+class StandInDNSServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
+    """Class for a threaded UDP server answering queries from a SyntheticZones instance."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, zones, delay=0, drop_rate=0, servfail_rate=0, seed=None):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        address         (host, port) tuple to listen on; port 0 picks a free port
+        zones           The SyntheticZones to serve
+        delay           Seconds to wait before answering each query
+        drop_rate       Fraction of queries (0 to 1) left unanswered
+        servfail_rate   Fraction of queries (0 to 1) answered with SERVFAIL
+        seed            Seed for choosing which queries are dropped or failed
+        """
+        super(StandInDNSServer, self).__init__(address, StandInRequestHandler)
+        self.zones = zones
+        self.delay = delay
+        self.drop_rate = drop_rate
+        self.servfail_rate = servfail_rate
+        self.random = random.Random(seed)
+
+    @property
+    def resolver_address(self):
+        """Return the server as an `address:port` string for the `resolvers` setting."""
+        host, port = self.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    def start(self):
+        """Serve queries from a background thread and return the thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
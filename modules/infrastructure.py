@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module maintains the infrastructure overlap index: the InfrastructureLink rows that map
+each IP address, name server, and mail host to the domains using it. DNS updates and the
+VirusTotal passive DNS results from health checks feed it incrementally, so only new and removed
+links are written.
+
+The Shared Infrastructure report groups every link, so its rows are cached (in Redis, or Django's
+cache if Redis is not available) until the links change, the same way as the dashboard counts.
+"""
+
+from django.db import transaction
+from django.db.models import Count
+
+from catalog.models import InfrastructureLink
+from modules.redis_store import get_json, set_json, incr
+
+
+# Record types that identify infrastructure and the kind of link each one creates
+RECORD_KINDS = {'A': 'ip', 'NS': 'ns', 'MX': 'mx'}
+# The overlap report is rebuilt at least this often, as a safety net for links changed outside
+# update_links() (e.g. deleted in the admin panel)
+OVERLAP_TTL = 3600
+OVERLAP_VERSION_KEY = 'shepherd:overlap:version'
+
+
+def normalize(kind, value):
+    """Return the indexed form of a record value. MX records drop their priority and host names
+    are lowercased without the trailing dot so `Mail.Example.com.` and `mail.example.com` match.
+
+    Parameters:
+    kind            The link kind (ip, ns, or mx)
+    value           The record value as returned by DNS
+    """
+    value = value.strip()
+    if kind == 'mx' and ' ' in value:
+        value = value.split()[-1]
+    return value.rstrip('.').lower()
+
+
+def links_from_records(records, failures=()):
+    """Return a dictionary of link kind to {value: None} for a domain's DNS records. Record types
+    whose query failed are left out so their stored links are kept.
+
+    Parameters:
+    records         Dictionary of record label to (list of values, TTL), as yielded by
+                    DNSCollector.collect_many()
+    failures        Labels whose queries failed
+    """
+    links = {}
+    for record_type, kind in RECORD_KINDS.items():
+        if record_type in records and record_type not in failures:
+            values, _ = records[record_type]
+            links[kind] = {normalize(kind, value): None for value in values if value.strip()}
+    return links
+
+
+def update_links(source, observations):
+    """Bring the stored links from one source in line with fresh observations, writing only the
+    differences. Returns a tuple of the number of links added and removed.
+
+    Parameters:
+    source          The link source (dns or passive_dns)
+    observations    Dictionary of domain ID to {kind: {value: last resolved date or None}}; every
+                    stored link of a listed kind is replaced and kinds left out are not touched
+    """
+    if not observations:
+        return 0, 0
+    stored = {}
+    stored_links = InfrastructureLink.objects.filter(source=source, domain_id__in=list(observations))
+    for link_id, domain_id, kind, value, last_resolved in stored_links.values_list(
+            'id', 'domain_id', 'kind', 'value', 'last_resolved'):
+        stored.setdefault(domain_id, {}).setdefault(kind, {})[value] = (link_id, last_resolved)
+    new_links = []
+    removed_ids = []
+    changed_links = []
+    for domain_id, kinds in observations.items():
+        for kind, values in kinds.items():
+            old_values = stored.get(domain_id, {}).get(kind, {})
+            for value, last_resolved in values.items():
+                if value not in old_values:
+                    new_links.append(InfrastructureLink(domain_id=domain_id, kind=kind, value=value,
+                                                        source=source, last_resolved=last_resolved))
+                elif last_resolved and old_values[value][1] != last_resolved:
+                    changed_links.append(InfrastructureLink(id=old_values[value][0], last_resolved=last_resolved))
+            removed_ids.extend(link_id for value, (link_id, _) in old_values.items() if value not in values)
+    if new_links or removed_ids or changed_links:
+        with transaction.atomic():
+            InfrastructureLink.objects.filter(id__in=removed_ids).delete()
+            InfrastructureLink.objects.bulk_create(new_links)
+            InfrastructureLink.objects.bulk_update(changed_links, ['last_resolved'])
+        if new_links or removed_ids:
+            transaction.on_commit(invalidate_overlap)
+    return len(new_links), len(removed_ids)
+
+
+def invalidate_overlap():
+    """Bump the version of the cached overlap report so the next page view regroups the links."""
+    incr(OVERLAP_VERSION_KEY)
+
+
+def get_overlap(kind=None):
+    """Return the infrastructure used by more than one domain as a list of dictionaries with the
+    `kind`, `value`, and `domain_count`, most shared first. Every kind is grouped with one query
+    and cached until the links change.
+
+    Parameters:
+    kind            Only return this kind of infrastructure (ip, ns, or mx)
+    """
+    key = 'shepherd:overlap:{}'.format(get_json(OVERLAP_VERSION_KEY) or 0)
+    overlap = get_json(key)
+    if overlap is None:
+        overlap = list(InfrastructureLink.objects.values('kind', 'value').annotate(
+            domain_count=Count('domain', distinct=True)).filter(domain_count__gt=1).order_by(
+            '-domain_count', 'kind', 'value'))
+        set_json(key, overlap, OVERLAP_TTL)
+    if kind:
+        overlap = [row for row in overlap if row['kind'] == kind]
+    return overlap
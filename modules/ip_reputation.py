@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the offline IP reputation engine used to flag the passive DNS addresses
+of a domain. IP and CIDR blocklist feeds are downloaded (or read from disk), refreshed only when
+they change, and merged into sorted, non-overlapping address intervals. Looking up an address is
+a binary search, so checking an IP takes microseconds and needs no network request.
+"""
+
+import os
+import json
+import time
+import bisect
+import hashlib
+import ipaddress
+import threading
+
+import requests
+
+
+def parse_feed(text):
+    """Return the list of networks in a blocklist feed. Each line holds an IP address, a CIDR
+    block, or a `first-last` address range; anything after `#` or `;` is a comment and lines that
+    do not parse are skipped.
+
+    Parameters:
+    text            The feed's contents
+    """
+    networks = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].split(';', 1)[0].strip()
+        if not line:
+            continue
+        token = line.split()[0]
+        try:
+            if '-' in token:
+                first, last = (ipaddress.ip_address(part.strip()) for part in token.split('-', 1))
+                networks.extend(ipaddress.summarize_address_range(first, last))
+            else:
+                networks.append(ipaddress.ip_network(token, strict=False))
+        except ValueError:
+            continue
+    return networks
+
+
+class IntervalIndex(object):
+    """Class holding sorted, non-overlapping address intervals for one IP version. Each interval
+    carries the names of the feeds that list it, so overlapping entries from different feeds are
+    split rather than merged into one over-broad block.
+    """
+
+    def __init__(self, intervals):
+        """Build the index.
+
+        Parameters:
+        intervals       Iterable of (first address, last address, feed name) with addresses as
+                        integers
+        """
+        # Sweep over every boundary, tracking how many entries from each feed cover the position
+        events = []
+        for first, last, feed in intervals:
+            events.append((first, 1, feed))
+            events.append((last + 1, -1, feed))
+        events.sort(key=lambda event: (event[0], event[1]))
+        self.starts = []
+        self.ends = []
+        self.feeds = []
+        active = {}
+        position = None
+        for point, change, feed in events:
+            if position is not None and point > position and active:
+                self._append(position, point - 1, tuple(sorted(active)))
+            active[feed] = active.get(feed, 0) + change
+            if not active[feed]:
+                del active[feed]
+            position = point
+
+    def _append(self, first, last, feeds):
+        """Add an interval, extending the previous one when it is adjacent with the same feeds."""
+        if self.ends and self.ends[-1] + 1 == first and self.feeds[-1] == feeds:
+            self.ends[-1] = last
+        else:
+            self.starts.append(first)
+            self.ends.append(last)
+            self.feeds.append(feeds)
+
+    def lookup(self, address):
+        """Return the names of the feeds listing the address (as an integer), or an empty tuple."""
+        position = bisect.bisect_right(self.starts, address) - 1
+        if position >= 0 and address <= self.ends[position]:
+            return self.feeds[position]
+        return ()
+
+    def __len__(self):
+        """Return the number of intervals in the index."""
+        return len(self.starts)
+
+
+class IPReputation(object):
+    """Class to check IP addresses against locally indexed blocklist feeds."""
+
+    def __init__(self, feeds=None, refresh_interval=3600, cache_dir=None, request_timeout=30):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        feeds           List of dictionaries with a `name` and either a `url` or a `path`
+        refresh_interval Seconds before a feed is checked for changes again
+        cache_dir       Directory where downloaded feeds are kept between runs
+        request_timeout Seconds to wait for a feed download
+        """
+        self.feeds = feeds or []
+        self.refresh_interval = refresh_interval
+        self.cache_dir = cache_dir
+        self.request_timeout = request_timeout
+        self.lock = threading.Lock()
+        # Parsed networks, the time each feed was last checked, and its HTTP validators
+        self.networks = {}
+        self.checked = {}
+        self.validators = {}
+        self.indexes = {4: IntervalIndex([]), 6: IntervalIndex([])}
+        self.loaded = 0
+
+    @classmethod
+    def from_settings(cls, config, base_dir=None):
+        """Build the engine from the `IP_REPUTATION_CONFIG` settings dictionary."""
+        cache_dir = config.get('cache_dir') or (os.path.join(base_dir, 'ip_feeds') if base_dir else None)
+        return cls(feeds=config.get('feeds', []),
+                   refresh_interval=config.get('refresh_interval', 3600),
+                   cache_dir=cache_dir,
+                   request_timeout=config.get('request_timeout', 30))
+
+    @property
+    def enabled(self):
+        """Return True if any feeds are configured."""
+        return bool(self.feeds)
+
+    @property
+    def ready(self):
+        """Return True if at least one feed has been loaded. An engine with feeds configured that
+        could not load any of them lists no addresses, so its lookups must not be trusted.
+        """
+        return bool(self.networks)
+
+    def cache_path(self, feed):
+        """Return the path of the local copy of a downloaded feed."""
+        digest = hashlib.sha1(feed['url'].encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, '{}-{}.txt'.format(feed['name'], digest))
+
+    def fetch(self, feed):
+        """Return the feed's text if it changed since it was last loaded, otherwise None. URL feeds
+        are requested with the validators of the previous download, so an unchanged feed costs one
+        `304 Not Modified` response; file feeds are re-read only when their modification time
+        changes.
+
+        Parameters:
+        feed            The feed's settings dictionary
+        """
+        name = feed['name']
+        if feed.get('path'):
+            modified = os.path.getmtime(feed['path'])
+            if self.validators.get(name) == modified:
+                return None
+            with open(feed['path']) as feed_file:
+                text = feed_file.read()
+            self.validators[name] = modified
+            return text
+        cached = self.cache_path(feed) if self.cache_dir else None
+        if name not in self.validators and cached and os.path.exists(cached + '.json'):
+            # Pick up the copy saved by a previous run so an unchanged feed is not downloaded again
+            with open(cached + '.json') as meta_file:
+                self.validators[name] = json.load(meta_file)
+        headers = {}
+        validators = self.validators.get(name) or {}
+        if name in self.networks or (cached and os.path.exists(cached)):
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        response = requests.get(feed['url'], headers=headers, timeout=self.request_timeout)
+        if response.status_code == 304:
+            if name in self.networks:
+                return None
+            with open(cached) as cached_file:
+                return cached_file.read()
+        response.raise_for_status()
+        self.validators[name] = {'etag': response.headers.get('ETag'),
+                                 'last_modified': response.headers.get('Last-Modified')}
+        if cached:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(cached, 'w') as cached_file:
+                cached_file.write(response.text)
+            with open(cached + '.json', 'w') as meta_file:
+                json.dump(self.validators[name], meta_file)
+        return response.text
+
+    def refresh(self, force=False):
+        """Check every feed that is due for a refresh and rebuild the index if any changed. A feed
+        that cannot be fetched keeps its previous networks. Returns the names of the feeds that
+        changed.
+
+        Parameters:
+        force           Check every feed now, even if its refresh interval has not passed
+        """
+        changed = []
+        with self.lock:
+            now = time.time()
+            for feed in self.feeds:
+                name = feed['name']
+                if not force and now - self.checked.get(name, 0) < self.refresh_interval:
+                    continue
+                self.checked[name] = now
+                try:
+                    text = self.fetch(feed)
+                except Exception as error:
+                    print('[!] Could not refresh the {} IP reputation feed: {}'.format(name, error))
+                    continue
+                if text is not None:
+                    self.networks[name] = parse_feed(text)
+                    changed.append(name)
+            if changed:
+                self.rebuild()
+        return changed
+
+    def rebuild(self):
+        """Rebuild the interval indexes from the parsed networks of every feed."""
+        intervals = {4: [], 6: []}
+        for name, networks in self.networks.items():
+            for network in networks:
+                intervals[network.version].append(
+                    (int(network.network_address), int(network.broadcast_address), name))
+        self.indexes = {version: IntervalIndex(entries) for version, entries in intervals.items()}
+        self.loaded = time.time()
+        print('[*] Indexed {} IP reputation entries from {} feeds into {} intervals.'.format(
+            sum(len(networks) for networks in self.networks.values()), len(self.networks),
+            sum(len(index) for index in self.indexes.values())))
+
+    def lookup(self, address):
+        """Return the names of the feeds that list the IP address, or an empty tuple. Invalid
+        addresses are never listed.
+
+        Parameters:
+        address         The IP address as text
+        """
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return ()
+        return self.indexes[address.version].lookup(int(address))
+
+    def stats(self):
+        """Return the number of networks per feed and the size of the index."""
+        return {
+                'feeds': {name: len(networks) for name, networks in self.networks.items()},
+                'ipv4_intervals': len(self.indexes[4]),
+                'ipv6_intervals': len(self.indexes[6]),
+                'loaded': self.loaded,
+               }
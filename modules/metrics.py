@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the counters and histograms Shepherd exposes at `/metrics` in the
+Prometheus text exposition format. Values are kept in Redis hashes so the numbers recorded by
+every Django Q worker process are aggregated into one set of series. Without Redis each process
+only keeps its own values.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+from modules.redis_store import get_connection
+
+
+# Default histogram buckets, in seconds, sized for slow web lookups
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# All metrics, in the order they are rendered
+REGISTRY = []
+
+# Process-local values used when Redis is unavailable
+_local_values = {}
+_local_lock = threading.Lock()
+
+
+def escape_label(value):
+    """Escape a label value for the exposition format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    """Return the `{name="value",...}` body (without braces) for a list of label pairs."""
+    return ','.join('{}="{}"'.format(name, escape_label(value)) for name, value in labels)
+
+
+def format_number(value):
+    """Format a sample value the way Prometheus expects (integers without a trailing .0)."""
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric(object):
+    """Base class for a named metric with a fixed set of label names."""
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        name            The metric name (e.g. shepherd_provider_requests_total)
+        documentation   The HELP text
+        labelnames      Names of the labels every sample must provide
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.key = 'shepherd:metrics:{}'.format(name)
+        REGISTRY.append(self)
+
+    def label_pairs(self, labels):
+        """Return the label pairs for a sample, in declared order."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects labels {}'.format(self.name, self.labelnames))
+        return [(name, labels[name]) for name in self.labelnames]
+
+    def field(self, suffix, pairs):
+        """Return the hash field used to store one series."""
+        return '{}\t{}'.format(suffix, format_labels(pairs))
+
+    def write(self, increments=None, values=None):
+        """Apply increments (field -> amount) and absolute values (field -> value) to the store.
+        Metrics must never break the code being measured, so storage errors are only printed.
+        """
+        connection = get_connection()
+        if connection:
+            try:
+                pipeline = connection.pipeline(transaction=False)
+                for field, amount in (increments or {}).items():
+                    pipeline.hincrbyfloat(self.key, field, amount)
+                for field, value in (values or {}).items():
+                    pipeline.hset(self.key, field, value)
+                pipeline.execute()
+                return
+            except Exception as error:
+                print('[!] Could not record metric {}: {}'.format(self.name, error))
+        with _local_lock:
+            store = _local_values.setdefault(self.key, {})
+            for field, amount in (increments or {}).items():
+                store[field] = store.get(field, 0) + amount
+            store.update(values or {})
+
+    def read(self):
+        """Return every stored series for the metric as a dictionary of field -> float."""
+        connection = get_connection()
+        if connection:
+            try:
+                return {field.decode(): float(value) for field, value in connection.hgetall(self.key).items()}
+            except Exception as error:
+                print('[!] Could not read metric {}: {}'.format(self.name, error))
+        with _local_lock:
+            return dict(_local_values.get(self.key, {}))
+
+    def samples(self, values):
+        """Return (name, labels, value) tuples for the exposition format."""
+        samples = []
+        for field in sorted(values):
+            suffix, labels = field.split('\t', 1)
+            samples.append((self.name + suffix, labels, values[field]))
+        return samples
+
+    def render(self):
+        """Return the metric in the text exposition format."""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.metric_type)]
+        for name, labels, value in self.samples(self.read()):
+            if labels:
+                lines.append('{}{{{}}} {}'.format(name, labels, format_number(value)))
+            else:
+                lines.append('{} {}'.format(name, format_number(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up, like the number of requests sent to a provider."""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Increment the counter for the given labels."""
+        self.write(increments={self.field('', self.label_pairs(labels)): amount})
+
+
+class Gauge(Metric):
+    """A value that is set to the latest measurement, like the domains burned by the last sweep."""
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the gauge for the given labels."""
+        self.write(values={self.field('', self.label_pairs(labels)): value})
+
+
+class Histogram(Metric):
+    """A distribution of observed values, like provider response times."""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        buckets         Upper bounds of the histogram buckets; +Inf is always added
+        """
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """Record one observation for the given labels."""
+        pairs = self.label_pairs(labels)
+        increments = {self.field('_sum', pairs): value, self.field('_count', pairs): 1}
+        for bound in self.buckets:
+            if value <= bound:
+                increments[self.field('_bucket', pairs + [('le', format_number(bound))])] = 1
+        self.write(increments=increments)
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes how long the wrapped block took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, values):
+        """Return the bucket, sum, and count samples, with buckets in ascending order."""
+        samples = []
+        for field in sorted(values):
+            suffix, labels = field.split('\t', 1)
+            if suffix != '_count':
+                continue
+            prefix = labels + ',' if labels else ''
+            for bound in self.buckets:
+                bucket_labels = prefix + 'le="{}"'.format(format_number(bound))
+                samples.append((self.name + '_bucket', bucket_labels, values.get('_bucket\t' + bucket_labels, 0)))
+            samples.append((self.name + '_sum', labels, values.get('_sum\t' + labels, 0)))
+            samples.append((self.name + '_count', labels, values[field]))
+        return samples
+
+
+def render_metrics():
+    """Return every registered metric in the text exposition format."""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Reputation provider lookups made by DomainReview
+provider_requests = Counter('shepherd_provider_requests_total',
+                            'Provider lookups by outcome (ok, error, captcha, skipped).', ['provider', 'status'])
+provider_latency = Histogram('shepherd_provider_latency_seconds',
+                             'Time taken by each provider lookup.', ['provider'])
+provider_captchas = Counter('shepherd_provider_captchas_total',
+                            'Provider lookups answered with a CAPTCHA or rate-limit response.', ['provider'])
+proxy_benched = Counter('shepherd_proxy_benched_total',
+                        'Times an egress proxy was benched (circuit breaker tripped).', ['proxy', 'reason'])
+# DNS queries made by DNSCollector
+dns_queries = Counter('shepherd_dns_queries_total',
+                      'DNS queries by record type and result.', ['record_type', 'result'])
+dns_latency = Histogram('shepherd_dns_query_latency_seconds',
+                        'Time taken by each DNS query.', ['record_type'],
+                        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+dns_resolver_queries = Counter('shepherd_dns_resolver_queries_total',
+                               'DNS queries sent to each upstream resolver by result.', ['resolver', 'result'])
+dns_record_changes = Counter('shepherd_dns_record_changes_total',
+                             'DNS records added to or removed from domains by DNS updates.', ['record_type', 'action'])
+# Registrar inventory syncs
+registrar_sync_domains = Counter('shepherd_registrar_sync_domains_total',
+                                 'Domains created, updated, or skipped by registrar syncs.', ['provider', 'result'])
+# Sweeps run by the tasks in tasks.py
+sweep_duration = Histogram('shepherd_sweep_duration_seconds',
+                           'Time taken by each sweep over the domain catalog.', ['sweep'],
+                           buckets=(60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400))
+sweep_domains = Counter('shepherd_sweep_domains_total',
+                        'Domains processed by sweeps.', ['sweep'])
+domains_burned = Counter('shepherd_domains_burned_total',
+                         'Domains flagged as burned by health sweeps.')
+last_sweep_burned = Gauge('shepherd_last_sweep_burned_domains',
+                          'Domains flagged as burned by the most recent health sweep.')
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the outbound notification queue. Messages are queued as Notification rows,
+one per destination channel, so a sweep never waits on Slack. The notification task later posts
+each channel's pending messages as one digest, and a post that fails is retried with exponential
+backoff until it succeeds or runs out of attempts.
+"""
+
+import json
+import uuid
+import datetime
+
+import requests
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from catalog.models import Notification
+
+
+def get_config():
+    """Return the Slack settings with defaults for the queue options."""
+    try:
+        config = dict(settings.SLACK_CONFIG)
+    except AttributeError:
+        config = {}
+    config.setdefault('enable_slack', False)
+    config.setdefault('digest_size', 20)
+    config.setdefault('max_attempts', 6)
+    config.setdefault('retry_backoff', 30)
+    config.setdefault('retry_backoff_max', 3600)
+    config.setdefault('request_timeout', 10)
+    return config
+
+
+def queue_notification(message, channels=None):
+    """Queue a message for the global Slack channel and any extra channels. Returns the number of
+    messages queued, which is 0 when Slack is disabled.
+
+    Parameters:
+    message         The message text
+    channels        Extra channels (e.g. a project's channel) that should also get the message
+    """
+    config = get_config()
+    if not config['enable_slack']:
+        return 0
+    destinations = [config.get('slack_channel')] + list(channels or [])
+    # Keep the order but post only once to a channel that is listed twice
+    destinations = [channel for number, channel in enumerate(destinations)
+                    if channel and channel not in destinations[:number]]
+    Notification.objects.bulk_create([Notification(channel=channel, message=message) for channel in destinations])
+    return len(destinations)
+
+
+def build_digest(messages, digest_size):
+    """Return the text of a digest of messages. Up to `digest_size` messages are listed and the rest
+    are counted, so a mass burn produces one readable post instead of a flood.
+
+    Parameters:
+    messages        List of message texts, oldest first
+    digest_size     The most messages to list in full
+    """
+    if len(messages) == 1:
+        return messages[0]
+    lines = ['{} notifications:'.format(len(messages))]
+    lines.extend('• ' + message for message in messages[:digest_size])
+    if len(messages) > digest_size:
+        lines.append('…and {} more. Check Shepherd for the full list.'.format(len(messages) - digest_size))
+    return '\n'.join(lines)
+
+
+def post_to_slack(channel, text, config):
+    """Post a message to a Slack channel through the webhook. Raises an exception if Slack does not
+    accept it.
+
+    Parameters:
+    channel         The Slack channel
+    text            The message text
+    config          The Slack settings from get_config()
+    """
+    slack_data = {
+                'username': config['slack_username'],
+                'icon_emoji': config['slack_emoji'],
+                'channel': channel,
+                'text': '{} {}'.format(config.get('slack_alert_target', ''), text).strip()
+                }
+    response = requests.post(config['slack_webhook_url'], data=json.dumps(slack_data),
+                             headers={'Content-Type': 'application/json'}, timeout=config['request_timeout'])
+    if response.status_code != 200:
+        raise ValueError('Slack returned an error {}: {}'.format(response.status_code, response.text[:200]))
+
+
+def deliver_notifications():
+    """Post the due messages of every channel as one digest per channel. Messages are claimed before
+    posting, so two workers never post the same message. A failed post is retried after a backoff
+    that doubles with each attempt. Returns a tuple of the number of messages sent, the number
+    still pending, and the time of the next retry (or None).
+    """
+    config = get_config()
+    now = timezone.now()
+    due = Notification.objects.filter(status='pending', next_attempt__lte=now)
+    sent = 0
+    for channel in list(due.order_by().values_list('channel', flat=True).distinct()):
+        claim = uuid.uuid4().hex
+        # Hold the claimed messages for longer than a post can take, in case this worker dies
+        lease = now + datetime.timedelta(seconds=config['request_timeout'] * 3 + 60)
+        due_ids = list(due.filter(channel=channel).values_list('id', flat=True))
+        Notification.objects.filter(id__in=due_ids, status='pending', next_attempt__lte=now).update(
+            claim=claim, next_attempt=lease)
+        notifications = list(Notification.objects.filter(claim=claim).order_by('created_at', 'id'))
+        if not notifications:
+            continue
+        try:
+            post_to_slack(channel, build_digest([notification.message for notification in notifications],
+                                                config['digest_size']), config)
+        except Exception as error:
+            print('[!] Could not post {} notifications to {}: {}'.format(len(notifications), channel, error))
+            for notification in notifications:
+                notification.attempts += 1
+                notification.last_error = str(error)
+                notification.claim = None
+                if notification.attempts >= config['max_attempts']:
+                    notification.status = 'failed'
+                else:
+                    backoff = min(config['retry_backoff'] * 2 ** (notification.attempts - 1), config['retry_backoff_max'])
+                    notification.next_attempt = timezone.now() + datetime.timedelta(seconds=backoff)
+            Notification.objects.bulk_update(notifications, ['attempts', 'last_error', 'claim', 'status', 'next_attempt'])
+            continue
+        Notification.objects.filter(claim=claim).update(status='sent', sent_at=timezone.now(), claim=None)
+        sent += len(notifications)
+    # Keep a week of delivered messages for troubleshooting
+    Notification.objects.filter(status='sent', sent_at__lt=now - datetime.timedelta(days=7)).delete()
+    pending = Notification.objects.filter(status='pending')
+    return sent, pending.count(), pending.aggregate(next_attempt=Min('next_attempt'))['next_attempt']
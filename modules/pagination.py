@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the keyset (cursor) pagination used by the catalog's list views. Instead
+of an OFFSET and a COUNT(*) over the whole list, each page starts after the last row of the page
+before it, following a unique ordering (e.g. status, name, ID). Every page costs the same however
+deep it is, and rows that change status while someone is paging are not shown twice or skipped.
+"""
+
+import json
+import base64
+import datetime
+
+from django.db.models import F, Q
+
+
+class KeysetPage(object):
+    """Class holding one page of a keyset paginated list."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count=None):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        object_list     The objects on this page
+        next_cursor     The cursor for the page after this one, or None on the last page
+        previous_cursor The cursor for the page before this one, or None on the first page
+        count           Approximate number of objects in the whole list, or None if unknown
+        """
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.is_keyset = True
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    """Class to split a queryset into pages with keyset pagination."""
+
+    def __init__(self, queryset, keys, per_page, count=None):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        queryset        The queryset to paginate
+        keys            Field lookups to order by, ascending (e.g. `domain_status__domain_status`,
+                        `name`); the primary key is added to make the ordering unique
+        per_page        Objects per page
+        count           Optional function returning the approximate number of objects, e.g.
+                        from cached counts, so the full list is never counted
+        """
+        self.keys = list(keys)
+        if 'pk' not in self.keys and 'id' not in self.keys:
+            self.keys.append('pk')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_function = count
+        self.keyset = True
+
+    def encode_cursor(self, obj):
+        """Return the opaque cursor for a page starting right after (or before) the object."""
+        values = []
+        for key in self.keys:
+            value = obj
+            for attribute in key.split('__'):
+                value = getattr(value, attribute, None) if value is not None else None
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            values.append(value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Return the list of key values in a cursor. Raises ValueError for a cursor that was not
+        made by this paginator.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        except Exception:
+            raise ValueError('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise ValueError('Invalid cursor')
+        return values
+
+    def beyond(self, values, forward):
+        """Return the filter for the rows after (or before) the cursor's row in the ordering. NULLs
+        sort first, so every database orders them the same way.
+        """
+        beyond = Q(pk__in=[])
+        equal = Q()
+        for key, value in zip(self.keys, values):
+            if value is None:
+                # Everything that is not NULL comes after a NULL and nothing comes before it
+                if forward:
+                    beyond |= equal & Q(**{'{}__isnull'.format(key): False})
+                equal &= Q(**{'{}__isnull'.format(key): True})
+            else:
+                if forward:
+                    beyond |= equal & Q(**{'{}__gt'.format(key): value})
+                else:
+                    beyond |= equal & (Q(**{'{}__lt'.format(key): value}) | Q(**{'{}__isnull'.format(key): True}))
+                equal &= Q(**{key: value})
+        return beyond
+
+    def ordering(self, forward):
+        """Return the order_by() expressions for paging forward or backward."""
+        if forward:
+            return [F(key).asc(nulls_first=True) for key in self.keys]
+        return [F(key).desc(nulls_last=True) for key in self.keys]
+
+    def page(self, after=None, before=None):
+        """Return the KeysetPage after the `after` cursor, before the `before` cursor, or the first
+        page if neither is set. Raises ValueError for an invalid cursor.
+
+        Parameters:
+        after           Cursor from the `next_cursor` of the page before the one wanted
+        before          Cursor from the `previous_cursor` of the page after the one wanted
+        """
+        forward = not before
+        queryset = self.queryset
+        if after or before:
+            queryset = queryset.filter(self.beyond(self.decode_cursor(after or before), forward))
+        rows = list(queryset.order_by(*self.ordering(forward))[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if forward:
+            next_cursor = self.encode_cursor(rows[-1]) if more else None
+            previous_cursor = self.encode_cursor(rows[0]) if after and rows else None
+        else:
+            next_cursor = self.encode_cursor(rows[-1]) if rows else None
+            previous_cursor = self.encode_cursor(rows[0]) if more else None
+        count = self.count_function() if self.count_function else None
+        return KeysetPage(rows, next_cursor, previous_cursor, count)
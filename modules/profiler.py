@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the profiler used to find out where the time goes during a domain health
+sweep. Each provider call and database flush is timed as a named section, and cProfile and
+tracemalloc can optionally be captured for each section.
+"""
+
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+
+class ProfileSection(object):
+    """Class holding the measurements collected for one named section (e.g. talos)."""
+
+    def __init__(self, name, use_cprofile=False):
+        """Everything that should be initiated with a new object goes here."""
+        self.name = name
+        self.durations = []
+        self.bytes_received = 0
+        self.peak_memory = 0
+        self.errors = 0
+        self.cprofile = cProfile.Profile() if use_cprofile else None
+
+    def summary(self):
+        """Return the calls, timing, bytes, and memory figures for the section."""
+        durations = sorted(self.durations)
+        calls = len(durations)
+        total = sum(durations)
+        return {
+                'section': self.name,
+                'calls': calls,
+                'errors': self.errors,
+                'total_seconds': round(total, 4),
+                'mean_seconds': round(total / calls, 4) if calls else 0,
+                'p95_seconds': round(durations[min(calls - 1, int(calls * 0.95))], 4) if calls else 0,
+                'max_seconds': round(durations[-1], 4) if calls else 0,
+                'bytes_received': self.bytes_received,
+                'peak_memory_bytes': self.peak_memory,
+               }
+
+    def top_functions(self, limit=15):
+        """Return the cProfile statistics for the section as text, sorted by cumulative time."""
+        if not self.cprofile:
+            return ''
+        output = io.StringIO()
+        stats = pstats.Stats(self.cprofile, stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+class ReviewProfiler(object):
+    """Class to time named sections of the review pipeline and write a per-section report."""
+
+    def __init__(self, use_cprofile=False, use_tracemalloc=False):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        use_cprofile    Capture a cProfile profile for each section
+        use_tracemalloc Track the peak memory allocated while each section runs
+        """
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+        self.sections = {}
+        self.active = None
+        self.started = time.time()
+        if use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def section(self, name):
+        """Return the named section, creating it on first use."""
+        if name not in self.sections:
+            self.sections[name] = ProfileSection(name, self.use_cprofile)
+        return self.sections[name]
+
+    @contextmanager
+    def measure(self, name):
+        """Context manager that times the wrapped block as one call of the named section.
+
+        Parameters:
+        name            The section name, usually a provider name or `db_flush`
+        """
+        section = self.section(name)
+        parent = self.active
+        self.active = section
+        if self.use_tracemalloc:
+            # reset_peak() is only available on Python 3.9+, so older versions report the sweep's peak
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        if section.cprofile:
+            section.cprofile.enable()
+        start = time.perf_counter()
+        try:
+            yield section
+        except Exception:
+            section.errors += 1
+            raise
+        finally:
+            section.durations.append(time.perf_counter() - start)
+            if section.cprofile:
+                section.cprofile.disable()
+            if self.use_tracemalloc:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                section.peak_memory = max(section.peak_memory, peak)
+            self.active = parent
+
+    def add_bytes(self, count):
+        """Count bytes received against the section that is currently running."""
+        if self.active:
+            self.active.bytes_received += count
+
+    def report(self):
+        """Return the summaries of all sections, slowest total time first."""
+        summaries = [section.summary() for section in self.sections.values()]
+        return sorted(summaries, key=lambda summary: summary['total_seconds'], reverse=True)
+
+    def write_report(self, path):
+        """Write the report to the given path. A path ending in `.json` gets JSON and anything
+        else gets a plain text table followed by the cProfile output for each section.
+        """
+        summaries = self.report()
+        elapsed = round(time.time() - self.started, 2)
+        with open(path, 'w') as report_file:
+            if path.endswith('.json'):
+                json.dump({'elapsed_seconds': elapsed, 'sections': summaries}, report_file, indent=2)
+                return
+            report_file.write('Review profile ({} seconds elapsed)\n\n'.format(elapsed))
+            report_file.write('{:<14}{:>7}{:>8}{:>12}{:>10}{:>10}{:>14}{:>14}\n'.format(
+                'Section', 'Calls', 'Errors', 'Total (s)', 'Mean (s)', 'p95 (s)', 'Bytes', 'Peak mem'))
+            for summary in summaries:
+                report_file.write('{:<14}{:>7}{:>8}{:>12}{:>10}{:>10}{:>14}{:>14}\n'.format(
+                    summary['section'], summary['calls'], summary['errors'], summary['total_seconds'],
+                    summary['mean_seconds'], summary['p95_seconds'], summary['bytes_received'],
+                    summary['peak_memory_bytes']))
+            if self.use_cprofile:
+                for summary in summaries:
+                    report_file.write('\n\n===== {} =====\n'.format(summary['section']))
+                    report_file.write(self.sections[summary['section']].top_functions())
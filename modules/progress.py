@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module publishes the progress of long-running sweeps (health checks and DNS updates) so
+the web application can show a live progress bar and an ETA based on measured throughput.
+Progress is stored in Redis, or Django's cache if Redis is not available.
+"""
+
+import time
+from collections import deque
+
+from modules.redis_store import get_json, set_json
+
+
+# How long progress is kept after the last update (a week, so the last sweep's throughput can
+# still be used to estimate the next one)
+PROGRESS_TTL = 7 * 24 * 60 * 60
+# Number of recent domains used for the rolling throughput
+THROUGHPUT_WINDOW = 25
+
+
+def progress_key(sweep):
+    """Return the storage key for the named sweep."""
+    return 'shepherd:progress:{}'.format(sweep)
+
+
+def get_progress(sweep):
+    """Return the last published progress dictionary for the named sweep, or None."""
+    return get_json(progress_key(sweep))
+
+
+class SweepProgress(object):
+    """Class to track and publish the progress of a sweep over the domain catalog."""
+
+    def __init__(self, sweep, total):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        sweep           The sweep's name (e.g. health or dns)
+        total           The number of domains the sweep will process
+        """
+        self.sweep = sweep
+        self.total = total
+        self.done = 0
+        self.current = None
+        self.failures = {}
+        self.started = time.time()
+        self.recent = deque([self.started], maxlen=THROUGHPUT_WINDOW + 1)
+        self.publish('running')
+
+    def throughput(self):
+        """Return the rolling throughput in domains per minute, or None before any are done."""
+        if len(self.recent) < 2 or self.recent[-1] == self.recent[0]:
+            return None
+        return (len(self.recent) - 1) / (self.recent[-1] - self.recent[0]) * 60
+
+    def start_domain(self, name):
+        """Note the domain the sweep is working on now."""
+        self.current = name
+        self.publish('running')
+
+    def finish_domain(self):
+        """Count the current domain as done and publish the new totals."""
+        self.done += 1
+        self.recent.append(time.time())
+        self.publish('running')
+
+    def record_failure(self, provider):
+        """Count a failed lookup for the named provider (or record type, for DNS sweeps)."""
+        self.failures[provider] = self.failures.get(provider, 0) + 1
+
+    def complete(self, state='complete'):
+        """Publish the final state of the sweep."""
+        self.current = None
+        self.publish(state)
+
+    def publish(self, state):
+        """Store the current progress where the web application can read it."""
+        throughput = self.throughput()
+        remaining = max(self.total - self.done, 0)
+        data = {
+                'sweep': self.sweep,
+                'state': state,
+                'total': self.total,
+                'done': self.done,
+                'percent': round(self.done / self.total * 100, 1) if self.total else 100,
+                'current': self.current,
+                'failures': self.failures,
+                'throughput': round(throughput, 2) if throughput else None,
+                'eta_seconds': int(remaining / throughput * 60) if throughput else None,
+                'started': self.started,
+                'updated': time.time(),
+               }
+        set_json(progress_key(self.sweep), data, PROGRESS_TTL)
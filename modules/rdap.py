@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the tools for collecting registration data (expiration date, registrar,
+and WHOIS privacy) for domains from RDAP, the JSON successor to WHOIS. Lookups run concurrently,
+each registry's RDAP server gets its own rate limit, and responses are cached in Redis so every
+worker shares them.
+"""
+
+import time
+import datetime
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from modules.redis_store import get_json, set_json
+
+
+# Registrant names and remarks that mean the WHOIS data is hidden behind a privacy service
+PRIVACY_MARKERS = ('redacted', 'privacy', 'private', 'proxy', 'withheld', 'whoisguard',
+                   'data protected', 'not disclosed', 'contact privacy', 'domains by proxy')
+
+
+def vcard_value(entity, *fields):
+    """Return the first of the named vCard fields (e.g. fn or org) of an RDAP entity, or None."""
+    try:
+        properties = entity['vcardArray'][1]
+    except (KeyError, IndexError, TypeError):
+        return None
+    for field in fields:
+        for item in properties:
+            if item[0] == field and item[3]:
+                return item[3] if isinstance(item[3], str) else ' '.join(item[3])
+    return None
+
+
+def parse_rdap(data):
+    """Return a dictionary with the `expiration` date, `registrar` name, and `whois_status`
+    (Enabled when the registrant is hidden by privacy or redaction, otherwise Disabled) from an
+    RDAP domain response. Keys are left out when the response does not say. Thin registries (e.g.
+    Verisign for .com and .net) never list a registrant, so their answers have no `whois_status`.
+
+    Parameters:
+    data            The RDAP domain response as a dictionary
+    """
+    result = {}
+    for event in data.get('events', []):
+        if event.get('eventAction') == 'expiration' and event.get('eventDate'):
+            try:
+                result['expiration'] = datetime.date.fromisoformat(event['eventDate'][:10])
+            except ValueError:
+                pass
+    registrant = None
+    for entity in data.get('entities', []):
+        roles = entity.get('roles', [])
+        if 'registrar' in roles:
+            registrar = vcard_value(entity, 'fn', 'org')
+            if registrar:
+                result['registrar'] = registrar[:100]
+        if 'registrant' in roles:
+            registrant = entity
+    if registrant is None:
+        # A registry that redacts the registrant entirely says so in `redacted` (RFC 9537); with
+        # no registrant and no redaction notice the registry has no registrant data to go on
+        redacted = ' '.join(item.get('name', {}).get('description', '') for item in data.get('redacted', [])
+                            if isinstance(item.get('name'), dict)).lower()
+        if 'registrant' in redacted:
+            result['whois_status'] = 'Enabled'
+        return result
+    remarks = [remark.get('title', '') + ' ' + ' '.join(remark.get('description', []))
+               for remark in data.get('remarks', []) + registrant.get('remarks', [])]
+    names = [vcard_value(registrant, 'fn'), vcard_value(registrant, 'org')]
+    text = ' '.join([name for name in names if name] + remarks).lower()
+    if any(marker in text for marker in PRIVACY_MARKERS):
+        result['whois_status'] = 'Enabled'
+    else:
+        result['whois_status'] = 'Disabled'
+    return result
+
+
+class RDAPCollector(object):
+    """Class to retrieve registration data for many domains from their registries' RDAP servers."""
+
+    def __init__(self, config=None):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        config          Dictionary used in place of `RDAP_CONFIG`
+        """
+        if config is None:
+            try:
+                config = settings.RDAP_CONFIG
+            except AttributeError:
+                config = {}
+        self.bootstrap_url = config.get('bootstrap_url', 'https://data.iana.org/rdap/dns.json')
+        # RDAP base URLs by TLD that override the IANA bootstrap; `*` covers every other TLD
+        self.servers = config.get('servers', {})
+        self.concurrency = config.get('concurrency', 10)
+        self.batch_size = config.get('batch_size', 200)
+        # Requests allowed per minute to each RDAP server, keyed by host name
+        self.rate_limits = config.get('rate_limits', {'default': 60})
+        self.cache_ttl = config.get('cache_ttl', 43200)
+        self.request_timeout = config.get('request_timeout', 15)
+        self.lock = threading.Lock()
+        self.next_request = {}
+        self.tld_servers = None
+
+    def load_bootstrap(self):
+        """Return the IANA bootstrap mapping of TLD to RDAP base URL, cached for a day."""
+        if self.tld_servers is not None:
+            return self.tld_servers
+        tld_servers = get_json('shepherd:rdap:bootstrap')
+        if tld_servers is None:
+            tld_servers = {}
+            try:
+                response = requests.get(self.bootstrap_url, timeout=self.request_timeout)
+                response.raise_for_status()
+                for tlds, urls in response.json().get('services', []):
+                    # Prefer HTTPS when a registry lists several URLs
+                    url = sorted(urls, key=lambda url: not url.startswith('https'))[0]
+                    for tld in tlds:
+                        tld_servers[tld.lower()] = url
+                set_json('shepherd:rdap:bootstrap', tld_servers, 86400)
+            except Exception as error:
+                print('[!] Could not load the RDAP bootstrap file: {}'.format(error))
+        self.tld_servers = tld_servers
+        return tld_servers
+
+    def server_for(self, domain):
+        """Return the RDAP base URL for the domain's TLD, or None if the registry has no RDAP
+        server.
+        """
+        tld = domain.rsplit('.', 1)[-1].lower()
+        if tld in self.servers:
+            return self.servers[tld]
+        if '*' in self.servers:
+            return self.servers['*']
+        return self.load_bootstrap().get(tld)
+
+    def wait_turn(self, host):
+        """Block until the host's rate limit allows another request and claim that slot."""
+        per_minute = self.rate_limits.get(host, self.rate_limits.get('default', 60))
+        interval = 60.0 / per_minute if per_minute else 0
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_request.get(host, 0))
+            self.next_request[host] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def lookup(self, domain):
+        """Return a tuple of the domain, its parsed registration data (see parse_rdap()) or None,
+        and an error message or None. Answers come from the cache when possible and a `429 Too
+        Many Requests` is retried after the server's Retry-After delay.
+
+        Parameters:
+        domain          The domain name to look up
+        """
+        cache_key = 'shepherd:rdap:domain:{}'.format(domain.lower())
+        result = get_json(cache_key)
+        if result is not None:
+            if result.get('expiration'):
+                result['expiration'] = datetime.date.fromisoformat(result['expiration'])
+            return domain, result, None
+        base_url = self.server_for(domain)
+        if not base_url:
+            return domain, None, 'no RDAP server for this TLD'
+        url = base_url.rstrip('/') + '/domain/' + domain
+        host = urlparse(url).hostname
+        try:
+            for attempt in range(3):
+                self.wait_turn(host)
+                response = requests.get(url, timeout=self.request_timeout,
+                                        headers={'Accept': 'application/rdap+json'})
+                if response.status_code != 429:
+                    break
+                retry_after = response.headers.get('Retry-After', '')
+                time.sleep(min(int(retry_after) if retry_after.isdigit() else 2 ** (attempt + 1), 60))
+            if response.status_code == 404:
+                return domain, None, 'not found'
+            response.raise_for_status()
+            result = parse_rdap(response.json())
+        except Exception as error:
+            return domain, None, str(error)
+        cached = dict(result)
+        if cached.get('expiration'):
+            cached['expiration'] = cached['expiration'].isoformat()
+        set_json(cache_key, cached, self.cache_ttl)
+        return domain, result, None
+
+    def collect_many(self, domains):
+        """Look up many domains at once, `concurrency` at a time, and yield a (domain, result,
+        error) tuple for each domain in the order given.
+
+        Parameters:
+        domains         An iterable of domain names
+        """
+        domains = iter(domains)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                batch = [domain for _, domain in zip(range(self.batch_size), domains)]
+                if not batch:
+                    break
+                for result in executor.map(self.lookup, batch):
+                    yield result
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains a small RDAP server that stands in for the registries when testing the
+registration refresh. Every domain gets stable synthetic registration data derived from its
+name, and the server can enforce a rate limit so throttling can be tested offline.
+"""
+
+import json
+import time
+import hashlib
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Registrars handed out to the synthetic domains
+REGISTRARS = ('NameCheap, Inc.', 'GoDaddy.com, LLC', 'Gandi SAS', 'Tucows Domains Inc.', 'Porkbun LLC')
+
+
+def synthetic_domain(domain):
+    """Return an RDAP domain response with registration data derived from the domain name."""
+    seed = int(hashlib.sha1(domain.lower().encode()).hexdigest(), 16)
+    expiration = datetime.date.today() + datetime.timedelta(days=seed % 730 - 30)
+    registrar = {'objectClassName': 'entity', 'roles': ['registrar'],
+                 'vcardArray': ['vcard', [['version', {}, 'text', '4.0'],
+                                          ['fn', {}, 'text', REGISTRARS[seed % len(REGISTRARS)]]]]}
+    entities = [registrar]
+    redacted = []
+    # Roughly one domain in four shows its registrant, the rest are redacted (RFC 9537)
+    if seed % 4 == 0:
+        entities.append({'objectClassName': 'entity', 'roles': ['registrant'],
+                         'vcardArray': ['vcard', [['version', {}, 'text', '4.0'],
+                                                  ['fn', {}, 'text', 'Shepherd Operator'],
+                                                  ['org', {}, 'text', 'Example Consulting']]]})
+    else:
+        redacted = [{'name': {'description': 'Registrant Name'}, 'method': 'removal'},
+                    {'name': {'description': 'Registrant Organization'}, 'method': 'removal'}]
+    return {
+            'objectClassName': 'domain',
+            'ldhName': domain.upper(),
+            'status': ['client transfer prohibited'],
+            'events': [
+                {'eventAction': 'registration', 'eventDate': '2017-01-26T00:00:00Z'},
+                {'eventAction': 'expiration', 'eventDate': expiration.isoformat() + 'T00:00:00Z'},
+            ],
+            'entities': entities,
+            'redacted': redacted,
+           }
+
+
+class StandInRDAPHandler(BaseHTTPRequestHandler):
+    """Class to answer `GET /domain/<name>` requests with synthetic RDAP data."""
+
+    def do_GET(self):
+        """Answer a domain query, a 429 when over the rate limit, or a 404."""
+        server = self.server
+        if not server.allow_request():
+            self.send_json(429, {'errorCode': 429, 'title': 'Too Many Requests'}, {'Retry-After': '1'})
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        path = self.path.split('?', 1)[0].strip('/')
+        if path.startswith('domain/') and path.count('/') == 1:
+            domain = path.split('/', 1)[1]
+            if not domain.lower().startswith('missing-'):
+                self.send_json(200, synthetic_domain(domain))
+                return
+        self.send_json(404, {'errorCode': 404, 'title': 'Not Found'})
+
+    def send_json(self, status, data, headers=None):
+        """Send an RDAP JSON response."""
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/rdap+json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Keep the console quiet; the server answers thousands of requests during a test."""
+        pass
+
+
+class StandInRDAPServer(ThreadingHTTPServer):
+    """Class for a threaded HTTP server answering RDAP domain queries. Domains starting with
+    `missing-` are answered with a 404.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, rate_limit=0, delay=0):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        address         (host, port) tuple to listen on; port 0 picks a free port
+        rate_limit      Requests allowed per second before answering 429, or 0 for no limit
+        delay           Seconds to wait before each answer
+        """
+        super(StandInRDAPServer, self).__init__(address, StandInRDAPHandler)
+        self.rate_limit = rate_limit
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.window = (0, 0)
+
+    def allow_request(self):
+        """Return False if this request goes over the per-second rate limit."""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            second = int(time.time())
+            start, count = self.window
+            if start != second:
+                start, count = second, 0
+            self.window = (start, count + 1)
+            return count < self.rate_limit
+
+    @property
+    def base_url(self):
+        """Return the server's base URL for the `servers` setting in `RDAP_CONFIG`."""
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        """Serve requests from a background thread and return the thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module provides the Redis connection shared by the web application and the Django Q
+workers for state that has to be visible across processes, like sweep progress. Values are stored
+as JSON in Redis, or in Django's cache when Redis is not available.
+"""
+
+import json
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Seconds to wait before trying to reach Redis again after a failed connection
+RETRY_INTERVAL = 30
+
+_connection = None
+_last_failure = 0
+
+
+def get_connection():
+    """Return a Redis client built from the Redis settings in `Q_CLUSTER`, or None if Redis is not
+    configured or could not be reached recently. Callers fall back to Django's cache when this
+    returns None.
+    """
+    global _connection, _last_failure
+    if _connection is not None:
+        return _connection
+    if time.time() - _last_failure < RETRY_INTERVAL:
+        return None
+    try:
+        client = redis.Redis(socket_timeout=2, **settings.Q_CLUSTER['redis'])
+        client.ping()
+    except (AttributeError, KeyError, TypeError):
+        _last_failure = time.time()
+        return None
+    except redis.exceptions.RedisError as error:
+        print('[!] Could not reach Redis: {}'.format(error))
+        _last_failure = time.time()
+        return None
+    _connection = client
+    return _connection
+
+
+def get_json(key):
+    """Return the JSON value stored under the key in Redis, or in Django's cache when Redis is not
+    available, or None.
+    """
+    connection = get_connection()
+    if connection:
+        try:
+            value = connection.get(key)
+            return json.loads(value) if value is not None else None
+        except Exception as error:
+            print('[!] Could not read {} from Redis: {}'.format(key, error))
+    return cache.get(key)
+
+
+def set_json(key, value, ttl):
+    """Store a JSON serializable value under the key for `ttl` seconds in Redis, or in Django's
+    cache when Redis is not available.
+    """
+    connection = get_connection()
+    if connection:
+        try:
+            connection.set(key, json.dumps(value), ex=int(ttl))
+            return
+        except Exception as error:
+            print('[!] Could not store {} in Redis: {}'.format(key, error))
+    cache.set(key, value, ttl)
+
+
+def incr(key):
+    """Add one to the counter stored under the key in Redis, or in Django's cache when Redis is not
+    available. A missing counter starts at zero and does not expire.
+    """
+    connection = get_connection()
+    if connection:
+        try:
+            connection.incr(key)
+            return
+        except Exception as error:
+            print('[!] Could not increment {} in Redis: {}'.format(key, error))
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
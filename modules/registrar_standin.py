@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains a small Namecheap-style API server that stands in for the registrar when
+testing the registrar inventory sync. It answers `namecheap.domains.getList` with a synthetic
+account whose domains can be added to or changed between syncs, and can enforce Namecheap's
+per-minute API rate limit.
+"""
+
+import time
+import random
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import quoteattr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SyntheticAccount(object):
+    """Class holding the domains of a synthetic registrar account, oldest first."""
+
+    def __init__(self, count=0, seed=0, suffix='com'):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        count           Number of domains to generate
+        seed            Seed for the random registration data, so runs are repeatable
+        suffix          TLD of the generated domains
+        """
+        self.random = random.Random(seed)
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        self.domains = []
+        self.buy(count)
+
+    def buy(self, count):
+        """Add `count` newly bought domains to the end of the account and return them."""
+        with self.lock:
+            today = datetime.date.today()
+            bought = []
+            for _ in range(count):
+                number = len(self.domains)
+                creation = today - datetime.timedelta(days=max(0, 3000 - number // 10))
+                # Most domains are renewed through next year; about one in twenty was left to lapse
+                years = (today - creation).days // 365 + self.random.randint(1, 2)
+                if self.random.random() < 0.05:
+                    years = max(1, years - 3)
+                domain = {
+                          'name': 'shepherd-{:06d}.{}'.format(number, self.suffix),
+                          'creation': creation,
+                          'expiration': creation + datetime.timedelta(days=365 * years),
+                          'whois_guard': self.random.choice(['ENABLED', 'ENABLED', 'ENABLED', 'DISABLED']),
+                         }
+                self.domains.append(domain)
+                bought.append(domain)
+            return bought
+
+    def renew(self, name, years=1):
+        """Extend a domain's expiration date, as a renewal at the registrar would."""
+        with self.lock:
+            for domain in self.domains:
+                if domain['name'] == name:
+                    domain['expiration'] = domain['expiration'] + datetime.timedelta(days=365 * years)
+                    return domain
+        return None
+
+    def page(self, page, page_size):
+        """Return the domains on a page (numbered from 1) and the account's total."""
+        with self.lock:
+            start = (page - 1) * page_size
+            return list(self.domains[start:start + page_size]), len(self.domains)
+
+
+class StandInRegistrarHandler(BaseHTTPRequestHandler):
+    """Class to answer Namecheap API requests for the `namecheap.domains.getList` command."""
+
+    def do_GET(self):
+        """Answer a domain list request with one page of the synthetic account."""
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        server = self.server
+        if server.api_key and params.get('ApiKey') != server.api_key:
+            self.send_error_response('1011102', 'Parameter APIKey is invalid')
+            return
+        if params.get('Command', '').lower() != 'namecheap.domains.getlist':
+            self.send_error_response('1010101', 'Invalid request: unknown command')
+            return
+        try:
+            page = max(int(params.get('Page', 1)), 1)
+            page_size = min(max(int(params.get('PageSize', 20)), 10), 100)
+        except ValueError:
+            self.send_error_response('2011170', 'Invalid paging parameter')
+            return
+        if not server.allow_request():
+            self.send_error_response('500000', 'Too many requests')
+            return
+        domains, total = server.account.page(page, page_size)
+        today = datetime.date.today()
+        rows = []
+        for number, domain in enumerate(domains):
+            rows.append('<Domain ID={} Name={} User="shepherd" Created={} Expires={} IsExpired={} '
+                        'IsLocked="false" AutoRenew="false" WhoisGuard={} IsPremium="false" IsOurDNS="true"/>'.format(
+                            quoteattr(str((page - 1) * page_size + number + 1)), quoteattr(domain['name']),
+                            quoteattr(domain['creation'].strftime('%m/%d/%Y')),
+                            quoteattr(domain['expiration'].strftime('%m/%d/%Y')),
+                            quoteattr('true' if domain['expiration'] < today else 'false'),
+                            quoteattr(domain['whois_guard'])))
+        body = ('<?xml version="1.0" encoding="utf-8"?>'
+                '<ApiResponse Status="OK" xmlns="http://api.namecheap.com/xml.response"><Errors />'
+                '<RequestedCommand>namecheap.domains.getList</RequestedCommand>'
+                '<CommandResponse Type="namecheap.domains.getList"><DomainGetListResult>{}</DomainGetListResult>'
+                '<Paging><TotalItems>{}</TotalItems><CurrentPage>{}</CurrentPage><PageSize>{}</PageSize></Paging>'
+                '</CommandResponse></ApiResponse>').format(''.join(rows), total, page, page_size)
+        server.requests += 1
+        self.send_xml(body)
+
+    def send_error_response(self, number, message):
+        """Send a Namecheap API error, which uses a 200 response with an ERROR status."""
+        self.send_xml('<?xml version="1.0" encoding="utf-8"?>'
+                      '<ApiResponse Status="ERROR" xmlns="http://api.namecheap.com/xml.response">'
+                      '<Errors><Error Number="{}">{}</Error></Errors></ApiResponse>'.format(number, message))
+
+    def send_xml(self, body):
+        """Send an XML response."""
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Keep the console quiet; a sync of a large account makes many requests."""
+        pass
+
+
+class StandInRegistrarServer(ThreadingHTTPServer):
+    """Class for a threaded HTTP server answering Namecheap domain list requests."""
+    daemon_threads = True
+
+    def __init__(self, address, account, api_key='', rate_limit=0, rate_window=60):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        address         (host, port) tuple to listen on; port 0 picks a free port
+        account         SyntheticAccount whose domains are served
+        api_key         API key requests must present, or empty to accept any key
+        rate_limit      Requests allowed per `rate_window` seconds before answering `Too many
+                        requests` like Namecheap does, or 0 for no limit
+        rate_window     Length of the rate limit window in seconds
+        """
+        super(StandInRegistrarServer, self).__init__(address, StandInRegistrarHandler)
+        self.account = account
+        self.api_key = api_key
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.lock = threading.Lock()
+        self.window = (0, 0)
+        self.requests = 0
+        self.refused = 0
+
+    def allow_request(self):
+        """Return False if this request goes over the rate limit."""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.time()
+            start, count = self.window
+            if now - start >= self.rate_window:
+                start, count = now, 0
+            self.window = (start, count + 1)
+            if count < self.rate_limit:
+                return True
+            self.refused += 1
+            return False
+
+    @property
+    def api_url(self):
+        """Return the server's URL for the `api_url` setting in `REGISTRAR_CONFIG`."""
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/xml.response'.format(host, port)
+
+    def start(self):
+        """Serve requests from a background thread and return the thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
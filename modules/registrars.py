@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the registrar providers used to sync a registrar account's domain inventory
+into the catalog. Each provider pages through the account's domain list and returns the domains in
+a common format, so the sync task does not care which registrar it talks to.
+"""
+
+import time
+import datetime
+import xml.etree.ElementTree as ElementTree
+
+import requests
+
+
+class RateLimitError(Exception):
+    """Raised when a registrar API refuses a request because the account went over its rate limit."""
+    pass
+
+
+class RegistrarProvider(object):
+    """Base class for registrar providers. A provider yields the account's domains one page at a
+    time as (page cursor, next page cursor or None, list of domains); each domain is a dictionary
+    with the `name`, `creation` and `expiration` dates, `registrar` name, `whois_status` (Enabled
+    or Disabled), and whether the registration has `expired`.
+    """
+    name = None
+    registrar = None
+
+    def __init__(self, config):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        config          The provider's dictionary from `REGISTRAR_CONFIG`
+        """
+        self.config = config
+        self.request_timeout = config.get('request_timeout', 30)
+
+    @property
+    def account(self):
+        """Return the name of the account being synced, used to key the sync checkpoint."""
+        raise NotImplementedError
+
+    def list_domains(self, cursor=None):
+        """Yield the account's domains a page at a time, starting at the cursor.
+
+        Parameters:
+        cursor          Cursor of the page to start at, or None for the first page
+        """
+        raise NotImplementedError
+
+
+class NamecheapProvider(RegistrarProvider):
+    """Class to page through a Namecheap account's domains with the `namecheap.domains.getList`
+    API command.
+    """
+    name = 'namecheap'
+    registrar = 'Namecheap'
+
+    def __init__(self, config):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        config          The `namecheap` dictionary from `REGISTRAR_CONFIG`
+        """
+        super(NamecheapProvider, self).__init__(config)
+        self.api_url = config.get('api_url', 'https://api.namecheap.com/xml.response')
+        self.api_user = config.get('api_user', '')
+        self.api_key = config.get('api_key', '')
+        self.username = config.get('username') or self.api_user
+        self.client_ip = config.get('client_ip', '')
+        # Namecheap returns at most 100 domains per page
+        self.page_size = min(config.get('page_size', 100), 100)
+        # Namecheap allows 20 API calls per minute for an account, so pages are requested no faster
+        # than this and a rate-limited request is retried after a growing wait
+        self.requests_per_minute = config.get('requests_per_minute', 20)
+        self.rate_limit_retries = config.get('rate_limit_retries', 5)
+        self.rate_limit_wait = config.get('rate_limit_wait', 60)
+        self.next_request = 0
+        self.session = requests.Session()
+
+    @property
+    def account(self):
+        """Return the Namecheap user name being synced."""
+        return self.username
+
+    def parse_date(self, value):
+        """Convert a Namecheap `MM/DD/YYYY` date to a date object, or None."""
+        try:
+            return datetime.datetime.strptime(value, '%m/%d/%Y').date()
+        except (TypeError, ValueError):
+            return None
+
+    def wait_turn(self):
+        """Block until the next API call fits in `requests_per_minute` and claim that slot."""
+        interval = 60.0 / self.requests_per_minute if self.requests_per_minute else 0
+        now = time.time()
+        if self.next_request > now:
+            time.sleep(self.next_request - now)
+        self.next_request = max(now, self.next_request) + interval
+
+    def get_page(self, page):
+        """Request one page of the domain list and return a tuple of the domains and the total
+        number of domains in the account. Requests are paced to the account's rate limit, and a
+        request refused for going over it is retried up to `rate_limit_retries` times.
+
+        Parameters:
+        page            The page number, starting at 1
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            self.wait_turn()
+            try:
+                return self.request_page(page)
+            except RateLimitError:
+                if attempt == self.rate_limit_retries:
+                    raise
+                wait = self.rate_limit_wait * (attempt + 1)
+                print('[!] Namecheap rate limit reached on page {}, retrying in {} seconds.'.format(page, wait))
+                time.sleep(wait)
+
+    def request_page(self, page):
+        """Send one domain list request and parse the response. Raises RateLimitError when the API
+        refuses the request for going over the rate limit.
+
+        Parameters:
+        page            The page number, starting at 1
+        """
+        params = {
+                  'ApiUser': self.api_user,
+                  'ApiKey': self.api_key,
+                  'UserName': self.username,
+                  'ClientIp': self.client_ip,
+                  'Command': 'namecheap.domains.getList',
+                  'Page': page,
+                  'PageSize': self.page_size,
+                  # Oldest first, so domains bought since the last sync only change the last pages
+                  'SortBy': 'CREATEDATE',
+                 }
+        response = self.session.get(self.api_url, params=params, timeout=self.request_timeout)
+        if response.status_code == 429:
+            raise RateLimitError('Namecheap API error: Too many requests')
+        response.raise_for_status()
+        root = ElementTree.fromstring(response.content)
+        # Drop the API's XML namespace so elements can be found by their plain names
+        for element in root.iter():
+            element.tag = element.tag.split('}')[-1]
+        if root.get('Status') != 'OK':
+            errors = root.find('Errors')
+            message = ', '.join(error.text or '' for error in errors) if errors is not None else 'unknown error'
+            if 'too many requests' in message.lower():
+                raise RateLimitError('Namecheap API error: {}'.format(message))
+            raise ValueError('Namecheap API error: {}'.format(message))
+        result = root.find('CommandResponse/DomainGetListResult')
+        domains = []
+        for element in (result.findall('Domain') if result is not None else []):
+            domains.append({
+                            'name': element.get('Name', '').lower(),
+                            'creation': self.parse_date(element.get('Created')),
+                            'expiration': self.parse_date(element.get('Expires')),
+                            'registrar': self.registrar,
+                            'whois_status': 'Enabled' if element.get('WhoisGuard', '').upper() == 'ENABLED' else 'Disabled',
+                            'expired': element.get('IsExpired', '').lower() == 'true',
+                           })
+        total = root.find('CommandResponse/Paging/TotalItems')
+        return domains, int(total.text) if total is not None and total.text else len(domains)
+
+    def list_domains(self, cursor=None):
+        """Yield the account's domains a page at a time; the cursor is the page number.
+
+        Parameters:
+        cursor          Page number to start at, or None for the first page
+        """
+        page = int(cursor) if cursor else 1
+        while True:
+            domains, total = self.get_page(page)
+            next_page = page + 1 if domains and page * self.page_size < total else None
+            yield str(page), str(next_page) if next_page else None, domains
+            if next_page is None:
+                break
+            page = next_page
+
+
+# Registrar providers by the name used in `REGISTRAR_CONFIG`
+PROVIDERS = {
+    'namecheap': NamecheapProvider,
+}
+
+
+def get_providers(config):
+    """Return a provider object for each enabled registrar account in `REGISTRAR_CONFIG`.
+
+    Parameters:
+    config          The `REGISTRAR_CONFIG` settings dictionary
+    """
+    providers = []
+    for name, provider_config in config.items():
+        if name not in PROVIDERS:
+            print('[!] Unknown registrar provider in REGISTRAR_CONFIG: {}'.format(name))
+            continue
+        if provider_config.get('enabled', False):
+            providers.append(PROVIDERS[name](provider_config))
+    return providers
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the pool of upstream DNS resolvers used by DNSCollector. Each resolver is
+scored by its recent latency and failure rate, capped at a number of queries in flight, and
+benched after repeated failures. A query that times out or fails on one resolver is retried on a
+different one before the failure is reported.
+"""
+
+import time
+import threading
+
+import dns.resolver
+import dns.exception
+
+from modules import metrics
+
+
+class Upstream(object):
+    """Class holding the connection settings and health of one upstream resolver."""
+
+    def __init__(self, address, port=53, timeout=1, max_in_flight=25):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        address         IP address of the resolver
+        port            UDP/TCP port of the resolver
+        timeout         Seconds to wait for an answer from this resolver
+        max_in_flight   Queries allowed in flight to this resolver at once
+        """
+        self.address = address
+        self.port = port
+        self.resolver = dns.resolver.Resolver(configure=False)
+        self.resolver.nameservers = [address]
+        self.resolver.port = port
+        self.resolver.timeout = timeout
+        self.resolver.lifetime = timeout
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        # Moving averages of the answer time in seconds and the failure rate (0 to 1)
+        self.latency = None
+        self.failure_rate = 0.0
+        self.queries = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.benched_until = 0
+
+    @property
+    def name(self):
+        """Return the resolver as `address:port` for logging and metrics."""
+        return '{}:{}'.format(self.address, self.port)
+
+    def is_benched(self, now):
+        """Return True if the resolver is still benched at the given time."""
+        return now < self.benched_until
+
+    def score(self, now):
+        """Return the resolver's health score; lower is better. Slow resolvers and resolvers that
+        have been failing are tried last and benched resolvers are only used when nothing else is
+        left.
+        """
+        if self.is_benched(now):
+            return float('inf')
+        # Resolvers that have not answered yet get a neutral latency so they are tried early
+        latency = self.latency if self.latency is not None else 0.05
+        return latency * (1 + 10 * self.failure_rate)
+
+    def as_dict(self, now):
+        """Return the resolver's current state for display or logging."""
+        return {
+                'resolver': self.name,
+                'benched': self.is_benched(now),
+                'queries': self.queries,
+                'failures': self.failures,
+                'failure_rate': round(self.failure_rate, 3),
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+               }
+
+
+class ResolverPool(object):
+    """Class to spread DNS queries across a pool of upstream resolvers with failover."""
+
+    def __init__(self, resolvers=None, timeout=1, attempts=3, max_in_flight=25, max_failures=5, bench_time=30):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        resolvers       List of resolver addresses as `address` or `address:port` (use
+                        `[address]:port` for IPv6); the system resolvers are used if empty
+        timeout         Seconds to wait for an answer from one resolver
+        attempts        Resolvers to try for a query before reporting a failure
+        max_in_flight   Queries allowed in flight to each resolver at once
+        max_failures    Consecutive failures before a resolver is benched
+        bench_time      Seconds a resolver is benched
+        """
+        if not resolvers:
+            resolvers = dns.resolver.Resolver().nameservers
+        self.upstreams = [Upstream(address, port, timeout, max_in_flight)
+                          for address, port in (self.parse_address(resolver) for resolver in resolvers)]
+        self.attempts = attempts
+        self.max_failures = max_failures
+        self.bench_time = bench_time
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, config):
+        """Build a pool from the `DNS_CONFIG` settings dictionary."""
+        return cls(resolvers=config.get('resolvers', []),
+                   timeout=config.get('resolver_timeout', 1),
+                   attempts=config.get('resolver_attempts', 3),
+                   max_in_flight=config.get('resolver_max_in_flight', 25),
+                   max_failures=config.get('resolver_max_failures', 5),
+                   bench_time=config.get('resolver_bench_time', 30))
+
+    @staticmethod
+    def parse_address(resolver):
+        """Split a resolver setting into an (address, port) tuple."""
+        resolver = str(resolver)
+        if resolver.startswith('['):
+            address, _, port = resolver[1:].partition(']:')
+            return address.rstrip(']'), int(port or 53)
+        if resolver.count(':') == 1:
+            address, port = resolver.split(':')
+            return address, int(port)
+        return resolver, 53
+
+    def pick(self, tried):
+        """Return the healthiest resolver not yet tried for this query, holding one of its
+        in-flight slots. Resolvers at their in-flight cap are skipped while another has room;
+        otherwise this waits for a slot on the best one. Returns None when every resolver has been
+        tried.
+
+        Parameters:
+        tried           Set of resolvers already tried for this query
+        """
+        with self.lock:
+            now = time.time()
+            candidates = sorted((upstream for upstream in self.upstreams if upstream not in tried),
+                                key=lambda upstream: upstream.score(now))
+        if not candidates:
+            return None
+        for upstream in candidates:
+            if upstream.slots.acquire(blocking=False):
+                return upstream
+        candidates[0].slots.acquire()
+        return candidates[0]
+
+    def record(self, upstream, success, elapsed):
+        """Update the resolver's health after a query and bench it after `max_failures`
+        consecutive failures.
+
+        Parameters:
+        upstream        The Upstream the query was sent to
+        success         False if the query timed out or the resolver failed to answer
+        elapsed         Seconds the query took
+        """
+        with self.lock:
+            upstream.queries += 1
+            upstream.failure_rate = upstream.failure_rate * 0.8 + (0 if success else 0.2)
+            if success:
+                upstream.consecutive_failures = 0
+                if upstream.latency is None:
+                    upstream.latency = elapsed
+                else:
+                    upstream.latency = upstream.latency * 0.8 + elapsed * 0.2
+            else:
+                upstream.failures += 1
+                upstream.consecutive_failures += 1
+                # Queries already in flight when the resolver was benched must not bench it again
+                if upstream.consecutive_failures >= self.max_failures and not upstream.is_benched(time.time()):
+                    upstream.benched_until = time.time() + self.bench_time
+                    upstream.consecutive_failures = 0
+                    print('[!] Benching DNS resolver {} for {} seconds after {} failures.'.format(
+                        upstream.name, self.bench_time, self.max_failures))
+        metrics.dns_resolver_queries.inc(resolver=upstream.name, result='ok' if success else 'error')
+
+    def query(self, name, record_type):
+        """Resolve the name and return the dnspython answer. Timeouts and server failures are
+        retried on the next healthiest resolver, up to `attempts` resolvers. NXDOMAIN and NoAnswer
+        are real answers, so they are raised right away.
+
+        Parameters:
+        name            The name to query
+        record_type     The DNS record type to query
+        """
+        tried = set()
+        last_error = None
+        for _ in range(self.attempts):
+            upstream = self.pick(tried)
+            if upstream is None:
+                break
+            tried.add(upstream)
+            start = time.perf_counter()
+            try:
+                answer = upstream.resolver.resolve(name, record_type, search=False)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                self.record(upstream, True, time.perf_counter() - start)
+                raise
+            except dns.exception.DNSException as error:
+                self.record(upstream, False, time.perf_counter() - start)
+                last_error = error
+                continue
+            finally:
+                upstream.slots.release()
+            self.record(upstream, True, time.perf_counter() - start)
+            return answer
+        raise last_error or dns.resolver.NoNameservers()
+
+    def status(self):
+        """Return a list with the current state of every resolver in the pool."""
+        with self.lock:
+            now = time.time()
+            return [upstream.as_dict(now) for upstream in self.upstreams]
@@ -13,38 +13,40 @@ of reported domains.
 
 import os
 import re
-import csv
-import sys
 import json
-import shutil
-import base64
 import time
+import datetime
+import shutil
+import importlib
+import contextlib
+import urllib.request
+import urllib.parse
 
-import click
-import urllib
 from django.conf import settings
 from catalog.models import Domain
+from modules.proxies import ProxyPool
+from modules.ip_reputation import IPReputation
+from modules import metrics
 
 import requests
-import pytesseract
-from PIL import Image
-from lxml import etree
-from lxml import objectify
-from cymon import Cymon
-from bs4 import BeautifulSoup
-
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.firefox.options import Options
 
 
 # Disable requests warnings for things like disabling certificate checking
 requests.packages.urllib3.disable_warnings()
 
 
+def lazy_import(module_name):
+    """Import the named module the first time a provider needs it. Heavy libraries like Selenium,
+    pytesseract, and BeautifulSoup are only loaded when a provider that uses them actually runs, so
+    a Django Q worker that only releases domains never pays for them.
+
+    Parameters:
+
+    module_name     The dotted name of the module to import (e.g. `bs4`)
+    """
+    return importlib.import_module(module_name)
+
+
 class DomainReview(object):
     """Class to pull a list of registered domains belonging to a Namecheap account and then check
     the web reputation of each domain.
@@ -59,24 +61,198 @@ class DomainReview(object):
                    'malicious sources/malnets']
     # Variables for web browsing
     useragent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36'
+    # Session for requests sent directly; proxied requests get a session per proxy (see session_for())
     session = requests.Session()
+    # Provider plugins checked for each domain, in the order they run
+    # Each entry names the method, the settings keys it needs, and the heavy libraries it imports
+    # on first use -- a provider with missing configuration or libraries is disabled, not fatal
+    # Providers marked `proxied` throttle by source IP, so their requests rotate through the proxy pool
+    providers = {
+        'virustotal': {'method': 'check_virustotal', 'config': ['virustotal_api_key'], 'modules': []},
+        'cymon': {'method': 'check_cymon', 'config': [], 'modules': [], 'proxied': True},
+        'xforce': {'method': 'check_ibm_xforce', 'config': [], 'modules': [], 'proxied': True},
+        'talos': {'method': 'check_talos', 'config': [], 'modules': [], 'proxied': True},
+        'bluecoat': {'method': 'check_bluecoat', 'config': [], 'modules': ['selenium.webdriver', 'selenium.webdriver.firefox.options']},
+        'fortiguard': {'method': 'check_fortiguard', 'config': [], 'modules': [], 'proxied': True},
+        'opendns': {'method': 'check_opendns', 'config': [], 'modules': ['bs4', 'lxml'], 'proxied': True},
+        'trendmicro': {'method': 'check_trendmicro', 'config': [], 'modules': ['bs4', 'lxml'], 'proxied': True},
+        'mxtoolbox': {'method': 'check_mxtoolbox', 'config': [], 'modules': ['bs4', 'lxml'], 'proxied': True},
+        'websense': {'method': 'check_websense', 'config': [], 'modules': [], 'files': ['dict.json']},
+    }
+    # Offline IP reputation engine, created from settings on first use
+    ip_reputation = None
+
+    def __init__(self, domain_queryset, profiler=None, progress=None):
+        """Everything that needs to be setup when a new DomainReview object is created goes here.
+
+        Parameters:
 
-    def __init__(self, domain_queryset):
-        """Everything that needs to be setup when a new DomainReview object is created goes here."""
+        domain_queryset A queryset of Domain objects to review
+        profiler        Optional ReviewProfiler used to time each provider call
+        progress        Optional SweepProgress used to publish progress for each domain
+        """
         # Domain query results from the Django models
         self.domain_queryset = domain_queryset
-        # Try to get the sleep time configured in settings
+        self.profiler = profiler
+        self.progress = progress
         try:
-            self.request_delay = settings.DOMAINCHECK_CONFIG['sleep_time']
-        except Exception as error:
-            self.request_delay = 20
-        
+            config = settings.DOMAINCHECK_CONFIG
+        except Exception:
+            config = {}
+        # Try to get the sleep time configured in settings
+        self.request_delay = config.get('sleep_time', 20)
+        self.request_timeout = config.get('request_timeout', 30)
+        self.virustotal_api_key = config.get('virustotal_api_key') or None
+        # Disable any provider that is switched off in settings or is missing required settings
+        self.disabled_providers = {}
+        for provider in config.get('disabled_providers', []):
+            self.disabled_providers[provider] = 'Disabled in settings.py'
+        for provider, plugin in self.providers.items():
+            missing = [key for key in plugin['config'] if not config.get(key)]
+            if missing and provider not in self.disabled_providers:
+                self.disabled_providers[provider] = 'Missing settings: {}'.format(', '.join(missing))
+                print('[!] Disabling the {} provider because DOMAINCHECK_CONFIG is missing: {}'.format(provider, ', '.join(missing)))
+            missing = [path for path in plugin.get('files', []) if not os.path.exists(path)]
+            if missing and provider not in self.disabled_providers:
+                self.disabled_providers[provider] = 'Missing files: {}'.format(', '.join(missing))
+                print('[!] Disabling the {} provider because these files are missing: {}'.format(provider, ', '.join(missing)))
+        # Providers whose libraries have been imported successfully
+        self.loaded_providers = set()
+        # Egress proxies for the `proxied` providers and the one in use by the running provider
+        self.proxy_pool = ProxyPool.from_settings(config)
+        self.proxy = None
+        # Longest time to wait for a proxy before skipping a provider for the domain
+        self.proxy_max_wait = config.get('proxy_max_wait', 60)
+        # One session per proxy URL, so cookies set through one egress IP never leave through another
+        self.proxy_sessions = {}
+        # Outcome of the requests made by the running provider
+        self.request_result = {'success': True, 'captcha': False}
+        # The malwaredomains.com list, downloaded once per review before the first domain
+        self.malware_domains = None
+        self.prepared = False
+        # Offline IP reputation feeds, shared by every review in this process so feeds are only
+        # downloaded again when they change
+        if DomainReview.ip_reputation is None:
+            DomainReview.ip_reputation = IPReputation.from_settings(
+                getattr(settings, 'IP_REPUTATION_CONFIG', {}), settings.BASE_DIR)
+
+    def provider_enabled(self, provider):
+        """Return True if the named provider is enabled and its libraries can be imported. The
+        libraries are imported the first time this is called for the provider.
+
+        Parameters:
+
+        provider        The name of the provider (a key of `providers`)
+        """
+        if provider in self.disabled_providers:
+            return False
+        if provider not in self.loaded_providers:
+            try:
+                for module_name in self.providers[provider]['modules']:
+                    lazy_import(module_name)
+            except ImportError as error:
+                self.disabled_providers[provider] = 'Missing library: {}'.format(error)
+                print('[!] Disabling the {} provider because a library could not be imported: {}'.format(provider, error))
+                return False
+            self.loaded_providers.add(provider)
+        return True
+
+    def measure(self, name):
+        """Return a context manager that times the wrapped block with the profiler, if profiling."""
+        if self.profiler:
+            return self.profiler.measure(name)
+        return contextlib.nullcontext()
+
+    def run_provider(self, provider, *args, **kwargs):
+        """Run the named provider's check method if the provider is enabled. Disabled providers
+        return an empty list so callers can always extend their results.
+
+        Parameters:
+
+        provider        The name of the provider (a key of `providers`)
+        *args           Arguments passed on to the provider's check method
+        """
+        if not self.provider_enabled(provider):
+            return []
+        check = getattr(self, self.providers[provider]['method'])
+        proxied = self.providers[provider].get('proxied')
+        if proxied:
+            # Every request the provider makes for this check goes out through the same proxy
+            self.proxy = self.proxy_pool.acquire(provider, max_wait=self.proxy_max_wait)
+            if self.proxy is None and self.proxy_pool.proxies:
+                # Every proxy is spent or benched for a while, so skip the provider rather than
+                # holding up the sweep
+                print('[!] Skipping the {} check because no egress proxy is available.'.format(provider))
+                metrics.provider_requests.inc(provider=provider, status='skipped')
+                if self.progress:
+                    self.progress.record_failure(provider)
+                return []
+        self.request_result = {'success': True, 'captcha': False}
+        failed = False
+        with self.measure(provider):
+            start = time.perf_counter()
+            try:
+                return check(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                metrics.provider_latency.observe(time.perf_counter() - start, provider=provider)
+                if proxied:
+                    self.proxy_pool.record(self.proxy, **self.request_result)
+                    self.proxy = None
+                if self.request_result['captcha']:
+                    status = 'captcha'
+                    metrics.provider_captchas.inc(provider=provider)
+                elif failed or not self.request_result['success']:
+                    status = 'error'
+                else:
+                    status = 'ok'
+                metrics.provider_requests.inc(provider=provider, status=status)
+                if self.progress and status != 'ok':
+                    self.progress.record_failure(provider)
+
+    def session_for(self, proxy):
+        """Return the session to use with the proxy. Each proxy gets its own session, so cookies a
+        provider sets for one egress IP are never sent from another.
+
+        Parameters:
+
+        proxy           The Proxy returned by the pool, or None for a direct request
+        """
+        if proxy is None:
+            return self.session
+        if proxy.url not in self.proxy_sessions:
+            self.proxy_sessions[proxy.url] = requests.Session()
+        return self.proxy_sessions[proxy.url]
+
+    def request(self, method, url, **kwargs):
+        """Send a request with the proxy's session, through the egress proxy selected for the
+        running provider if there is one. Connection errors, server errors, and CAPTCHA or rate-limit
+        responses are noted so the proxy's health and the sweep's failure counts can be updated when
+        the provider finishes.
+
+        Parameters:
+
+        method          The HTTP method (e.g. GET)
+        url             The URL to request
+        **kwargs        Keyword arguments passed on to `requests.Session.request()`
+        """
+        if self.proxy:
+            kwargs['proxies'] = {'http': self.proxy.url, 'https': self.proxy.url}
+        kwargs.setdefault('timeout', self.request_timeout)
         try:
-            self.virustotal_api_key = settings.DOMAINCHECK_CONFIG['virustotal_api_key']
-        except Exception as error:
-            self.virustotal_api_key = None
-            print('[!] A VirusTotal API key could not be pulled from settings.py. Review settings to perform VirusTotal checks.')
-            exit()
+            response = self.session_for(self.proxy).request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self.request_result['success'] = False
+            raise
+        if response.status_code == 429 or 'captcha' in response.url.lower():
+            self.request_result['captcha'] = True
+        elif response.status_code >= 500:
+            self.request_result['success'] = False
+        if self.profiler:
+            self.profiler.add_bytes(len(response.content))
+        return response
 
     def check_virustotal(self, domain, ignore_case=False):
         """Check the provided domain name with VirusTotal. VirusTotal's API is case sensitive, so
@@ -91,7 +267,7 @@ class DomainReview(object):
             if not ignore_case:
                 domain = domain.lower()
             try:
-                req = self.session.get(self.virustotal_domain_report_uri.format(self.virustotal_api_key, domain))
+                req = self.request('GET', self.virustotal_domain_report_uri.format(self.virustotal_api_key, domain))
                 vt_data = req.json()
             except:
                 vt_data = None
@@ -106,7 +282,7 @@ class DomainReview(object):
         headers = {'User-Agent': self.useragent, 
                    'Referer': 'https://www.talosintelligence.com/reputation_center/lookup?search=' + domain}
         try:
-            req = self.session.get(cisco_talos_uri.format(domain), headers=headers)
+            req = self.request('GET', cisco_talos_uri.format(domain), headers=headers)
             if req.ok:
                 json_data = req.json()
                 category = json_data['category']
@@ -132,7 +308,7 @@ class DomainReview(object):
                    'Referer': xforce_uri}
         xforce_api_uri = 'https://api.xforce.ibmcloud.com/url/{}'.format(domain)
         try:
-            req = self.session.get(xforce_api_uri, headers=headers, verify=False)
+            req = self.request('GET', xforce_api_uri, headers=headers, verify=False)
             if req.ok:
                 response = req.json()
                 if not response['result']['cats']:
@@ -160,7 +336,7 @@ class DomainReview(object):
                    'Origin': 'https://fortiguard.com', 
                    'Referer': 'https://fortiguard.com/webfilter'}
         try:
-            req = self.session.get(fortiguard_uri, headers=headers)
+            req = self.request('GET', fortiguard_uri, headers=headers)
             if req.ok:
                 """
                 Example HTML result:
@@ -182,6 +358,8 @@ class DomainReview(object):
     def check_bluecoat(self, domain, ocr=True):
         """Check the provided domain's category as determined by Symantec Bluecoat."""
         categories = []
+        webdriver = lazy_import('selenium.webdriver')
+        Options = lazy_import('selenium.webdriver.firefox.options').Options
         #set headless option
         options = Options()
         options.headless = True
@@ -200,7 +378,7 @@ class DomainReview(object):
         # wait until the page loads
         time.sleep(5)
         #print(driver.find_element_by_class_name("clickable-category").text)
-        categories = driver.find_element_by_class_name("clickable-category").text
+        categories.append(driver.find_element_by_class_name("clickable-category").text)
         #print(categories)
         driver.close()
         return categories
@@ -221,6 +399,8 @@ class DomainReview(object):
                 print('[!] Failed to download the Bluecoat CAPTCHA.')
                 return False
             # Perform basic OCR without additional image enhancement
+            pytesseract = lazy_import('pytesseract')
+            Image = lazy_import('PIL.Image')
             text = pytesseract.image_to_string(Image.open(jpeg))
             text = text.replace(" ", "").replace("[", "l").replace("'", "")
             # Remove CAPTCHA file
@@ -241,8 +421,8 @@ class DomainReview(object):
                    'Origin': mxtoolbox_url, 
                    'Referer': mxtoolbox_url}  
         try:
-            response = self.session.get(url=mxtoolbox_url, headers=headers)
-            soup = BeautifulSoup(response.content, 'lxml')
+            response = self.request('GET', mxtoolbox_url, headers=headers)
+            soup = lazy_import('bs4').BeautifulSoup(response.content, 'lxml')
             viewstate = soup.select('input[name=__VIEWSTATE]')[0]['value']
             viewstategenerator = soup.select('input[name=__VIEWSTATEGENERATOR]')[0]['value']
             eventvalidation = soup.select('input[name=__EVENTVALIDATION]')[0]['value']
@@ -267,8 +447,8 @@ class DomainReview(object):
                     'ctl00$ucSignIn$txtTitleName': '', 
                     'ctl00$ucSignIn$txtModalPassword': ''
             }
-            response = self.session.post(url=mxtoolbox_url, headers=headers, data=data)
-            soup = BeautifulSoup(response.content, 'lxml')
+            response = self.request('POST', mxtoolbox_url, headers=headers, data=data)
+            soup = lazy_import('bs4').BeautifulSoup(response.content, 'lxml')
             if soup.select('div[id=ctl00_ContentPlaceHolder1_noIssuesFound]'):
                 issues.append('No issues found')
             else:
@@ -287,7 +467,7 @@ class DomainReview(object):
         A Cymon API key is not required, but is recommended.
         """
         try:
-            req = self.session.get(url='https://cymon.io/' + target, verify=False)
+            req = self.request('GET', 'https://cymon.io/' + target, verify=False)
             if req.status_code == 200:
                 if 'IP Not Found' in req.text:
                     return False
@@ -304,8 +484,8 @@ class DomainReview(object):
         opendns_uri = 'https://domain.opendns.com/{}'
         headers = {'User-Agent':self.useragent}
         try:
-            response = self.session.get(opendns_uri.format(domain), headers=headers, verify=False)
-            soup = BeautifulSoup(response.content, 'lxml')
+            response = self.request('GET', opendns_uri.format(domain), headers=headers, verify=False)
+            soup = lazy_import('bs4').BeautifulSoup(response.content, 'lxml')
             tags = soup.find('span', {'class': 'normal'})
             if tags:
                 categories = tags.text.strip().split(', ')
@@ -413,15 +593,15 @@ class DomainReview(object):
                         'getinfo': 'Check Now'
                        }
         try:
-            response = self.session.get(trendmicro_uri, headers=headers)
-            response = self.session.post(trendmicro_stage_1_uri, headers=headers_stage_1, data=data_stage_1)
-            response = self.session.post(trendmicro_stage_2_uri, headers=headers_stage_2, data=data_stage_2)
+            response = self.request('GET', trendmicro_uri, headers=headers)
+            response = self.request('POST', trendmicro_stage_1_uri, headers=headers_stage_1, data=data_stage_1)
+            response = self.request('POST', trendmicro_stage_2_uri, headers=headers_stage_2, data=data_stage_2)
             # Check if session was redirected to /captcha.php
             if 'captcha' in response.url:
                 print('[!] TrendMicro responded with a reCAPTCHA, so cannot proceed with TrendMicro.')
                 print('L.. You can try solving it yourself: https://global.sitesafety.trendmicro.com/captcha.php')
             else:
-                soup = BeautifulSoup(response.content, 'lxml')
+                soup = lazy_import('bs4').BeautifulSoup(response.content, 'lxml')
                 tags = soup.find('div', {'class': 'labeltitlesmallresult'})
                 if tags:
                     categories = tags.text.strip().split(', ')
@@ -434,7 +614,7 @@ class DomainReview(object):
     def download_malware_domains(self):
         """Downloads the malwaredomains.com list of malicious domains."""
         headers = {'User-Agent':self.useragent}
-        response = self.session.get(url=self.malwaredomains_url, headers=headers, verify=False)
+        response = self.request('GET', self.malwaredomains_url, headers=headers, verify=False)
         malware_domains = response.text
         if response.status_code == 200:
             return malware_domains
@@ -442,7 +622,7 @@ class DomainReview(object):
             print('[!] Error reaching: {}, Status: {}'.format(self.malwaredomains_url, response.status_code))
             return None
 
-    def check_domain_status(self):
+    def check_domain_status(self, domains=None):
         """Check the status of each domain in the provided list collected from the Domain model.
         Each domain will be checked to ensure the domain is not flagged/blacklisted. A domain
         will be considered burned if VirusTotal returns detections for the domain or one of the
@@ -451,11 +631,27 @@ class DomainReview(object):
         VirusTotal allows 4 requests every 1 minute. A minimum of 20 seconds is recommended to
         allow for some consideration on the service.
 
+        Parameters:
+
+        domains         Optional chunk of Domain objects to check instead of the whole queryset; the
+                        malware list and IP feeds are only loaded for the first chunk
         """
         lab_results = {}
-        malware_domains = self.download_malware_domains()
-        for domain in self.domain_queryset:
+        if not self.prepared:
+            with self.measure('malwaredomains'):
+                self.malware_domains = self.download_malware_domains()
+            if self.ip_reputation.enabled:
+                with self.measure('ip_feeds'):
+                    self.ip_reputation.refresh()
+                if not self.ip_reputation.ready:
+                    print('[!] None of the IP reputation feeds could be loaded, so passive DNS addresses will not be checked.')
+                    metrics.provider_requests.inc(provider='ip_reputation', status='error')
+            self.prepared = True
+        malware_domains = self.malware_domains
+        for domain in (self.domain_queryset if domains is None else domains):
             print('[+] Starting update of {}'.format(domain.name))
+            if self.progress:
+                self.progress.start_domain(domain.name)
             burned_dns = False
             domain_categories = []
             # Sort the domain information from queryset
@@ -477,7 +673,7 @@ class DomainReview(object):
                         burned = True
                         burned_explanations.append('Flagged by malwaredomains.com')
                 # Check domain name with VirusTotal
-                vt_results = self.check_virustotal(domain_name)
+                vt_results = self.run_provider('virustotal', domain_name) or {}
                 if 'categories' in vt_results:
                     domain_categories = vt_results['categories']
                 # Check if VirusTotal has any detections for URLs or samples
@@ -493,35 +689,55 @@ class DomainReview(object):
                         burned_explanations.append('Tied to a VirusTotal detected URL')
                 # Get passive DNS results from VirusTotal JSON
                 ip_addresses = []
+                resolutions = None
                 if 'resolutions' in vt_results:
+                    resolutions = []
                     for address in vt_results['resolutions']:
                         ip_addresses.append({'address':address['ip_address'], 'timestamp':address['last_resolved'].split(' ')[0]})
+                        try:
+                            resolved_date = datetime.datetime.strptime(ip_addresses[-1]['timestamp'], '%Y-%m-%d').date()
+                        except ValueError:
+                            resolved_date = None
+                        resolutions.append({'address': address['ip_address'], 'date': resolved_date})
                 bad_addresses = []
-                for address in ip_addresses:
-                    if self.check_cymon(address['address']):
+                # With feeds configured but none loaded every address would pass, so the addresses
+                # are reported as unchecked rather than healthy
+                unchecked = bool(ip_addresses) and self.ip_reputation.enabled and not self.ip_reputation.ready
+                for address in ([] if unchecked else ip_addresses):
+                    # Check the local blocklist feeds when configured instead of one Cymon request per IP
+                    if self.ip_reputation.enabled:
+                        with self.measure('ip_reputation'):
+                            flagged = self.ip_reputation.lookup(address['address'])
+                    else:
+                        flagged = self.run_provider('cymon', address['address'])
+                    if flagged:
                         burned_dns = True
                         bad_addresses.append(address['address'] + '/' + address['timestamp'])
                 if burned_dns:
                     print('[*] {}: Identified as pointing to suspect IP addresses (VirusTotal passive DNS).'.format(domain_name))
                     health_dns = 'Flagged DNS ({})'.format(', '.join(bad_addresses))
+                elif unchecked:
+                    if self.progress:
+                        self.progress.record_failure('ip_reputation')
+                    health_dns = 'Unknown (IP reputation feeds unavailable)'
                 else:
                     health_dns = "Healthy"
                 # Collect categories from the other sources
-                xforce_results = self.check_ibm_xforce(domain_name)
+                xforce_results = self.run_provider('xforce', domain_name)
                 domain_categories.extend(xforce_results)
-                talos_results = self.check_talos(domain_name)
+                talos_results = self.run_provider('talos', domain_name)
                 domain_categories.extend(talos_results)
-                bluecoat_results = self.check_bluecoat(domain_name)
+                bluecoat_results = self.run_provider('bluecoat', domain_name)
                 domain_categories.extend(bluecoat_results)
-                fortiguard_results = self.check_fortiguard(domain_name)
+                fortiguard_results = self.run_provider('fortiguard', domain_name)
                 domain_categories.extend(fortiguard_results)
-                opendns_results = self.check_opendns(domain_name)
+                opendns_results = self.run_provider('opendns', domain_name)
                 domain_categories.extend(opendns_results)
-                trendmicro_results = self.check_trendmicro(domain_name)
+                trendmicro_results = self.run_provider('trendmicro', domain_name)
                 domain_categories.extend(trendmicro_results)
-                mxtoolbox_results = self.check_mxtoolbox(domain_name)
+                mxtoolbox_results = self.run_provider('mxtoolbox', domain_name)
                 domain_categories.extend(domain_categories)
-                websense_results = self.check_websense(domain)
+                websense_results = self.run_provider('websense', domain)
                 domain_categories.extend(websense_results)
                 # Make categories unique
                 domain_categories = list(set(domain_categories))
@@ -539,6 +755,7 @@ class DomainReview(object):
                 lab_results[domain]['burned'] = burned
                 lab_results[domain]['burned_explanation'] = ', '.join(burned_explanations)
                 lab_results[domain]['health_dns'] = health_dns
+                lab_results[domain]['resolutions'] = resolutions
                 lab_results[domain]['categories']['all'] = ', '.join(bad_categories)
                 lab_results[domain]['categories']['bad'] = ', '.join(domain_categories)
                 lab_results[domain]['categories']['talos'] = ', '.join(talos_results)
@@ -550,5 +767,8 @@ class DomainReview(object):
                 lab_results[domain]['categories']['trendmicro'] = ', '.join(trendmicro_results)
                 lab_results[domain]['categories']['websense'] = ', '.join(websense_results)
                 # Sleep for a while for VirusTotal's API
-                sleep(self.request_delay)
+                with self.measure('sleep'):
+                    time.sleep(self.request_delay)
+            if self.progress:
+                self.progress.finish_domain()
         return lab_results
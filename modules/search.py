@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the domain search. Searches run against a full-text index of each domain's
+name, notes, vendor categories, and registrar instead of scanning the Domain table with LIKE: an
+FTS5 table on SQLite or a GIN index on PostgreSQL. A second, trigram index of the names (an FTS5
+table with the trigram tokenizer, or a pg_trgm GIN index) finds terms inside a domain name. The
+SQLite tables are kept in sync by triggers on the Domain table, so bulk writes from the tasks are
+indexed too. Other databases fall back to `icontains` lookups.
+
+Search terms can be qualified with a field, e.g. `name:shepherd cat:technology status:available`.
+Terms are matched against the start of words, except that unqualified and `name:` terms of at least
+three characters also match anywhere in the domain name (e.g. `blog` finds techblog.com). Every term
+must match, and repeated `status:` terms match any of the statuses. Quote terms that contain spaces,
+e.g. `cat:"web hosting"`.
+"""
+
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+# Name of the SQLite FTS5 table and the PostgreSQL index
+INDEX_NAME = 'catalog_domain_search'
+# Name of the trigram index of the domain names (an FTS5 table on SQLite, a GIN index on PostgreSQL)
+NAME_INDEX_NAME = 'catalog_domain_search_names'
+# Triggers that keep the SQLite tables in sync with the Domain table
+TRIGGERS = ['{}_{}'.format(INDEX_NAME, trigger) for trigger in ('insert', 'delete', 'update')]
+# Trigram indexes can only find terms of at least three characters inside a name
+SUBSTRING_MIN_LENGTH = 3
+# Qualifiers accepted in a search and the indexed column each one searches
+QUALIFIERS = {
+    'name': 'name',
+    'cat': 'categories',
+    'category': 'categories',
+    'registrar': 'registrar',
+    'note': 'note',
+}
+# Domain fields searched for each indexed column when there is no full-text index
+FALLBACK_FIELDS = {
+    'name': ['name'],
+    'categories': ['all_cat', 'talos_cat', 'opendns_cat', 'bluecoat_cat', 'ibm_xforce_cat',
+                   'trendmicro_cat', 'fortiguard_cat', 'websense_cat'],
+    'registrar': ['registrar'],
+    'note': ['note'],
+}
+# The PostgreSQL weight of each indexed column
+POSTGRESQL_WEIGHTS = {'name': 'A', 'categories': 'B', 'registrar': 'C', 'note': 'D'}
+# Matches `qualifier:term`, `qualifier:"quoted term"`, `"quoted term"`, or a bare term
+TERM_PATTERN = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+# Whether each database has the full-text index, keyed by connection alias, so a search does not
+# query the schema every time; install_index() and drop_index() keep it current
+index_cache = {}
+# Whether each database has the trigram index of the names, kept alongside index_cache
+name_index_cache = {}
+
+
+def sql_text(columns, prefix):
+    """Return the SQL for the text of the categories column (every vendor category), or of a
+    single column, with NULLs treated as empty text.
+    """
+    return " || ' ' || ".join("coalesce({}{}, '')".format(prefix, column) for column in columns)
+
+
+def sqlite_statements(trigram=True):
+    """Return the SQL that creates the FTS5 tables and the triggers that keep them in sync.
+
+    Parameters:
+    trigram         Defaults to True. Set to False to leave out the trigram table of the names
+    """
+    values = 'new.id, {}, {}, {}, {}'.format(*[sql_text(FALLBACK_FIELDS[column], 'new.')
+                                              for column in ('name', 'note', 'categories', 'registrar')])
+    columns = ', '.join(field for fields in FALLBACK_FIELDS.values() for field in fields)
+    insert = 'INSERT INTO {0}(rowid, name, note, categories, registrar) VALUES ({1});'.format(INDEX_NAME, values)
+    delete = 'DELETE FROM {} WHERE rowid = old.id;'.format(INDEX_NAME)
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(name, note, categories, registrar, "
+        "tokenize='unicode61')".format(INDEX_NAME),
+    ]
+    if trigram:
+        statements.append("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(name, tokenize='trigram')".format(
+            NAME_INDEX_NAME))
+        insert += " INSERT INTO {}(rowid, name) VALUES (new.id, coalesce(new.name, ''));".format(NAME_INDEX_NAME)
+        delete += ' DELETE FROM {} WHERE rowid = old.id;'.format(NAME_INDEX_NAME)
+    return statements + [
+        'CREATE TRIGGER IF NOT EXISTS {0} AFTER INSERT ON catalog_domain BEGIN {1} END'.format(TRIGGERS[0], insert),
+        'CREATE TRIGGER IF NOT EXISTS {0} AFTER DELETE ON catalog_domain BEGIN {1} END'.format(TRIGGERS[1], delete),
+        'CREATE TRIGGER IF NOT EXISTS {0} AFTER UPDATE OF {1} ON catalog_domain BEGIN {2} {3} END'.format(
+            TRIGGERS[2], columns, delete, insert),
+    ]
+
+
+def trigram_supported(db):
+    """Return True if the database's SQLite has the FTS5 trigram tokenizer (added in 3.34.0)."""
+    return db.Database.sqlite_version_info >= (3, 34, 0)
+
+
+def postgresql_document():
+    """Return the SQL for a domain's weighted text search document on PostgreSQL. Each column
+    gets its own weight (A to D) so qualified terms can be limited to that column.
+    """
+    return ' || '.join("setweight(to_tsvector('simple', {}), '{}')".format(sql_text(FALLBACK_FIELDS[column], ''), weight)
+                       for column, weight in POSTGRESQL_WEIGHTS.items())
+
+
+def index_exists(db=connection, use_cache=True):
+    """Return True if the database has a full-text index for the domains.
+
+    Parameters:
+    db              The database connection to check
+    use_cache       Defaults to True. Set to False to check the schema instead of the cached answer
+    """
+    if use_cache and db.alias in index_cache:
+        return index_cache[db.alias]
+    exists = db.vendor == 'postgresql'
+    name_exists = False
+    if db.vendor == 'sqlite':
+        names = [INDEX_NAME, NAME_INDEX_NAME] + TRIGGERS
+        with db.cursor() as cursor:
+            cursor.execute('SELECT name FROM sqlite_master WHERE name IN ({})'.format(', '.join(['%s'] * len(names))),
+                           names)
+            found = {row[0] for row in cursor.fetchall()}
+        # The FTS5 table plus its three triggers
+        exists = found.issuperset([INDEX_NAME] + TRIGGERS)
+        name_exists = exists and NAME_INDEX_NAME in found
+    elif db.vendor == 'postgresql':
+        with db.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM pg_indexes WHERE indexname = %s', ['{}_idx'.format(NAME_INDEX_NAME)])
+            name_exists = cursor.fetchone()[0] == 1
+    index_cache[db.alias] = exists
+    name_index_cache[db.alias] = name_exists
+    return exists
+
+
+def name_index_exists(db=connection):
+    """Return True if the database has the trigram index that finds terms inside domain names.
+
+    Parameters:
+    db              The database connection to check
+    """
+    if db.alias not in name_index_cache:
+        index_exists(db, use_cache=False)
+    return name_index_cache[db.alias]
+
+
+def install_index(db=connection):
+    """Create the full-text index if it is missing and fill it with the current domains. This is
+    run by the migration and after every `migrate`, because SQLite drops the triggers whenever a
+    migration rebuilds the Domain table.
+
+    Parameters:
+    db              The database connection to install the index on
+    """
+    if db.vendor == 'sqlite':
+        trigram = trigram_supported(db)
+        # A migration may have dropped the triggers since the answer was cached
+        if index_exists(db, use_cache=False) and (name_index_exists(db) or not trigram):
+            return
+        if not trigram:
+            print('[!] SQLite {} has no trigram tokenizer, so searches will only match the start of '
+                  'words in domain names.'.format(db.Database.sqlite_version))
+        try:
+            with transaction.atomic(using=db.alias), db.cursor() as cursor:
+                # Triggers from an earlier install may not keep the names table in sync
+                for trigger in TRIGGERS:
+                    cursor.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+                for statement in sqlite_statements(trigram):
+                    cursor.execute(statement)
+                cursor.execute('DELETE FROM {}'.format(INDEX_NAME))
+                cursor.execute('INSERT INTO {}(rowid, name, note, categories, registrar) SELECT id, {}, {}, {}, {} '
+                               'FROM catalog_domain'.format(INDEX_NAME, *[sql_text(FALLBACK_FIELDS[column], '')
+                                                         for column in ('name', 'note', 'categories', 'registrar')]))
+                if trigram:
+                    cursor.execute('DELETE FROM {}'.format(NAME_INDEX_NAME))
+                    cursor.execute("INSERT INTO {}(rowid, name) SELECT id, coalesce(name, '') "
+                                   "FROM catalog_domain".format(NAME_INDEX_NAME))
+            index_cache[db.alias] = True
+            name_index_cache[db.alias] = trigram
+            print('[*] Built the domain search index.')
+        except Exception as error:
+            # SQLite may be built without FTS5, in which case searches fall back to LIKE
+            index_cache[db.alias] = False
+            name_index_cache[db.alias] = False
+            print('[!] Could not build the domain search index, searches will scan the domains: {}'.format(error))
+    elif db.vendor == 'postgresql':
+        with db.cursor() as cursor:
+            cursor.execute('CREATE INDEX IF NOT EXISTS {}_idx ON catalog_domain USING GIN (({}))'.format(
+                INDEX_NAME, postgresql_document()))
+        try:
+            # The expression matches the one Django uses for icontains, so those lookups can use it too
+            with transaction.atomic(using=db.alias), db.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                cursor.execute('CREATE INDEX IF NOT EXISTS {}_idx ON catalog_domain USING GIN '
+                               '((UPPER(name::text)) gin_trgm_ops)'.format(NAME_INDEX_NAME))
+            name_index_cache[db.alias] = True
+        except Exception as error:
+            # Creating the extension needs privileges the database user may not have
+            name_index_cache[db.alias] = False
+            print('[!] Could not build the trigram index of domain names, searches will only match the '
+                  'start of words in domain names: {}'.format(error))
+        index_cache[db.alias] = True
+
+
+def drop_index(db=connection):
+    """Remove the full-text index."""
+    with db.cursor() as cursor:
+        if db.vendor == 'sqlite':
+            for trigger in TRIGGERS:
+                cursor.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(INDEX_NAME))
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(NAME_INDEX_NAME))
+        elif db.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS {}_idx'.format(INDEX_NAME))
+            cursor.execute('DROP INDEX IF EXISTS {}_idx'.format(NAME_INDEX_NAME))
+    index_cache[db.alias] = False
+    name_index_cache[db.alias] = False
+
+
+def parse_query(text):
+    """Split a search into a list of (column, term) tuples and a list of statuses. The column is
+    None for terms that search every column.
+
+    Parameters:
+    text            The search as typed, e.g. `name:shepherd cat:"web hosting" status:available`
+    """
+    terms = []
+    statuses = []
+    for qualifier, quoted, bare in TERM_PATTERN.findall(text):
+        term = (quoted or bare).strip()
+        qualifier = qualifier.lower()
+        if qualifier == 'status':
+            if term:
+                statuses.append(term)
+            continue
+        if qualifier and qualifier not in QUALIFIERS:
+            # Not a qualifier, so search for the whole thing (e.g. a URL)
+            term = '{}:{}'.format(qualifier, term)
+            qualifier = ''
+        if term:
+            terms.append((QUALIFIERS.get(qualifier), term))
+    return terms, statuses
+
+
+def sqlite_match(column, term):
+    """Return the FTS5 MATCH expression for a term. The term is quoted, so punctuation like the dots
+    in a domain name is not read as FTS5 syntax, and matched as a prefix.
+    """
+    phrase = '"{}"*'.format(term.replace('"', '""'))
+    return '{} : {}'.format(column, phrase) if column else phrase
+
+
+def postgresql_query(column, term):
+    """Return the tsquery for a term, limited to its column's weight when it is qualified."""
+    lexemes = []
+    for word in re.findall(r'\w[\w.-]*', term.lower()):
+        lexeme = "'{}':*".format(word.replace('\\', '\\\\').replace("'", "''"))
+        lexemes.append(lexeme + POSTGRESQL_WEIGHTS[column] if column else lexeme)
+    return ' & '.join(lexemes)
+
+
+def term_filter(db, column, term):
+    """Return the filter for one search term, using the full-text index when there is one.
+
+    Parameters:
+    db              The database connection the search runs on
+    column          The indexed column the term is limited to, or None for every column
+    term            The term to search for
+    """
+    # Whether to also find the term inside domain names, using the trigram index
+    substring = column in (None, 'name') and len(term) >= SUBSTRING_MIN_LENGTH
+    if db.vendor == 'sqlite' and index_exists(db):
+        sql = 'SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(INDEX_NAME)
+        params = [sqlite_match(column, term)]
+        if substring and name_index_exists(db):
+            sql += ' UNION SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(NAME_INDEX_NAME)
+            params.append('"{}"'.format(term.replace('"', '""')))
+        return Q(id__in=RawSQL(sql, params))
+    elif db.vendor == 'postgresql':
+        query = postgresql_query(column, term)
+        match = Q(id__in=RawSQL("SELECT id FROM catalog_domain WHERE ({}) @@ to_tsquery('simple', %s)".format(
+            postgresql_document()), [query])) if query else Q()
+        if substring and name_index_exists(db):
+            # Compiles to UPPER(name::text) LIKE, which the pg_trgm index covers
+            match |= Q(name__icontains=term)
+        return match
+    else:
+        # No full-text index, so fall back to scanning the columns
+        fields = FALLBACK_FIELDS[column] if column else [field for fields in FALLBACK_FIELDS.values() for field in fields]
+        match = Q()
+        for field in fields:
+            match |= Q(**{'{}__icontains'.format(field): term})
+        return match
+
+
+def search_domains(queryset, text):
+    """Filter a Domain queryset with a search.
+
+    Parameters:
+    queryset        The Domain queryset to filter
+    text            The search as typed, e.g. `name:shepherd cat:technology status:available`
+    """
+    terms, statuses = parse_query(text)
+    if statuses:
+        status_filter = Q()
+        for status in statuses:
+            status_filter |= Q(domain_status__domain_status__iexact=status)
+        queryset = queryset.filter(status_filter)
+    for column, term in terms:
+        queryset = queryset.filter(term_filter(connection, column, term))
+    return queryset
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the sweep framework shared by the tasks that walk the domain catalog. A
+sweep reads the domains in chunks ordered by ID, loading only the fields the task needs, so memory
+stays flat however large the catalog grows. After each chunk the task's writes and a checkpoint are
+committed together, so a sweep interrupted by a crash or worker recycle resumes after the last
+finished chunk instead of starting over.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.models import SweepCheckpoint
+
+
+class Sweep(object):
+    """Class to walk a queryset in checkpointed chunks."""
+
+    def __init__(self, name, queryset, fields, chunk_size=None, resume=True):
+        """Everything that should be initiated with a new object goes here.
+
+        Parameters:
+        name            The sweep's name, used for its checkpoint (e.g. health or dns)
+        queryset        The queryset to walk
+        fields          The fields to load for each object (the primary key is always loaded)
+        chunk_size      Objects per chunk; defaults to `chunk_size` in `SWEEP_CONFIG`
+        resume          Defaults to True. Set to False to ignore and not keep a checkpoint, e.g. for
+                        a one-off sweep over a subset of the catalog
+        """
+        try:
+            config = settings.SWEEP_CONFIG
+        except AttributeError:
+            config = {}
+        self.name = name
+        self.queryset = queryset.only(*fields).order_by('pk')
+        self.chunk_size = chunk_size or config.get('chunk_size', 200)
+        self.resume = resume
+        self.checkpoint = None
+        self.last_id = 0
+        self.processed = 0
+        if resume:
+            # A checkpoint older than `resume_window` seconds belongs to a sweep abandoned long ago
+            resume_window = datetime.timedelta(seconds=config.get('resume_window', 86400))
+            SweepCheckpoint.objects.filter(sweep=name, updated_at__lt=timezone.now() - resume_window).delete()
+            self.checkpoint, created = SweepCheckpoint.objects.get_or_create(sweep=name)
+            if not created and self.checkpoint.processed:
+                self.last_id = self.checkpoint.last_id
+                self.processed = self.checkpoint.processed
+                print('[*] Resuming the {} sweep after domain ID {} ({} domains already done).'.format(
+                    name, self.last_id, self.processed))
+
+    def count(self):
+        """Return the number of objects in the whole sweep, including those already done."""
+        return self.queryset.count()
+
+    def chunks(self):
+        """Yield the remaining objects as lists of at most `chunk_size` objects."""
+        cursor = self.last_id
+        while True:
+            chunk = list(self.queryset.filter(pk__gt=cursor)[:self.chunk_size])
+            if not chunk:
+                break
+            cursor = chunk[-1].pk
+            yield chunk
+
+    def commit(self, chunk):
+        """Record a finished chunk in the checkpoint. Call inside the transaction that saves the
+        chunk's results, so the results and the checkpoint are committed together.
+        """
+        self.last_id = chunk[-1].pk
+        self.processed += len(chunk)
+        if self.checkpoint:
+            self.checkpoint.last_id = self.last_id
+            self.checkpoint.processed = self.processed
+            self.checkpoint.updated_at = timezone.now()
+            self.checkpoint.save(update_fields=['last_id', 'processed', 'updated_at'])
+
+    def complete(self):
+        """Remove the checkpoint once every chunk is done, so the next sweep starts from the top."""
+        if self.checkpoint:
+            self.checkpoint.delete()
+            self.checkpoint = None
+
+    def run(self, process, write=None):
+        """Process every remaining chunk and commit its writes with the checkpoint.
+
+        Parameters:
+        process         Function called with each chunk that returns the chunk's results
+        write           Optional function called with the results inside the transaction that
+                        commits the checkpoint; batch the chunk's database writes here
+        """
+        for chunk in self.chunks():
+            results = process(chunk)
+            with transaction.atomic():
+                if write:
+                    write(results)
+                self.commit(chunk)
+        self.complete()
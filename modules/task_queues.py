@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module routes the tasks in tasks.py to separate Django Q queues ("lanes"), each served by
+its own cluster with its own workers. A multi-hour health sweep then only occupies the bulk lane,
+while releases, notifications, and urgent single-domain checks keep moving on the interactive
+lane. A lane refuses new tasks once its backlog reaches `queue_limit`.
+"""
+
+import ast
+
+from django.conf import settings
+from django_q.conf import Conf
+from django_q.brokers import get_broker
+from django_q.tasks import async_task
+
+
+# Lanes used when `TASK_QUEUES` is not in the settings; the interactive lane is the default
+# Django Q queue, served by the regular `qcluster` command
+DEFAULT_QUEUES = {
+    'interactive': {'workers': 2, 'queue_limit': 50},
+    'dns': {'workers': 1, 'queue_limit': 2},
+    'bulk': {'workers': 1, 'queue_limit': 2},
+}
+DEFAULT_ROUTES = {
+    'tasks.check_domains': 'bulk',
+    'tasks.update_registrations': 'bulk',
+    'tasks.update_dns': 'dns',
+}
+
+
+class QueueFull(Exception):
+    """Raised when a task is sent to a lane whose backlog has reached its `queue_limit`."""
+    pass
+
+
+def get_queues():
+    """Return the lane settings from `TASK_QUEUES`."""
+    return getattr(settings, 'TASK_QUEUES', DEFAULT_QUEUES)
+
+
+def lane_for(func):
+    """Return the name of the lane a task is routed to, or `interactive` for unrouted tasks.
+
+    Parameters:
+    func            The dotted name of the task (e.g. `tasks.check_domains`)
+    """
+    lane = getattr(settings, 'TASK_ROUTES', DEFAULT_ROUTES).get(func, 'interactive')
+    return lane if lane in get_queues() else 'interactive'
+
+
+def list_key(lane):
+    """Return the name of the broker queue for a lane. The interactive lane uses the default Django
+    Q queue, so scheduled tasks and the regular `qcluster` keep working unchanged.
+    """
+    if lane == 'interactive':
+        return Conf.PREFIX
+    return '{}-{}'.format(Conf.PREFIX, lane)
+
+
+def get_lane_broker(lane):
+    """Return a Django Q broker connected to a lane's queue."""
+    return get_broker(list_key(lane))
+
+
+def queue_size(lane):
+    """Return the number of tasks waiting in a lane's queue."""
+    return get_lane_broker(lane).queue_size()
+
+
+def enqueue_task(func, *args, **kwargs):
+    """Queue a task on the lane it is routed to and return the task ID. Raises QueueFull instead
+    of queueing when the lane already has `queue_limit` tasks waiting.
+
+    Parameters:
+    func            The dotted name of the task (e.g. `tasks.check_domains`)
+    *args           Positional arguments for the task
+    **kwargs        Keyword arguments for the task and async_task() options (e.g. `group`, `hook`)
+    """
+    lane = kwargs.pop('lane', None) or lane_for(func)
+    broker = get_lane_broker(lane)
+    queue_limit = get_queues()[lane].get('queue_limit')
+    if queue_limit:
+        waiting = broker.queue_size()
+        if waiting >= queue_limit:
+            raise QueueFull('The {} queue already has {} tasks waiting (limit {}), try again later'.format(
+                lane, waiting, queue_limit))
+    return async_task(func, *args, broker=broker, **kwargs)
+
+
+def schedule_options(func):
+    """Return the `q_options` that send a scheduled task to its lane, for use in the kwargs of a
+    Django Q schedule (e.g. `q_options={'broker_name': 'shepherd-bulk'}`). Without them the
+    scheduler queues the task on the interactive lane.
+    """
+    return {'broker_name': list_key(lane_for(func))}
+
+
+def route_schedule(schedule):
+    """Add the `q_options` from schedule_options() to the kwargs of a Django Q schedule for a routed
+    task, unless they already name a `broker_name`. This is connected to pre_save of Schedule in
+    catalog/signals.py, so schedules made in the admin run on their lane too.
+
+    Parameters:
+    schedule        The django_q Schedule about to be saved
+    """
+    if lane_for(schedule.func) == 'interactive':
+        return
+    # Django Q reads the kwargs field as the arguments of dict(), so parse it the same way but only
+    # accept literal values
+    try:
+        call = ast.parse('dict({})'.format(schedule.kwargs or ''), mode='eval').body
+        if call.args or any(keyword.arg is None for keyword in call.keywords):
+            raise ValueError('only keyword arguments are supported')
+        kwargs = {keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords}
+    except (SyntaxError, ValueError) as error:
+        print('[!] Could not route the schedule for {}, it will run on the interactive lane: {}'.format(
+            schedule.func, error))
+        return
+    q_options = kwargs.get('q_options') or {}
+    if q_options.get('broker_name'):
+        return
+    q_options.update(schedule_options(schedule.func))
+    kwargs['q_options'] = q_options
+    schedule.kwargs = ', '.join('{}={!r}'.format(name, value) for name, value in kwargs.items())
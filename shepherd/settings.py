@@ -122,6 +122,24 @@ LOGIN_REDIRECT_URL = '/'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Task queue configuration
+# Tasks are routed to separate Django Q queues ("lanes") so a long health sweep does not hold up
+# short jobs. The interactive lane is the default queue served by `manage.py qcluster`; start the
+# others with `manage.py qcluster_lane dns` and `manage.py qcluster_lane bulk`. Each lane runs
+# `workers` workers and refuses new tasks once `queue_limit` tasks are waiting. Tasks missing from
+# `TASK_ROUTES` go to the interactive lane. Schedules for routed tasks are sent to their lane
+# automatically when they are saved, unless their `q_options` already name a `broker_name`
+TASK_QUEUES = {
+    'interactive': {'workers': 2, 'queue_limit': 50},
+    'dns': {'workers': 1, 'queue_limit': 2},
+    'bulk': {'workers': 1, 'queue_limit': 2},
+}
+TASK_ROUTES = {
+    'tasks.check_domains': 'bulk',
+    'tasks.update_registrations': 'bulk',
+    'tasks.update_dns': 'dns',
+}
+
 # Django Q settings
 
 # Settings to be aware of:
@@ -135,6 +153,7 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # for everyone.
 Q_CLUSTER = {
     'name': 'shepherd',
+    'workers': TASK_QUEUES['interactive']['workers'],
     'recycle': 500,
     'save_limit': 35,
     'queue_limit': 500,
@@ -148,17 +167,142 @@ Q_CLUSTER = {
 
 # DomainCheck configuration
 # Enter a VirusTotal API key (free or paid)
+# Providers listed in `disabled_providers` are skipped (e.g. ['bluecoat', 'websense']), and a
+# provider missing its settings or libraries is disabled automatically
+# Scraped providers (Talos, TrendMicro, Fortiguard, MXToolbox, etc.) can be spread across a pool of
+# egress proxies, e.g. ['http://127.0.0.1:3128']. `proxy_budgets` caps the lookups one proxy may
+# send to each provider per `proxy_budget_window` seconds (`default` covers unlisted providers) and a
+# proxy that is CAPTCHA'd or fails `proxy_max_failures` times in a row is benched for
+# `proxy_bench_time` seconds. When every proxy is spent or benched, a provider is skipped for the
+# domain instead of waiting more than `proxy_max_wait` seconds for one to come back
 DOMAINCHECK_CONFIG = {
     'virustotal_api_key': '',
     'sleep_time': 20,
+    'request_timeout': 30,
+    'disabled_providers': [],
+    'proxies': [],
+    'proxy_budgets': {'default': 60},
+    'proxy_budget_window': 3600,
+    'proxy_bench_time': 900,
+    'proxy_max_failures': 3,
+    'proxy_max_wait': 60,
+}
+
+# Sweep configuration
+# Health checks, DNS updates, and RDAP refreshes walk the catalog `chunk_size` domains at a time
+# (the DNS and RDAP tasks use their own `batch_size`) and save a checkpoint after each chunk. A sweep
+# that stops partway resumes from its checkpoint, unless the checkpoint is older than
+# `resume_window` seconds
+SWEEP_CONFIG = {
+    'chunk_size': 50,
+    'resume_window': 86400,
+}
+
+# DNS configuration
+# `concurrency` caps the DNS queries in flight during a DNS update and `batch_size` is the number of
+# domains collected before their records are saved
+# Answers are cached for their TTL (clamped to `cache_min_ttl`/`cache_max_ttl`) in a per-process LRU
+# of `cache_entries` answers, and in Redis for all workers if `cache_redis` is True. NXDOMAIN and
+# NoAnswer results are cached for the SOA minimum, or `cache_negative_ttl` if there is no SOA
+# Queries go to the healthiest of the `resolvers`, at most `resolver_max_in_flight` at a time each,
+# and are retried on up to `resolver_attempts` resolvers. A resolver is benched for
+# `resolver_bench_time` seconds after `resolver_max_failures` failures in a row
+DNS_CONFIG = {
+    'concurrency': 50,
+    'batch_size': 500,
+    'cache': True,
+    'cache_entries': 10000,
+    'cache_redis': False,
+    'cache_min_ttl': 0,
+    'cache_max_ttl': 86400,
+    'cache_negative_ttl': 300,
+    # Upstream resolvers as `address` or `address:port`; leave empty to use the system resolvers
+    'resolvers': [],
+    'resolver_timeout': 1,
+    'resolver_attempts': 3,
+    'resolver_max_in_flight': 25,
+    'resolver_max_failures': 5,
+    'resolver_bench_time': 30,
+}
+
+# IP reputation configuration
+# The passive DNS addresses of each domain can be checked against IP/CIDR blocklist feeds instead of
+# Cymon. Each feed needs a `name` and a `url` or a local `path`; lines may hold an IP address, a
+# CIDR block, or a `first-last` range. Feeds are checked for changes every `refresh_interval`
+# seconds and downloads are kept in `cache_dir` (default: ip_feeds/ in the project directory).
+# Leave `feeds` empty to keep using Cymon. Example feeds:
+#    {'name': 'spamhaus_drop', 'url': 'https://www.spamhaus.org/drop/drop.txt'},
+#    {'name': 'spamhaus_dropv6', 'url': 'https://www.spamhaus.org/drop/dropv6.txt'},
+#    {'name': 'feodo_tracker', 'url': 'https://feodotracker.abuse.ch/downloads/ipblocklist.txt'},
+IP_REPUTATION_CONFIG = {
+    'feeds': [],
+    'refresh_interval': 3600,
+    'cache_dir': '',
+    'request_timeout': 30,
+}
+
+# RDAP configuration
+# `tasks.update_registrations` refreshes each domain's expiration date, registrar, and WHOIS privacy
+# status from the registry's RDAP server, found through the IANA bootstrap file. `servers` maps a TLD
+# to an RDAP base URL to override the bootstrap (`*` covers every TLD, e.g. a stand-in server).
+# `rate_limits` caps the requests per minute sent to each RDAP server by host name (`default`
+# covers unlisted servers) and answers are cached in Redis for `cache_ttl` seconds
+RDAP_CONFIG = {
+    'bootstrap_url': 'https://data.iana.org/rdap/dns.json',
+    'servers': {},
+    'concurrency': 10,
+    'batch_size': 200,
+    'rate_limits': {'default': 60},
+    'cache_ttl': 43200,
+    'request_timeout': 15,
+}
+
+# Registrar configuration
+# `tasks.sync_registrars` adds the domains in each enabled registrar account to the catalog and keeps
+# their registrar, purchase and expiration dates, and WHOIS privacy status in sync. Namecheap needs
+# API access enabled for the account and this server's IP address whitelisted as `client_ip`.
+# `username` defaults to `api_user`; point `api_url` at https://api.sandbox.namecheap.com/xml.response
+# or a stand-in server (`manage.py registrar_standin`) for testing. Namecheap allows 20 API calls per
+# minute, so pages are requested at most `requests_per_minute` a minute and a rate-limited request is
+# retried up to `rate_limit_retries` times, waiting `rate_limit_wait` seconds longer each time
+REGISTRAR_CONFIG = {
+    'namecheap': {
+        'enabled': False,
+        'api_url': 'https://api.namecheap.com/xml.response',
+        'api_user': '',
+        'api_key': '',
+        'username': '',
+        'client_ip': '',
+        'page_size': 100,
+        'request_timeout': 30,
+        'requests_per_minute': 20,
+        'rate_limit_retries': 5,
+        'rate_limit_wait': 60,
+    },
+}
+
+# Metrics configuration
+# Prometheus can scrape /metrics with `Authorization: Bearer <token>` once a bearer token is set;
+# with no token only logged in users can see the metrics
+METRICS_CONFIG = {
+    'bearer_token': '',
 }
 
 # Slack configuration
+# Messages are queued and posted by the `tasks.send_notifications` task, one digest per channel
+# listing up to `digest_size` messages. Burn alerts also go to the checked-out project's channel. A
+# failed post is retried up to `max_attempts` times, waiting `retry_backoff` seconds and doubling
+# each time up to `retry_backoff_max`
 SLACK_CONFIG = {
     'enable_slack': False,
     'slack_emoji': ':sheep:',
     'slack_channel': '#shepherd',
     'slack_alert_target': '<@cmaddalena>',
     'slack_username': 'Commander Shepherd',
-    'slack_webhook_url': 'https://hooks.slack.com/services/SLACK_WEBHOOK_ID'
+    'slack_webhook_url': 'https://hooks.slack.com/services/SLACK_WEBHOOK_ID',
+    'digest_size': 20,
+    'max_attempts': 6,
+    'retry_backoff': 30,
+    'retry_backoff_max': 3600,
+    'request_timeout': 10,
 }
\ No newline at end of file
@@ -11,9 +11,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.views.generic import RedirectView
 
+from catalog import views as catalog_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('catalog/', include('catalog.urls')),
+    path('metrics', catalog_views.metrics, name='metrics'),
     path('', RedirectView.as_view(url='/catalog/', permanent=True)),
 ]
 
@@ -2,53 +2,70 @@
 
 # Import the catalog application's models and settings
 from django.conf import settings
-from catalog.models import Domain, History, DomainStatus, HealthStatus
+from django.db import transaction
+from django.db.models import Exists, Max, Q, Subquery
+from django.utils import timezone
+from catalog.models import Domain, History, DomainStatus, HealthStatus, WhoisStatus, DNSRecord, DNSRecordChange, RegistrarSync
 
 # Import custom modules
 from modules.review import DomainReview
 from modules.dns import DNSCollector
+from modules.rdap import RDAPCollector
+from modules.registrars import get_providers
+from modules.progress import SweepProgress
+from modules.sweeps import Sweep
+from modules import metrics
+from modules.infrastructure import links_from_records, update_links
+from modules.notifications import queue_notification, deliver_notifications
+from modules.dashboard import invalidate_counts
+
+# Import Django Q for queueing the notification task
+from django_q.models import Schedule
+from django_q.tasks import schedule
+from modules.task_queues import enqueue_task, QueueFull
 
 # Import Python libraries for various things
 import json
-import requests
+import time
+import hashlib
 import datetime
+from collections import Counter
 from datetime import date
 
 
-def send_slack_msg(message):
-    """Accepts message text and sends it to Slack. This requires Slack settings and a webhook be
-    configured in the application's settings.
+def send_slack_msg(message, channels=None):
+    """Accepts message text and queues it for Slack. The message is posted by the notification task
+    from a Django Q worker, batched with any other messages waiting for the same channel. This
+    requires Slack settings and a webhook be configured in the application's settings.
 
     Parameters:
 
     message         A string to be sent as the Slack message
+    channels        Optional list of extra channels (e.g. a project's channel) to also send it to
     """
+    if queue_notification(message, channels):
+        trigger_notifications()
+
+def trigger_notifications():
+    """Queue the notification task to post any waiting Slack messages."""
     try:
-        enable_slack = settings.SLACK_CONFIG['enable_slack']
-    except:
-        enable_slack = False
-    if enable_slack:
-        try:
-            slack_emoji = settings.SLACK_CONFIG['slack_emoji']
-            slack_username = settings.SLACK_CONFIG['slack_username']
-            slack_webhook_url = settings.SLACK_CONFIG['slack_webhook_url']
-            slack_alert_target = settings.SLACK_CONFIG['slack_alert_target']
-            slack_channel = settings.SLACK_CONFIG['slack_channel']
-            slack_capable = True
-        except Exception as error:
-            slack_capable = False
-
-        if slack_capable:
-            message = slack_alert_target + ' ' + message
-            slack_data = {
-                        'username': slack_username, 
-                        'icon_emoji': slack_emoji, 
-                        'channel': slack_channel, 
-                        'text': message
-                        }
-            response = requests.post(slack_webhook_url, data=json.dumps(slack_data), headers={'Content-Type':'application/json'})
-            if response.status_code != 200:
-                print('[!] Request to slack returned an error %s, the response is:\n%s' % (response.status_code, response.text))
+        enqueue_task('tasks.send_notifications', group='Notifications')
+    except QueueFull:
+        # A backed-up queue will get to the waiting messages anyway
+        pass
+    except Exception as error:
+        print('[!] Could not queue the notification task: {}'.format(error))
+
+def send_notifications():
+    """Post the queued Slack messages, one digest per channel. If any posts failed, another run is
+    scheduled for when the earliest retry is due, so retries do not depend on a regular schedule.
+    """
+    sent, pending, next_attempt = deliver_notifications()
+    if next_attempt and not Schedule.objects.filter(func='tasks.send_notifications', schedule_type=Schedule.ONCE,
+                                                    next_run__lte=next_attempt).exists():
+        schedule('tasks.send_notifications', name='Notification retry {}'.format(next_attempt.isoformat()),
+                 schedule_type=Schedule.ONCE, next_run=next_attempt, repeats=1)
+    return 'Sent {} notifications, {} waiting for a retry'.format(sent, pending)
 
 def send_slack_complete_msg(task):
     """Function to send a Slack message for a task. Meant to be used as a hook for an async_task()."""
@@ -62,136 +79,432 @@ def send_slack_complete_msg(task):
 
 def release_domains(no_action=False):
     """Pull all domains currently checked-out in Shepherd and update the status to Available if the
-    project's end date is today or in the past.
+    project's end date is today or in the past. The domains are found with one aggregate query (the
+    latest end date of each `Unavailable` domain's projects) and released with one bulk update.
+    Returns a summary naming the released domains.
 
     Parameters:
 
-    no_action       Defaults to False. Set to True to take no action and just return a list
-                    of domains that should be released now.
+    no_action       Defaults to False. Set to True to take no action and just return a summary
+                    of the domains that should be released now.
     """
-    domains_to_be_released = []
-    # First get all domains set to `Unavailable`
-    queryset = Domain.objects.filter(domain_status__domain_status='Unavailable')
-    # Go through each `Unavailable` domain and check it against projects
-    for domain in queryset:
-        # Get all projects for the domain
-        project_queryset = History.objects.filter(domain__name=domain.name)
-        release_me = True
-        # Check each project's end date to determine if all are in the past or not
-        for project in project_queryset:
-            if date.today() < project.end_date:
-                release_me = False
-        # If release_me is still true, release the domain
-        if release_me:
-            domains_to_be_released.append(domain)
-    # Check no_action and just return list if it is set to True
+    # Domains are released once the latest end date of their projects has arrived (or if they
+    # have no projects at all)
+    releasable = Domain.objects.filter(domain_status__domain_status='Unavailable').order_by().values(
+        'id').annotate(last_end_date=Max('history__end_date')).filter(
+        Q(last_end_date__lte=date.today()) | Q(last_end_date__isnull=True))
+    candidates = dict(Domain.objects.filter(id__in=releasable.values('id')).values_list('id', 'name'))
+    # Check no_action and just return the summary if it is set to True
     if no_action:
-        return domains_to_be_released
-    else:
-        for domain in domains_to_be_released:
-            print('Releasing {} back into the pool.'.format(domain.name))
-            domain_instance = Domain.objects.get(name=domain.name)
-            domain_instance.domain_status = DomainStatus.objects.get(domain_status='Available')
-            domain_instance.save()
-        return domains_to_be_released
-
-def check_domains():
-    """Initiate a check of all domains in the Domain model and update each domain status."""
-    # Get all domains from the database
-    domain_queryset = Domain.objects.all()
-    domain_review = DomainReview(domain_queryset)
-    lab_results = domain_review.check_domain_status()
+        return release_summary('Would release', candidates.values())
+    if not candidates:
+        return release_summary('Released', [])
+    available = DomainStatus.objects.filter(domain_status='Available')
+    released_at = timezone.now()
+    with transaction.atomic():
+        # The update repeats the aggregate, so a domain checked out again in the meantime stays put
+        Domain.objects.filter(Exists(available), id__in=releasable.values('id')).filter(
+            id__in=list(candidates)).update(domain_status=Subquery(available.values('id')[:1]), updated_at=released_at)
+    # Only name the domains this update released
+    released = list(Domain.objects.filter(id__in=list(candidates), updated_at=released_at).values_list('name', flat=True))
+    # update() sends no signals, so refresh the dashboard counts here
+    invalidate_counts()
+    for domain_name in sorted(released):
+        print('Releasing {} back into the pool.'.format(domain_name))
+    return release_summary('Released', released)
+
+def release_summary(action, domain_names):
+    """Return the summary of a release_domains() run, e.g. `Released 2 domains: a.com, b.com`."""
+    domain_names = sorted(domain_names)
+    if not domain_names:
+        return '{} 0 domains'.format(action)
+    return '{} {} domains: {}'.format(action, len(domain_names), ', '.join(domain_names))
+
+def save_health_results(lab_results, project_channels):
+    """Write the results of a chunk of health checks with one bulk update, queue a Slack alert for
+    each burned domain, and index the passive DNS addresses. Returns the number of domains burned.
+
+    Parameters:
+
+    lab_results     Dictionary of Domain object to results, as returned by check_domain_status()
+    project_channels Dictionary of domain ID to the Slack channels of its active projects
+    """
+    burned_health = HealthStatus.objects.get(health_status='Burned')
+    burned_status = DomainStatus.objects.get(domain_status='Burned')
+    # The statuses are left out of the bulk update, because the domains were loaded at the start of
+    # the chunk and a checkout or release since then would be reverted
+    fields = ['health_dns', 'burned_explanation', 'all_cat', 'talos_cat', 'opendns_cat', 'bluecoat_cat',
+              'ibm_xforce_cat', 'trendmicro_cat', 'fortiguard_cat', 'websense_cat', 'mx_toolbox_status',
+              'updated_at']
+    checked_at = timezone.now()
+    burned_count = 0
+    burned_ids = []
+    passive_dns = {}
+    updated_domains = []
     for domain in lab_results:
         try:
-            # The `domain` is already a Domain object so this query might be unnecessary :thinking_emoji:
-            domain_instance = Domain.objects.get(name=domain.name)
             # Flip status if a domain has been flagged as burned
             if lab_results[domain]['burned']:
-                domain_instance.health_status = HealthStatus.objects.get(health_status='Burned')
-                domain_instance.domain_status = DomainStatus.objects.get(domain_status='Burned')
+                burned_ids.append(domain.id)
                 message = '*{}* has been flagged as burned because: {}'.format(domain.name, lab_results[domain]['burned_explanation'])
                 if lab_results[domain]['categories']['bad']:
                     message = message + ' (Bad categories: {})'.format(lab_results[domain]['categories']['bad'])
-                send_slack_msg(message)
+                queue_notification(message, project_channels.get(domain.id))
+                burned_count += 1
+                metrics.domains_burned.inc()
             # Update other fields for the domain object
-            domain_instance.health_dns = lab_results[domain]['health_dns']
-            domain_instance.burned_explanation = lab_results[domain]['burned_explanation']
-            domain_instance.all_cat = lab_results[domain]['categories']['all']
-            domain_instance.talos_cat = lab_results[domain]['categories']['talos']
-            domain_instance.opendns_cat = lab_results[domain]['categories']['opendns']
-            domain_instance.bluecoat_cat = lab_results[domain]['categories']['bluecoat']
-            domain_instance.ibm_xforce_cat = lab_results[domain]['categories']['xforce']
-            domain_instance.trendmicro_cat = lab_results[domain]['categories']['trendmicro']
-            domain_instance.fortiguard_cat = lab_results[domain]['categories']['fortiguard']
-            domain_instance.websense_cat = lab_results[domain]['categories']['websense']
-            domain_instance.mx_toolbox_status = lab_results[domain]['categories']['mxtoolbox']
-            domain_instance.save()
+            domain.health_dns = lab_results[domain]['health_dns']
+            domain.burned_explanation = lab_results[domain]['burned_explanation']
+            domain.all_cat = lab_results[domain]['categories']['all']
+            domain.talos_cat = lab_results[domain]['categories']['talos']
+            domain.opendns_cat = lab_results[domain]['categories']['opendns']
+            domain.bluecoat_cat = lab_results[domain]['categories']['bluecoat']
+            domain.ibm_xforce_cat = lab_results[domain]['categories']['xforce']
+            domain.trendmicro_cat = lab_results[domain]['categories']['trendmicro']
+            domain.fortiguard_cat = lab_results[domain]['categories']['fortiguard']
+            domain.websense_cat = lab_results[domain]['categories']['websense']
+            domain.mx_toolbox_status = lab_results[domain]['categories']['mxtoolbox']
+            domain.updated_at = checked_at
+            updated_domains.append(domain)
+            # Only index passive DNS when VirusTotal answered, so a skipped lookup keeps the links
+            if lab_results[domain]['resolutions'] is not None:
+                passive_dns[domain.id] = {'ip': {resolution['address']: resolution['date']
+                                                 for resolution in lab_results[domain]['resolutions']}}
         except Exception as error:
             print('[!] Error updating "{}". Error: {}'.format(domain.name, error))
-            pass
+    Domain.objects.bulk_update(updated_domains, fields)
+    if burned_ids:
+        Domain.objects.filter(id__in=burned_ids).update(health_status=burned_health, domain_status=burned_status)
+    if burned_count:
+        invalidate_counts()
+    update_links('passive_dns', passive_dns)
+    return burned_count
+
+def check_domains(domain_queryset=None, profiler=None, sweep='health', dry_run=False):
+    """Initiate a check of all domains in the Domain model and update each domain status. Domains
+    are checked one chunk at a time and each chunk's results are committed with a checkpoint, so a
+    full sweep that is interrupted resumes where it stopped.
+
+    Parameters:
+
+    domain_queryset Defaults to all domains. Pass a queryset to check only those domains.
+    profiler        Optional ReviewProfiler used to time each provider call and database flush
+    sweep           Name the progress and metrics are published under, so a one-off check does not
+                    overwrite the progress of a running sweep
+    dry_run         Defaults to False. Set to True to check the domains without saving the results
+                    or sending burn alerts, e.g. when profiling against a live catalog.
+    """
+    # Only a sweep of the whole catalog keeps a checkpoint; a subset is cheap to run again
+    resume = domain_queryset is None and not dry_run
+    # Get all domains from the database
+    if domain_queryset is None:
+        domain_queryset = Domain.objects.all()
+    domain_sweep = Sweep(sweep, domain_queryset.select_related('health_status'),
+                         ['name', 'domain_status', 'health_status__health_status'], resume=resume)
+    progress = SweepProgress(sweep, domain_sweep.count())
+    progress.done = domain_sweep.processed
+    domain_review = DomainReview(domain_queryset, profiler=profiler, progress=progress)
+    # Burn alerts also go to the Slack channel of the project that has the domain checked out
+    project_channels = {}
+    for domain_id, slack_channel in History.objects.filter(end_date__gte=date.today()).exclude(
+            slack_channel__isnull=True).exclude(slack_channel='').order_by('end_date').values_list(
+            'domain_id', 'slack_channel'):
+        project_channels.setdefault(domain_id, []).append(slack_channel)
+    sweep_start = time.time()
+    totals = {'checked': 0, 'burned': 0}
+
+    def write(lab_results):
+        with domain_review.measure('db_flush'):
+            totals['burned'] += save_health_results(lab_results, project_channels)
+        totals['checked'] += len(lab_results)
+
+    def count(lab_results):
+        totals['burned'] += sum(1 for results in lab_results.values() if results['burned'])
+        totals['checked'] += len(lab_results)
+
+    try:
+        domain_sweep.run(domain_review.check_domain_status, count if dry_run else write)
+    except Exception:
+        progress.complete('failed')
+        raise
+    finally:
+        if totals['burned'] and not dry_run:
+            trigger_notifications()
+    progress.complete()
+    metrics.sweep_duration.observe(time.time() - sweep_start, sweep=sweep)
+    metrics.sweep_domains.inc(totals['checked'], sweep=sweep)
+    # Only a full health sweep sets the gauge, so a one-off check does not overwrite it
+    if sweep == 'health':
+        metrics.last_sweep_burned.set(totals['burned'])
+    return 'Checked {} domains, {} burned'.format(totals['checked'], totals['burned'])
+
+def check_domain(domain_id):
+    """Check the health of a single domain right away, e.g. before it is checked out. This runs on
+    the interactive lane, so it does not wait for a bulk sweep to finish.
+
+    Parameters:
+
+    domain_id       The ID of the domain to check
+    """
+    domain_queryset = Domain.objects.filter(id=domain_id)
+    check_domains(domain_queryset, sweep='health_single')
+    domain = domain_queryset.select_related('health_status').first()
+    return '{} is {}'.format(domain.name, domain.health_status) if domain else 'Domain {} no longer exists'.format(domain_id)
+
+def save_dns_records(results):
+    """Compare a batch of fresh DNS answers with the stored records and write only the
+    differences: new values are inserted, values that disappeared are deleted, and each change is
+    logged as a DNSRecordChange for the domain's DNS timeline. Unchanged rows are not touched.
+    The infrastructure overlap index is updated from the same answers. Returns a tuple of the
+    number of records added and removed.
+
+    Parameters:
+
+    results         List of (domain ID, records, failures) tuples, where records is the dictionary
+                    of record label to (list of values, TTL) and failures is the list of labels
+                    whose queries failed, as yielded by DNSCollector.collect_many()
+    """
+    changed_at = timezone.now()
+    # Load the stored records for the batch as {domain ID: {record type: {value: row ID}}}
+    stored = {}
+    stored_rows = DNSRecord.objects.filter(domain_id__in=[domain_id for domain_id, _, _ in results])
+    for record_id, domain_id, record_type, value in stored_rows.values_list('id', 'domain_id', 'record_type', 'value'):
+        stored.setdefault(domain_id, {}).setdefault(record_type, {})[value] = record_id
+    new_records = []
+    removed_ids = []
+    changes = []
+    for domain_id, records, failures in results:
+        for record_type, (values, ttl) in records.items():
+            # A failed query says nothing about the domain's records, so keep what is stored
+            if record_type in failures:
+                continue
+            old_values = stored.get(domain_id, {}).get(record_type, {})
+            fresh_values = set(values)
+            for value in sorted(fresh_values - set(old_values)):
+                new_records.append(DNSRecord(domain_id=domain_id, record_type=record_type, value=value,
+                                             value_hash=DNSRecord.hash_value(value), ttl=ttl,
+                                             observed_at=changed_at))
+                changes.append(DNSRecordChange(domain_id=domain_id, action='added', record_type=record_type,
+                                               value=value, changed_at=changed_at))
+            for value in sorted(set(old_values) - fresh_values):
+                removed_ids.append(old_values[value])
+                changes.append(DNSRecordChange(domain_id=domain_id, action='removed', record_type=record_type,
+                                               value=value, changed_at=changed_at))
+    if changes:
+        with transaction.atomic():
+            DNSRecord.objects.filter(id__in=removed_ids).delete()
+            DNSRecord.objects.bulk_create(new_records)
+            DNSRecordChange.objects.bulk_create(changes)
+        # One increment per record type and action; the first update logs every record as added
+        for (record_type, action), count in Counter((change.record_type, change.action) for change in changes).items():
+            metrics.dns_record_changes.inc(count, record_type=record_type, action=action)
+    update_links('dns', {domain_id: links_from_records(records, failures) for domain_id, records, failures in results})
+    return len(new_records), len(removed_ids)
 
 def update_dns():
-    """Initiate a check of all domains in the Domain model and update each domain's DNS records."""
+    """Initiate a check of all domains in the Domain model and update each domain's DNS records.
+    Queries for many domains run concurrently, capped by `concurrency` in `DNS_CONFIG`, and the
+    records that changed since the last update are written one chunk of `batch_size` domains at a
+    time, each with a checkpoint so an interrupted update resumes where it stopped.
+    """
     dns_toolkit = DNSCollector()
-    # Get all domains from the database
-    domain_queryset = Domain.objects.all()
-    for domain in domain_queryset:
-        # Get each type of DNS record for the domain
-        try:
-            try:
-                temp = []
-                ns_records_list = dns_toolkit.get_dns_record(domain.name, 'NS')
-                for rdata in ns_records_list.response.answer:
-                    for item in rdata.items:
-                        temp.append(item.to_text())
-                ns_records = ', '.join(x.strip('.') for x in temp)
-            except:
-                ns_records = 'None'
-            try:
-                temp = []
-                a_records = dns_toolkit.get_dns_record(domain.name, 'A')
-                for rdata in a_records.response.answer:
-                    for item in rdata.items:
-                        temp.append(item.to_text())
-                a_records = ', '.join(temp)
-            except:
-                a_records = None
-            try:
-                mx_records = dns_toolkit.return_dns_record_list(domain.name, 'MX')
-            except:
-                mx_records = None
-            try:
-                txt_records = dns_toolkit.return_dns_record_list(domain.name, 'TXT')
-            except:
-                txt_records = None
-            try:
-                soa_records = dns_toolkit.return_dns_record_list(domain.name, 'SOA')
-            except:
-                soa_records = None
-            try:
-                dmarc_record = dns_toolkit.return_dns_record_list('_dmarc.' + domain.name, 'TXT')
-            except:
-                dmarc_record = None
-            # Assemble the string to be stored in the database
-            dns_records_string = ''
-            if ns_records:
-                dns_records_string += 'NS: %s ::: ' % ns_records
-            if a_records:
-                dns_records_string += 'A: %s ::: ' % a_records
-            if mx_records:
-                dns_records_string += 'MX: %s ::: ' % mx_records
-                if dmarc_record:
-                    dns_records_string += 'DMARC: %s ::: ' % dmarc_record
-                else:
-                    dns_records_string += 'DMARC: MX configured without a DMARC record! ::: '
-            if txt_records:
-                dns_records_string += 'TXT: %s ::: ' % txt_records
-            if soa_records:
-                dns_records_string += 'SOA: %s ::: ' % soa_records
-        except:
-            dns_records_string = 'None'
-        # Look-up the individual domain and save the new record string for that domain
-        domain_instance = Domain.objects.get(name=domain.name)
-        domain_instance.dns_record = dns_records_string
-        domain_instance.save()
+    domain_sweep = Sweep('dns', Domain.objects.all(), ['name'], chunk_size=dns_toolkit.batch_size)
+    progress = SweepProgress('dns', domain_sweep.count())
+    progress.done = domain_sweep.processed
+    sweep_start = time.time()
+    cache_stats = dns_toolkit.answer_cache.stats()
+    totals = {'added': 0, 'removed': 0}
+
+    def collect(chunk):
+        domain_ids = {domain.name: domain.id for domain in chunk}
+        results = []
+        for domain_name, records, failures in dns_toolkit.collect_many(domain_ids):
+            progress.start_domain(domain_name)
+            for label in failures:
+                progress.record_failure(label)
+            results.append((domain_ids[domain_name], records, failures))
+            progress.finish_domain()
+        return results
+
+    def write(results):
+        added, removed = save_dns_records(results)
+        totals['added'] += added
+        totals['removed'] += removed
+
+    try:
+        domain_sweep.run(collect, write)
+    except Exception:
+        progress.complete('failed')
+        raise
+    progress.complete()
+    print('[*] DNS update found {} new and {} removed records.'.format(totals['added'], totals['removed']))
+    dns_toolkit.answer_cache.publish(cache_stats)
+    metrics.sweep_duration.observe(time.time() - sweep_start, sweep='dns')
+    metrics.sweep_domains.inc(progress.done, sweep='dns')
+
+def update_registrations():
+    """Refresh the expiration date, registrar, and WHOIS privacy status of every domain from RDAP.
+    Lookups run concurrently with a rate limit for each registry, and only domains whose data
+    changed are written, one checkpointed chunk of `batch_size` domains at a time.
+    """
+    rdap_toolkit = RDAPCollector()
+    fields = ['expiration', 'registrar', 'whois_status']
+    domain_sweep = Sweep('rdap', Domain.objects.all(), ['name'] + fields, chunk_size=rdap_toolkit.batch_size)
+    whois_statuses = {status.whois_status: status for status in WhoisStatus.objects.all()}
+    progress = SweepProgress('rdap', domain_sweep.count())
+    progress.done = domain_sweep.processed
+    sweep_start = time.time()
+    totals = {'checked': 0, 'updated': 0, 'failed': 0}
+
+    def collect(chunk):
+        domains = {domain.name: domain for domain in chunk}
+        changed_domains = []
+        for domain_name, result, error in rdap_toolkit.collect_many(domains):
+            progress.start_domain(domain_name)
+            totals['checked'] += 1
+            if error:
+                print('[!] RDAP lookup failed for {}: {}'.format(domain_name, error))
+                progress.record_failure('rdap')
+                totals['failed'] += 1
+            else:
+                domain = domains[domain_name]
+                changed = False
+                if result.get('expiration') and result['expiration'] != domain.expiration:
+                    domain.expiration = result['expiration']
+                    changed = True
+                if result.get('registrar') and result['registrar'] != domain.registrar:
+                    domain.registrar = result['registrar']
+                    changed = True
+                whois_status = whois_statuses.get(result.get('whois_status'))
+                if whois_status and whois_status.id != domain.whois_status_id:
+                    domain.whois_status = whois_status
+                    changed = True
+                if changed:
+                    domain.updated_at = timezone.now()
+                    changed_domains.append(domain)
+            progress.finish_domain()
+        return changed_domains
+
+    def write(changed_domains):
+        Domain.objects.bulk_update(changed_domains, fields + ['updated_at'])
+        totals['updated'] += len(changed_domains)
 
+    try:
+        domain_sweep.run(collect, write)
+    except Exception:
+        progress.complete('failed')
+        raise
+    progress.complete()
+    metrics.sweep_duration.observe(time.time() - sweep_start, sweep='rdap')
+    metrics.sweep_domains.inc(totals['checked'], sweep='rdap')
+    return 'Checked {} domains: {} updated, {} lookups failed'.format(totals['checked'], totals['updated'], totals['failed'])
+
+def page_digest(domains):
+    """Return a digest of a page of registrar domains, used to spot pages that did not change."""
+    data = json.dumps(sorted(domains, key=lambda domain: domain['name']), sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+def save_registrar_domains(domains):
+    """Create the registrar domains missing from the catalog and update the registrar, dates, and
+    WHOIS privacy of the ones that changed, in bulk. Domains are matched by name. Expired domains
+    that are not already in the catalog are skipped. Returns a tuple of the number of domains
+    created and updated.
+
+    Parameters:
+
+    domains         List of domain dictionaries as yielded by a RegistrarProvider
+    """
+    fields = ['registrar', 'creation', 'expiration', 'whois_status']
+    existing = {domain.name: domain for domain in Domain.objects.filter(
+        name__in=[domain['name'] for domain in domains]).only('id', 'name', *fields)}
+    whois_statuses = {status.whois_status: status.id for status in WhoisStatus.objects.all()}
+    healthy = HealthStatus.objects.get(health_status='Healthy')
+    available = DomainStatus.objects.get(domain_status='Available')
+    new_domains = []
+    changed_domains = []
+    for entry in domains:
+        whois_status_id = whois_statuses.get(entry['whois_status'])
+        domain = existing.get(entry['name'])
+        if domain is None:
+            if entry['expired'] or not entry['creation'] or not entry['expiration']:
+                continue
+            new_domains.append(Domain(name=entry['name'], registrar=entry['registrar'],
+                                      creation=entry['creation'], expiration=entry['expiration'],
+                                      whois_status_id=whois_status_id,
+                                      health_status=healthy, domain_status=available))
+            continue
+        changed = False
+        for field, value in (('registrar', entry['registrar']), ('creation', entry['creation']),
+                             ('expiration', entry['expiration']), ('whois_status_id', whois_status_id)):
+            if value and getattr(domain, field) != value:
+                setattr(domain, field, value)
+                changed = True
+        if changed:
+            domain.updated_at = timezone.now()
+            changed_domains.append(domain)
+    if new_domains or changed_domains:
+        with transaction.atomic():
+            Domain.objects.bulk_create(new_domains)
+            Domain.objects.bulk_update(changed_domains, fields + ['updated_at'])
+        if new_domains:
+            invalidate_counts()
+    return len(new_domains), len(changed_domains)
+
+def sync_registrars(full=False):
+    """Sync the domain inventory of every registrar account enabled in `REGISTRAR_CONFIG` into the
+    catalog. The account's domain list is read a page at a time and a page is only compared with
+    the catalog if it changed since the last sync. A checkpoint is saved after every page, so an
+    interrupted sync resumes where it stopped.
+
+    Parameters:
+
+    full            Defaults to False. Set to True to compare every page, even unchanged ones.
+    """
+    try:
+        providers = get_providers(settings.REGISTRAR_CONFIG)
+    except AttributeError:
+        providers = []
+    summary = []
+    for provider in providers:
+        checkpoint, _ = RegistrarSync.objects.get_or_create(provider=provider.name, account=provider.account)
+        # The digest and number of domains of each page, as of the last time it was compared
+        pages = json.loads(checkpoint.page_digests)
+        if full:
+            checkpoint.cursor = None
+        if checkpoint.cursor:
+            print('[*] Resuming the {} sync at page {}.'.format(provider.name, checkpoint.cursor))
+        else:
+            checkpoint.last_started = timezone.now()
+        created = updated = unchanged = read = 0
+        from_start = not checkpoint.cursor
+        seen_pages = set()
+        for page, next_page, domains in provider.list_domains(checkpoint.cursor):
+            read += len(domains)
+            digest = page_digest(domains)
+            if not full and pages.get(page, [None])[0] == digest:
+                unchanged += len(domains)
+            else:
+                page_created, page_updated = save_registrar_domains(domains)
+                created += page_created
+                updated += page_updated
+                pages[page] = [digest, len(domains)]
+            seen_pages.add(page)
+            checkpoint.cursor = next_page
+            checkpoint.page_digests = json.dumps(pages)
+            checkpoint.save()
+        if seen_pages:
+            # After reading the whole list, forget pages past its end in case the account shrank
+            if from_start:
+                pages = {page: entry for page, entry in pages.items() if page in seen_pages}
+            checkpoint.page_digests = json.dumps(pages)
+            checkpoint.domain_count = sum(count for _, count in pages.values())
+            checkpoint.last_completed = timezone.now()
+            checkpoint.save()
+        metrics.registrar_sync_domains.inc(created, provider=provider.name, result='created')
+        metrics.registrar_sync_domains.inc(updated, provider=provider.name, result='updated')
+        metrics.registrar_sync_domains.inc(unchanged, provider=provider.name, result='unchanged')
+        summary.append('{}: {} domains read, {} created, {} updated, {} on unchanged pages'.format(
+            provider.name, read, created, updated, unchanged))
+    if not summary:
+        return 'No registrar accounts are enabled in REGISTRAR_CONFIG'
+    return '; '.join(summary)